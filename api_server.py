@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice HTTP 接口
+与 Gradio 界面运行在同一进程，共享已加载的模型和请求合并调度器：
+    POST /api/transcribe    上传单个音频文件识别；?pipeline=auto/asr/vad_asr/full 选择识别流程（/api/jobs 同），
+                            ?format=json 返回分段结构化结果，srt/vtt/jsonl 返回字幕；
+                            ?model=small/medium 指定正在服务的模型（切换模型后旧模型在内存充足时继续服务）
+    POST /api/jobs          提交后台任务（每个文件一个任务，短音频优先），返回任务组 ID；
+                            GET /api/jobs/{job_id} 按任务或任务组 ID 查询进度和结果（单个任务可加 ?format=srt/vtt/jsonl），
+                            DELETE 取消排队中的任务
+    WS   /api/stream        推送麦克风 PCM（16bit 小端），返回中间/最终识别结果
+    GET  /api/models        正在服务的模型；POST /api/models?name=medium 在后台加载并切换默认模型
+    GET  /api/health        服务状态
+    GET  /api/ready         就绪检查：模型可用时返回 200，否则 503
+    GET  /metrics           Prometheus 格式的分阶段耗时等指标
+"""
+
+import os
+import sys
+import uuid
+import logging
+import asyncio
+import tempfile
+import threading
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from fastapi import FastAPI, File, HTTPException, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, Response
+
+import webui
+from metrics import render_all
+from readiness import readiness, start_background_imports
+from cpu_tuning import configure_from_env
+from job_queue import FINAL_STATES, QueueFull
+from model_registry import DEFAULT_MODEL_DIR, MODEL_MAP, PIPELINES
+from transcript import FORMATS, format_segments
+
+
+# 推理线程数
+API_WORKERS = int(os.environ.get("SENSEVOICE_API_WORKERS", "4"))
+
+# 最多排队的文件数，超出返回 429
+API_MAX_QUEUE = int(os.environ.get("SENSEVOICE_API_MAX_QUEUE", "32"))
+
+# 最多同时进行的流式识别连接数
+API_MAX_STREAMS = int(os.environ.get("SENSEVOICE_API_MAX_STREAMS", "8"))
+
+# 上传文件读取块大小
+UPLOAD_CHUNK = 1024 * 1024
+
+
+class InferenceGate:
+    """有界推理执行器：推理在线程池中运行，不阻塞事件循环；排队数超出上限时拒绝新请求"""
+
+    def __init__(self, workers=API_WORKERS, max_queue=API_MAX_QUEUE):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        self.max_queue = max_queue
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, n=1):
+        """预留 n 个排队位置，不足时返回 False"""
+        with self._lock:
+            if self.pending + n > self.max_queue:
+                return False
+            self.pending += n
+            return True
+
+    def release(self, n=1):
+        with self._lock:
+            self.pending -= n
+
+    async def run(self, fn, *args):
+        """在执行器中运行 fn，完成后释放一个排队位置（调用前需先 reserve）"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.release()
+
+
+def ensure_model():
+    """等待后台预加载完成；没有预加载时加载默认本地模型"""
+    if not webui.wait_for_model():
+        status = webui.load_model(DEFAULT_MODEL_DIR, "small")
+        if webui.model_key is None:
+            raise HTTPException(status_code=503, detail=status)
+
+
+async def save_upload(upload):
+    """把上传文件分块写入临时文件，返回路径（调用方负责删除）"""
+    suffix = os.path.splitext(upload.filename or "")[1] or ".wav"
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK)
+            if not chunk:
+                break
+            tmp.write(chunk)
+    finally:
+        tmp.close()
+    return tmp.name
+
+
+# 字幕格式的响应类型
+SUBTITLE_MEDIA_TYPES = {
+    "srt": "application/x-subrip; charset=utf-8",
+    "vtt": "text/vtt; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+
+def _transcribe_and_cleanup(path, profile=None, pipeline=None, fmt=None, model=None):
+    try:
+        if fmt:
+            # 结构化结果 / 字幕：按 VAD 分段识别一次，得到各段起止时间和标签
+            return webui.transcribe_structured(path, pipeline, model=model)
+        return webui.transcribe_path(path, profile, pipeline=pipeline, model=model)
+    finally:
+        os.remove(path)
+
+
+def check_model(model):
+    """校验 model 参数：必须是正在服务的模型"""
+    if model and model not in webui.served_models()["served"]:
+        raise HTTPException(status_code=404, detail=f"模型未在服务: {model}")
+
+
+def check_format(fmt):
+    """校验 format 参数：json 或字幕格式"""
+    if fmt and fmt != "json" and fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的输出格式: {fmt}，可选: json, {', '.join(FORMATS)}")
+
+
+def subtitle_response(result, fmt):
+    """按 format 参数返回结构化结果或字幕文本"""
+    if fmt in FORMATS:
+        return Response(format_segments(result.get("segments") or [], fmt), media_type=SUBTITLE_MEDIA_TYPES[fmt])
+    return result
+
+
+def check_pipeline(pipeline):
+    """校验请求参数中的流水线名称"""
+    if pipeline and pipeline != "auto" and pipeline not in PIPELINES:
+        raise HTTPException(status_code=400,
+                            detail=f"不支持的流水线: {pipeline}，可选: auto, {', '.join(PIPELINES)}")
+
+
+def create_app(gate=None):
+    """创建 FastAPI 应用"""
+    app = FastAPI(title="SenseVoice API")
+    gate = gate or InferenceGate()
+    streams = {"active": 0}
+
+    @app.get("/api/health")
+    async def health():
+        return {
+            "model_loaded": webui.model_key is not None,
+            "model": webui.model_key.model if webui.model_key else None,
+            "queue_depth": gate.pending,
+            "max_queue": gate.max_queue,
+            "active_streams": streams["active"],
+            "readiness": readiness.snapshot(),
+            "models": webui.served_models(),
+        }
+
+    @app.get("/api/ready")
+    async def ready():
+        snapshot = readiness.snapshot()
+        if not readiness.is_ready:
+            raise HTTPException(status_code=503, detail=snapshot)
+        return snapshot
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        return render_all()
+
+    @app.post("/api/transcribe")
+    async def transcribe(file: UploadFile = File(...), profile: str = None, pipeline: str = None,
+                         format: str = None, model: str = None):
+        check_pipeline(pipeline)
+        check_format(format)
+        if not gate.reserve():
+            raise HTTPException(status_code=429, detail="服务繁忙，请稍后重试")
+        try:
+            await asyncio.get_running_loop().run_in_executor(gate.executor, ensure_model)
+            check_model(model)
+            path = await save_upload(file)
+        except BaseException:
+            gate.release()
+            raise
+        try:
+            # profile=cprofile / torch 时对本次请求做性能剖析
+            result = await gate.run(_transcribe_and_cleanup, path, profile, pipeline, format, model)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"识别错误: {str(e)}")
+        if not result:
+            raise HTTPException(status_code=500, detail="识别失败，未返回结果")
+        return subtitle_response(result, format)
+
+    @app.get("/api/models")
+    async def models():
+        return webui.served_models()
+
+    @app.post("/api/models", status_code=202)
+    async def switch_model(name: str, backend: str = None):
+        if name not in MODEL_MAP:
+            raise HTTPException(status_code=400, detail=f"不支持的模型名称: {name}，可选: {', '.join(MODEL_MAP)}")
+        # 本地已下载时使用 ./models 下的目录，否则从 ModelScope 下载
+        model_dir = os.path.join(os.path.dirname(DEFAULT_MODEL_DIR), os.path.basename(MODEL_MAP[name]))
+        return {"message": webui.switch_model(model_dir, name, backend), "models": webui.served_models()}
+
+    @app.post("/api/jobs", status_code=202)
+    async def submit_job(files: List[UploadFile] = File(...), pipeline: str = None, model: str = None):
+        check_pipeline(pipeline)
+        check_model(model)
+        queue = webui.get_jobs()
+        group_id = uuid.uuid4().hex
+        job_ids = []
+        try:
+            for upload in files:
+                path = await save_upload(upload)
+                # 上传文件移入任务目录，服务重启后继续处理
+                job_ids.append(queue.submit(path, filename=upload.filename, group_id=group_id, move=True,
+                                            options={"pipeline": pipeline, "model": model}))
+        except QueueFull as e:
+            if os.path.exists(path):
+                os.remove(path)
+            for job_id in job_ids:
+                queue.cancel(job_id)
+            raise HTTPException(status_code=429, detail=str(e))
+        return {"job_id": group_id, "total": len(job_ids), "jobs": job_ids}
+
+    @app.get("/api/jobs/{job_id}")
+    async def get_job(job_id: str, format: str = None):
+        check_format(format)
+        queue = webui.get_jobs()
+        job = queue.get(job_id)
+        if job is not None:
+            job.pop("path", None)
+            if format in FORMATS:
+                if job["status"] != "finished":
+                    raise HTTPException(status_code=409, detail="任务尚未完成")
+                return subtitle_response(job["result"], format)
+            return job
+        members = queue.group(job_id)
+        if not members:
+            raise HTTPException(status_code=404, detail="任务不存在")
+        results = []
+        for member in members:
+            record = {"job_id": member["job_id"], "filename": member["filename"], "status": member["status"],
+                      "done": member["done"], "total": member["total"]}
+            if member["status"] == "finished":
+                record["text"] = member["result"].get("text", "")
+            elif member["error"]:
+                record["error"] = member["error"]
+            results.append(record)
+        finished = sum(1 for m in members if m["status"] in FINAL_STATES)
+        return {
+            "job_id": job_id,
+            "status": "finished" if finished == len(members) else "running",
+            "total": len(members),
+            "done": finished,
+            "results": results,
+        }
+
+    @app.delete("/api/jobs/{job_id}")
+    async def cancel_job(job_id: str):
+        if not webui.get_jobs().cancel(job_id):
+            raise HTTPException(status_code=409, detail="任务不存在或已开始执行")
+        return {"job_id": job_id, "status": "cancelled"}
+
+    @app.websocket("/api/stream")
+    async def stream(ws: WebSocket):
+        await ws.accept()
+        if streams["active"] >= API_MAX_STREAMS:
+            # 1013: Try Again Later
+            await ws.close(code=1013, reason="too many streams")
+            return
+        streams["active"] += 1
+        loop = asyncio.get_running_loop()
+        sample_rate = int(ws.query_params.get("sample_rate", "16000"))
+        session = None
+        try:
+            await loop.run_in_executor(gate.executor, ensure_model)
+            session = await loop.run_in_executor(gate.executor, webui.open_stream)
+
+            def feed(data):
+                pcm = np.frombuffer(data, dtype="<i2")
+                return list(session.feed(sample_rate, pcm))
+
+            def finish():
+                return list(session.finish())
+
+            while True:
+                message = await ws.receive()
+                if message.get("type") == "websocket.disconnect":
+                    return
+                if message.get("bytes"):
+                    events = await loop.run_in_executor(gate.executor, feed, message["bytes"])
+                elif message.get("text") == "end":
+                    for event in await loop.run_in_executor(gate.executor, finish):
+                        await ws.send_json(event)
+                    await ws.send_json({"type": "done", "text": session.text(),
+                                        "latency": session.latency_stats()})
+                    await ws.close()
+                    return
+                else:
+                    continue
+                for event in events:
+                    await ws.send_json(event)
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            await ws.send_json({"type": "error", "error": f"识别错误: {detail}"})
+            await ws.close(code=1011)
+        finally:
+            if session is not None:
+                # 归还模型引用，切换后下线的旧模型在最后一路流结束后释放
+                session.close()
+            streams["active"] -= 1
+
+    return app
+
+
+def main():
+    """同时启动 Gradio 界面（/）和 HTTP 接口（/api）"""
+    import gradio as gr
+    import uvicorn
+
+    os.environ["GRADIO_ANALYTICS_ENABLED"] = "False"
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    host = os.environ.get("SENSEVOICE_HOST", "127.0.0.1")
+    port = int(os.environ.get("SENSEVOICE_PORT", "7860"))
+
+    print("=" * 50)
+    print("启动 SenseVoice Web UI + HTTP 接口...")
+    print("=" * 50)
+    cpu = configure_from_env()
+    print(f"CPU 核心: {cpu['cpus']}  intra-op 线程: {cpu['intra_threads']}  绑定核心: {'是' if cpu['pinned'] else '否'}")
+    start_background_imports()
+    if webui.preload_enabled():
+        webui.start_preload()
+    webui.get_jobs()
+    try:
+        demo = webui.configure_queue(webui.create_interface())
+        app = gr.mount_gradio_app(create_app(), demo, path="/")
+        print(f"界面地址: http://{host}:{port}")
+        print(f"接口地址: http://{host}:{port}/api (文档: /docs)")
+        print("=" * 50)
+        uvicorn.run(app, host=host, port=port)
+    except Exception as e:
+        print(f"启动失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+音频处理工具
+把 Gradio、文件、HTTP 等来源的音频统一转换成模型可直接使用的 16kHz float32 单声道波形：
+dtype 转换、声道下混、重采样（按采样率比例缓存滤波器）、响度归一化，均为整段向量化运算
+"""
+
+import os
+import math
+from math import gcd
+from functools import lru_cache
+
+import numpy as np
+
+from metrics import span
+
+
+# SenseVoice / fsmn-vad 的输入采样率
+MODEL_SAMPLE_RATE = 16000
+
+# 整段音频的响度归一化目标（dBFS），未设置时不归一化
+NORMALIZE_DBFS = float(os.environ["SENSEVOICE_NORMALIZE_DBFS"]) if os.environ.get("SENSEVOICE_NORMALIZE_DBFS") else None
+
+# 响度归一化的最大增益（dB），避免把底噪放大成"语音"
+MAX_GAIN_DB = 20.0
+
+
+def _int_scale(dtype):
+    """整数 PCM 映射到 [-1, 1] 的 (偏移, 系数)；浮点类型返回 None"""
+    if not np.issubdtype(dtype, np.integer):
+        return None
+    info = np.iinfo(dtype)
+    if info.min == 0:
+        # 无符号 PCM（如 8bit）以中点为零
+        offset = (info.max + 1) / 2.0
+        return offset, 1.0 / offset
+    return 0.0, 1.0 / float(-info.min)
+
+
+def to_float32(data):
+    """整数 PCM 转为 [-1, 1] 范围的 float32；已是 float32 时不复制"""
+    data = np.asarray(data)
+    if data.dtype == np.float32:
+        return data
+    scale = _int_scale(data.dtype)
+    audio = data.astype(np.float32)
+    if scale is not None:
+        offset, factor = scale
+        if offset:
+            audio -= offset
+        audio *= factor
+    return audio
+
+
+def _channel_axis(data, channels_last=None):
+    """
+    声道所在的轴
+
+    channels_last 为 True 表示 (samples, channels)，False 表示 (channels, samples)；
+    为 None（来源布局未知，如 Gradio 输入）时按声道数远小于采样点数推断
+    """
+    if channels_last is not None:
+        return 1 if channels_last else 0
+    return 0 if data.shape[0] < data.shape[1] else 1
+
+
+def to_mono(data, channels_last=None):
+    """多声道取平均；channels_last 见 _channel_axis"""
+    if data.ndim == 1:
+        return data
+    if data.ndim != 2:
+        data = data.reshape(data.shape[0], -1)
+    channel_axis = _channel_axis(data, channels_last)
+    if data.shape[channel_axis] == 1:
+        return data.reshape(-1)
+    return data.mean(axis=channel_axis, dtype=np.float32)
+
+
+def to_mono_float32(data, channels_last=None):
+    """
+    下混为单声道并转为 [-1, 1] 的 float32
+
+    整数多声道音频先以 float32 累加求均值再原地缩放，不生成多声道的 float32 副本；
+    单声道 float32 输入原样返回。channels_last 见 _channel_axis
+    """
+    data = np.asarray(data)
+    if data.ndim != 1:
+        if data.ndim != 2:
+            data = data.reshape(data.shape[0], -1)
+        channel_axis = _channel_axis(data, channels_last)
+        if data.shape[channel_axis] == 1:
+            data = data.reshape(-1)
+        else:
+            mono = data.mean(axis=channel_axis, dtype=np.float32)
+            scale = _int_scale(data.dtype)
+            if scale is not None:
+                offset, factor = scale
+                if offset:
+                    mono -= offset
+                mono *= factor
+            return mono
+    return to_float32(data)
+
+
+def resample_ratio(orig_sr, target_sr=MODEL_SAMPLE_RATE):
+    """采样率换算的最简整数比 (up, down)"""
+    g = gcd(int(orig_sr), int(target_sr))
+    return int(target_sr) // g, int(orig_sr) // g
+
+
+@lru_cache(maxsize=32)
+def resample_kernel(up, down):
+    """
+    多相重采样的抗混叠 FIR 滤波器，按 (up, down) 缓存
+
+    与 scipy.signal.resample_poly 默认设计相同（Kaiser 窗，beta=5），
+    44.1kHz → 16kHz 这类比例的滤波器有上万阶，每次调用都重新设计的开销不可忽略
+    """
+    from scipy.signal import firwin
+    max_rate = max(up, down)
+    kernel = firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+    kernel.setflags(write=False)
+    return kernel
+
+
+def resample(data, orig_sr, target_sr=MODEL_SAMPLE_RATE):
+    """重采样到目标采样率"""
+    if orig_sr == target_sr or len(data) == 0:
+        return data
+    up, down = resample_ratio(orig_sr, target_sr)
+    try:
+        from scipy.signal import resample_poly
+    except ImportError:
+        # 没有 scipy 时退化为线性插值
+        n = int(round(len(data) * float(target_sr) / orig_sr))
+        x = np.linspace(0, len(data) - 1, n, dtype=np.float64)
+        return np.interp(x, np.arange(len(data)), data).astype(np.float32)
+    out = resample_poly(data, up, down, window=resample_kernel(up, down))
+    return out.astype(np.float32, copy=False)
+
+
+def normalize_loudness(audio, target_dbfs=-20.0, max_gain_db=MAX_GAIN_DB):
+    """
+    按 RMS 把整段音频调整到目标响度，原地修改并返回
+
+    增益不超过 max_gain_db，且峰值不超过 0.99；近乎静音的音频不处理
+    """
+    if len(audio) == 0:
+        return audio
+    # dot 一次遍历求平方和，不生成临时数组
+    rms = math.sqrt(float(np.dot(audio, audio)) / len(audio))
+    if rms < 1e-5:
+        return audio
+    gain = min(10 ** ((target_dbfs - 20 * math.log10(rms)) / 20.0), 10 ** (max_gain_db / 20.0))
+    peak = max(float(audio.max()), -float(audio.min()))
+    if peak * gain > 0.99:
+        gain = 0.99 / peak
+    if abs(gain - 1.0) > 1e-3:
+        audio *= np.float32(gain)
+    return audio
+
+
+def to_model_input(sample_rate, data, normalize=None, channels_last=None):
+    """
+    转换为模型输入：dtype 转换与声道下混 → 重采样 → 响度归一化（可选）
+
+    Args:
+        sample_rate: 原始采样率
+        data: 音频数据（list 或 ndarray，任意整数/浮点类型，单声道或多声道）
+        normalize: 响度归一化目标 dBFS；None 时取环境变量 SENSEVOICE_NORMALIZE_DBFS，False 表示不归一化。
+                   增益随输入变化，流式分块输入应传 False
+        channels_last: 多声道布局，True 为 (samples, channels)，False 为 (channels, samples)，None 时自动推断
+
+    Returns:
+        16kHz float32 单声道 ndarray，可直接传给 model.generate
+    """
+    audio = to_mono_float32(data, channels_last)
+    if sample_rate != MODEL_SAMPLE_RATE:
+        with span("resample"):
+            audio = resample(audio, sample_rate, MODEL_SAMPLE_RATE)
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+
+    target = NORMALIZE_DBFS if normalize is None else normalize
+    if target is not False and target is not None:
+        if isinstance(data, np.ndarray) and np.may_share_memory(audio, data):
+            # 不修改调用方的数组
+            audio = audio.copy()
+        normalize_loudness(audio, float(target))
+    return audio
+
+
+def load_audio(path):
+    """
+    读取音频文件并转换为模型输入
+
+    Args:
+        path: 音频文件路径（wav/flac 等由 soundfile 读取，mp3/m4a 等回退到 librosa）
+
+    Returns:
+        16kHz float32 单声道 ndarray
+    """
+    try:
+        import soundfile as sf
+        with span("audio_load"):
+            data, sample_rate = sf.read(path, dtype="float32", always_2d=False)
+        # soundfile 输出 (frames, channels)
+        channels_last = True
+    except Exception:
+        import librosa
+        # 只用 librosa 解码，下混和重采样与其他来源走同一套处理
+        with span("audio_load"):
+            data, sample_rate = librosa.load(path, sr=None, mono=False)
+        # librosa 输出 (channels, frames)
+        channels_last = False
+    return to_model_input(sample_rate, data, channels_last=channels_last)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 推理后端
+    torch: funasr AutoModel，fp32 PyTorch（默认）
+    int8:  对识别模型的 Linear 层做动态 INT8 量化，仅支持 CPU
+    onnx:  导出为 ONNX 后用 ONNX Runtime 推理识别模型（需要 funasr-onnx、onnxruntime），VAD/标点仍用 PyTorch
+"""
+
+import os
+
+import numpy as np
+
+from audio_utils import MODEL_SAMPLE_RATE, load_audio
+from metrics import span
+
+
+BACKENDS = ("torch", "int8", "onnx")
+
+# 默认推理后端
+DEFAULT_BACKEND = os.environ.get("SENSEVOICE_BACKEND", "torch")
+
+# ONNX 后端按 VAD 切分的最长语音段（毫秒）
+ONNX_MAX_SEGMENT_MS = 30000
+
+# ONNX 后端单次推理的最大段数
+ONNX_BATCH_SIZE = 8
+
+
+def check_backend(backend, device="cpu"):
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}，可选: {', '.join(BACKENDS)}")
+    if backend in ("int8", "onnx") and device != "cpu":
+        raise ValueError(f"{backend} 后端仅支持 CPU")
+
+
+def add_backend_argument(parser):
+    """命令行 --backend 参数"""
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default=DEFAULT_BACKEND,
+        choices=BACKENDS,
+        help=f"推理后端：torch（fp32）、int8（动态量化）、onnx（ONNX Runtime） (默认: {DEFAULT_BACKEND})"
+    )
+
+
+def build_model(key):
+    """按注册表键构建模型，返回带 generate(input=...) 方法的对象"""
+    backend = getattr(key, "backend", "torch") or "torch"
+    check_backend(backend, key.device)
+    if backend == "onnx":
+        return OnnxSenseVoice(key.model, key.vad_model, key.punc_model, key.device)
+
+    from funasr import AutoModel
+    from cpu_tuning import apply_torch_threads
+    # torch 随 funasr 首次导入，此时再应用启动时请求的线程数（inter-op 只能在推理前设置）
+    apply_torch_threads()
+    model = AutoModel(
+        model=key.model,
+        device=key.device,
+        vad_model=key.vad_model,
+        punc_model=key.punc_model,
+    )
+    if backend == "int8":
+        quantize_int8(model)
+    return model
+
+
+def quantize_int8(auto_model):
+    """把识别模型的 Linear 层替换为动态 INT8 量化版本（权重 int8，激活在运行时量化）"""
+    import torch
+    auto_model.model = torch.quantization.quantize_dynamic(
+        auto_model.model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+    return auto_model
+
+
+def share_weights(model):
+    """
+    把模型各子模型（识别 / VAD / 标点）的参数和缓冲区移到共享内存，返回共享的字节数
+
+    在父进程加载后调用，之后 fork 出的工作进程与父进程共用同一份权重的物理内存；
+    普通的写时复制在子进程改动对象头、垃圾回收扫描时可能复制所在页，共享内存的页不会被复制。
+    ONNX Runtime 会话和 int8 量化后的打包权重无法移动，仍按写时复制共享
+    """
+    total = 0
+    if isinstance(model, OnnxSenseVoice):
+        return sum(share_weights(sub) for sub in (model.vad, model.punc) if sub is not None)
+    for attr in ("model", "vad_model", "punc_model", "spk_model"):
+        module = getattr(model, attr, None)
+        if module is None or not hasattr(module, "share_memory"):
+            continue
+        module.share_memory()
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def export_onnx(model_dir, quantize=False):
+    """把本地模型导出为 ONNX（已存在时跳过），返回 ONNX 文件路径"""
+    filename = "model_quant.onnx" if quantize else "model.onnx"
+    path = os.path.join(model_dir, filename)
+    if os.path.exists(path):
+        return path
+    from funasr import AutoModel
+    print(f"正在导出 ONNX 模型: {model_dir}")
+    AutoModel(model=model_dir, device="cpu", disable_update=True).export(type="onnx", quantize=quantize)
+    if not os.path.exists(path):
+        raise RuntimeError(f"ONNX 导出失败，未找到: {path}")
+    return path
+
+
+class OnnxSenseVoice:
+    """
+    ONNX Runtime 识别 + PyTorch VAD/标点，generate 的输入输出与 funasr AutoModel 一致
+
+    Args:
+        model: 本地模型目录或 ModelScope 模型 ID
+        vad_model / punc_model: 为 None 时不分段 / 不加标点
+        device: 仅支持 "cpu"
+    """
+
+    def __init__(self, model, vad_model=None, punc_model=None, device="cpu"):
+        try:
+            from funasr_onnx import SenseVoiceSmall
+        except ImportError:
+            raise ImportError("onnx 后端需要安装 funasr-onnx 和 onnxruntime: pip install funasr-onnx onnxruntime")
+        from funasr import AutoModel
+
+        if os.path.isdir(model):
+            export_onnx(model)
+        from cpu_tuning import intra_threads
+        self.asr = SenseVoiceSmall(model, batch_size=ONNX_BATCH_SIZE, quantize=False,
+                                   intra_op_num_threads=intra_threads())
+        self.vad = None
+        if vad_model:
+            self.vad = AutoModel(model=vad_model, device=device, max_single_segment_time=ONNX_MAX_SEGMENT_MS)
+        self.punc = AutoModel(model=punc_model, device=device) if punc_model else None
+
+    def _segments(self, pcm):
+        """按 VAD 切分，返回各语音段波形"""
+        if self.vad is None:
+            return [pcm]
+        with span("vad"):
+            res = self.vad.generate(input=pcm)
+        segments = res[0].get("value", []) if res else []
+        rate = MODEL_SAMPLE_RATE // 1000
+        return [pcm[beg * rate:end * rate] for beg, end in segments if end > beg]
+
+    def generate(self, input, language="auto", use_itn=True, **kwargs):
+        items = input if isinstance(input, list) else [input]
+        results = []
+        for i, item in enumerate(items):
+            pcm = load_audio(item) if isinstance(item, str) else np.asarray(item, dtype=np.float32)
+            pieces = self._segments(pcm)
+            texts = []
+            with span("asr"):
+                for piece in pieces:
+                    # funasr_onnx 把列表输入当作文件路径逐个读取，波形只能一段一段传入
+                    texts.extend(self.asr(piece, language=language, textnorm="withitn" if use_itn else "woitn"))
+            text = "".join(texts)
+            if self.punc is not None and text:
+                with span("punc"):
+                    res = self.punc.generate(input=text)
+                if res:
+                    text = res[0].get("text", text)
+            results.append({"key": f"onnx_{i}", "text": text})
+        return results
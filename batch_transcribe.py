@@ -0,0 +1,460 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 批量转录
+支持目录、通配符和清单文件输入，多进程并行识别，结果逐条写入 JSONL/CSV，可断点续跑
+"""
+
+import os
+import csv
+import glob
+import json
+import time
+import argparse
+import multiprocessing
+
+
+# 默认识别的音频扩展名
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".aac", ".wma", ".amr", ".pcm")
+
+CSV_FIELDS = ["audio_path", "status", "text", "error", "elapsed", "cached", "peak_rss_mb"]
+
+# 工作进程内的模型键和流水线（模型池按流水线在首次用到时加载，每个进程一份）
+_worker_key = None
+_worker_pipeline = None
+
+
+def collect_inputs(inputs=None, manifest=None, extensions=AUDIO_EXTENSIONS):
+    """
+    收集待识别的音频文件
+
+    Args:
+        inputs: 文件、目录或通配符列表，目录会递归查找
+        manifest: 清单文件路径，每行一个音频路径（# 开头为注释）
+        extensions: 目录扫描时匹配的扩展名
+
+    Returns:
+        去重后的音频路径列表（保持输入顺序）
+    """
+    paths = []
+    for item in inputs or []:
+        if os.path.isdir(item):
+            found = []
+            for root, _, files in os.walk(item):
+                for name in files:
+                    if name.lower().endswith(extensions):
+                        found.append(os.path.join(root, name))
+            paths.extend(sorted(found))
+        elif glob.has_magic(item):
+            paths.extend(sorted(glob.glob(item, recursive=True)))
+        else:
+            paths.append(item)
+
+    if manifest:
+        with open(manifest, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    paths.append(line)
+
+    seen = set()
+    result = []
+    for path in paths:
+        path = os.path.normpath(path)
+        if path not in seen:
+            seen.add(path)
+            result.append(path)
+    return result
+
+
+def detect_format(output_path, fmt=None):
+    """根据参数或扩展名确定输出格式"""
+    if fmt:
+        return fmt
+    return "csv" if output_path.lower().endswith(".csv") else "jsonl"
+
+
+def load_finished(output_path, fmt):
+    """读取已有结果，返回已成功识别的音频路径集合"""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+
+    with open(output_path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = []
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    # 崩溃时可能留下不完整的最后一行
+                    continue
+        for row in rows:
+            if row.get("status") == "ok" and row.get("audio_path"):
+                finished.add(os.path.normpath(row["audio_path"]))
+    return finished
+
+
+class ResultWriter:
+    """逐条追加写入结果，每条写完立即落盘"""
+
+    def __init__(self, output_path, fmt):
+        self.fmt = fmt
+        exists = os.path.exists(output_path) and os.path.getsize(output_path) > 0
+        # 上次崩溃可能留下没有换行的半行，先补一个换行
+        if exists:
+            with open(output_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        self.file = open(output_path, "a", encoding="utf-8", newline="")
+        if exists and needs_newline:
+            self.file.write("\n")
+        if fmt == "csv":
+            self.writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS)
+            if not exists:
+                self.writer.writeheader()
+
+    def write(self, record):
+        if self.fmt == "csv":
+            self.writer.writerow({k: record.get(k, "") for k in CSV_FIELDS})
+        else:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+def _init_worker(model_dir, model_name, device, backend=None, cpu=None, pipeline=None):
+    """
+    工作进程初始化：分配核心与线程数，确定模型配置
+
+    cpu 为 (序号计数器, 进程数, intra-op 线程数, inter-op 线程数, 是否绑定核心)，需在导入 torch 之前设置；
+    pipeline 为识别流程，各流程用到的模型在首次识别时才加载
+    """
+    global _worker_key, _worker_pipeline
+    if cpu is not None:
+        from cpu_tuning import configure_worker
+        counter, workers, threads, inter_threads, pin = cpu
+        index = 0
+        if counter is not None:
+            with counter.get_lock():
+                index = counter.value
+                counter.value += 1
+        configure_worker(index, workers, threads, inter_threads, pin)
+    from model_registry import make_key, select_pipeline
+    select_pipeline(pipeline)
+    _worker_key = make_key(model_dir, model_name, device=device, backend=backend)
+    _worker_pipeline = pipeline
+
+
+def preload_shared(model_dir, model_name, device, backend=None, pipeline=None, paths=()):
+    """
+    在父进程中加载批量识别会用到的全部模型并把权重移到共享内存，fork 出的工作进程直接复用，不再各自加载
+
+    包括所选流程的识别组合（auto 流程为 asr 和 full 两个组合）；paths 中有需要分块读取的大文件时，
+    还包括 long_audio.transcribe_file 单独使用的 VAD、标点和分段识别模型池。
+    这些模型先在注册表中固定再加载，工作进程继承固定状态，LRU 淘汰不会把共享的模型换成各自加载的副本。
+    加载后不做推理，避免 fork 前启动 torch 线程池
+    """
+    from backends import share_weights
+    from chunked_reader import should_stream
+    from model_registry import DEFAULT_PIPELINE, ModelKey, asr_only, get_registry, make_key, pipeline_key
+
+    pipeline = pipeline or DEFAULT_PIPELINE
+    key = make_key(model_dir, model_name, device=device, backend=backend)
+    registry = get_registry()
+    keys = [pipeline_key(key, name)[0] for name in (("asr", "full") if pipeline == "auto" else (pipeline,))]
+    streaming = any(should_stream(path) for path in paths)
+    if streaming:
+        # 分块识别总是先做 VAD，按流程决定是否加标点（auto 流程不知道时长，按完整流程）
+        stream_key = pipeline_key(key, pipeline)[0]
+        keys.append(ModelKey("fsmn-vad", None, None, device))
+        if stream_key.punc_model:
+            keys.append(ModelKey(stream_key.punc_model, None, None, device))
+    for k in keys:
+        registry.pin(k)
+    models = [model for k in keys for model in registry.get_pool(k).replicas]
+    if streaming:
+        models += registry.get_decode_pool(asr_only(key), 1).replicas
+    shared = sum(share_weights(model) for model in models)
+    print(f"父进程已加载 {len(models)} 个模型，共享权重 {shared / 1024 / 1024:.1f} MB")
+
+
+def _transcribe_one(audio_path):
+    """在工作进程中识别单个文件"""
+    from audio_utils import MODEL_SAMPLE_RATE, load_audio
+    from chunked_reader import should_stream
+    from long_audio import transcribe_file
+    from memory_stats import peak_rss_mb, reset_peak_rss
+    from model_registry import get_registry, pipeline_key
+    from result_cache import get_cache
+    from silence_gate import gate
+
+    reset_peak_rss()
+    start = time.perf_counter()
+    record = {"audio_path": audio_path, "status": "ok", "text": "", "error": "", "cached": False}
+    try:
+        if not os.path.exists(audio_path):
+            raise FileNotFoundError(f"音频文件不存在: {audio_path}")
+
+        cache = get_cache()
+        if should_stream(audio_path):
+            # 大文件分块读取识别，不一次性解码到内存
+            key, generate_kwargs = pipeline_key(_worker_key, _worker_pipeline)
+            result = transcribe_file(audio_path, key, workers=1, generate_kwargs=generate_kwargs)
+        else:
+            # 整段静音不送入模型，首尾长静音裁掉后再识别
+            pcm, _, silence = gate(load_audio(audio_path))
+            if silence is not None:
+                record["silence_ratio"] = silence["skipped_ratio"]
+                if silence["empty"]:
+                    record["elapsed"] = round(time.perf_counter() - start, 3)
+                    record["peak_rss_mb"] = peak_rss_mb()
+                    return record
+            key, generate_kwargs = pipeline_key(_worker_key, _worker_pipeline, len(pcm) / float(MODEL_SAMPLE_RATE))
+
+            def run(pcm):
+                with get_registry().get_pool(key).acquire() as model:
+                    result = model.generate(input=pcm, **generate_kwargs)
+                return result[0] if result else None
+
+            if cache is not None:
+                hits = cache.hits
+                result = cache.get_or_compute(pcm, key, run, **generate_kwargs)
+                record["cached"] = cache.hits > hits
+            else:
+                result = run(pcm)
+        if result:
+            record["text"] = result.get("text", "")
+        else:
+            record["status"] = "error"
+            record["error"] = "识别失败，未返回结果"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    record["elapsed"] = round(time.perf_counter() - start, 3)
+    record["peak_rss_mb"] = peak_rss_mb()
+    return record
+
+
+def run_batch(inputs=None, manifest=None, output="results.jsonl", fmt=None,
+              workers=1, model_dir=None, model_name="small", device="cpu",
+              resume=True, cache_db=None, backend=None,
+              threads=None, inter_threads=None, pin_cpus=False, pipeline=None, share_weights=False):
+    """
+    批量转录
+
+    Args:
+        inputs: 文件、目录或通配符列表
+        manifest: 清单文件路径
+        output: 结果文件路径（.jsonl 或 .csv）
+        fmt: 输出格式 "jsonl" / "csv"，默认按扩展名判断
+        workers: 工作进程数，每个进程持有一份模型（share_weights 时共用父进程的一份）
+        model_dir: 本地模型目录
+        model_name: 模型名称
+        device: 推理设备
+        resume: 是否跳过结果文件中已成功的条目
+        cache_db: 结果缓存 SQLite 文件路径
+        backend: 推理后端 "torch" / "int8" / "onnx"，默认取环境变量 SENSEVOICE_BACKEND
+        threads: 每个进程的 intra-op 线程数，默认为 可用核心数/进程数
+        inter_threads: 每个进程的 inter-op 线程数
+        pin_cpus: 是否把各进程绑定到互不重叠的核心上
+        pipeline: 识别流程 "auto" / "asr" / "vad_asr" / "full"，默认取环境变量 SENSEVOICE_PIPELINE
+        share_weights: 父进程加载模型后 fork 出工作进程，各进程共享同一份权重（需要支持 fork 的平台），
+                       结束时打印各进程的独占 / 共享内存
+
+    Returns:
+        (成功数, 失败数, 跳过数)
+    """
+    fmt = detect_format(output, fmt)
+    if cache_db:
+        # 通过环境变量传给 spawn 出来的工作进程
+        os.environ["SENSEVOICE_CACHE_DB"] = cache_db
+    paths = collect_inputs(inputs, manifest)
+    finished = load_finished(output, fmt) if resume else set()
+    pending = [p for p in paths if p not in finished]
+    skipped = len(paths) - len(pending)
+
+    print(f"共 {len(paths)} 个文件，已完成 {skipped} 个，待处理 {len(pending)} 个")
+    if not pending:
+        return 0, 0, skipped
+
+    ok = failed = cached = 0
+    start = time.perf_counter()
+    writer = ResultWriter(output, fmt)
+    try:
+        if workers <= 1:
+            cpu = (None, 1, threads, inter_threads, pin_cpus) if threads or inter_threads or pin_cpus else None
+            _init_worker(model_dir, model_name, device, backend, cpu, pipeline)
+            results = map(_transcribe_one, pending)
+            pool = None
+        else:
+            if share_weights and "fork" not in multiprocessing.get_all_start_methods():
+                print("当前平台不支持 fork，各工作进程将分别加载模型")
+                share_weights = False
+            if share_weights:
+                # 父进程只加载不推理，fork 前没有启动 torch 线程池，子进程内可安全设置线程数
+                preload_shared(model_dir, model_name, device, backend, pipeline, pending)
+                ctx = multiprocessing.get_context("fork")
+            else:
+                # spawn 避免 fork 后 torch 线程状态异常
+                ctx = multiprocessing.get_context("spawn")
+            # 每个进程按序号分到自己的核心，避免多个 torch 实例争抢全部核心
+            cpu = (ctx.Value("i", 0), workers, threads, inter_threads, pin_cpus)
+            pool = ctx.Pool(workers, initializer=_init_worker,
+                            initargs=(model_dir, model_name, device, backend, cpu, pipeline))
+            results = pool.imap_unordered(_transcribe_one, pending, chunksize=1)
+
+        try:
+            for i, record in enumerate(results, 1):
+                writer.write(record)
+                cached += 1 if record.get("cached") else 0
+                if record["status"] == "ok":
+                    ok += 1
+                else:
+                    failed += 1
+                    print(f"✗ {record['audio_path']}: {record['error']}")
+                if i % 100 == 0 or i == len(pending):
+                    rate = i / (time.perf_counter() - start)
+                    print(f"进度: {i}/{len(pending)} ({rate:.2f} 个/秒)")
+            if pool is not None:
+                # 工作进程退出前统计内存：共享权重时各进程的 USS 应远小于 RSS
+                from memory_stats import report_processes
+                children = multiprocessing.active_children()
+                labels = {os.getpid(): "父进程"}
+                labels.update({p.pid: f"工作进程 {i}" for i, p in enumerate(children)})
+                report_processes([os.getpid()] + [p.pid for p in children], labels)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    finally:
+        writer.close()
+
+    print(f"完成: 成功 {ok}（缓存命中 {cached}），失败 {failed}，跳过 {skipped}")
+    return ok, failed, skipped
+
+
+def add_batch_arguments(parser):
+    """添加批量模式的命令行参数"""
+    group = parser.add_argument_group("批量模式")
+    group.add_argument(
+        "--inputs",
+        type=str,
+        nargs="+",
+        default=None,
+        help="音频文件、目录或通配符（如 'calls/**/*.wav'）"
+    )
+    group.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="清单文件，每行一个音频路径"
+    )
+    group.add_argument(
+        "--output",
+        type=str,
+        default="results.jsonl",
+        help="结果文件路径，.jsonl 或 .csv (默认: results.jsonl)"
+    )
+    group.add_argument(
+        "--format",
+        type=str,
+        default=None,
+        choices=["jsonl", "csv"],
+        help="输出格式（默认按扩展名判断）"
+    )
+    group.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="工作进程数 (默认: 1)"
+    )
+    group.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="每个工作进程的 intra-op 线程数 (默认: 可用核心数/进程数)"
+    )
+    group.add_argument(
+        "--inter_threads",
+        type=int,
+        default=None,
+        help="每个工作进程的 inter-op 线程数 (默认: 多进程时为 1)"
+    )
+    group.add_argument(
+        "--pin_cpus",
+        action="store_true",
+        help="把各工作进程绑定到互不重叠的 CPU 核心"
+    )
+    group.add_argument(
+        "--share_weights",
+        action="store_true",
+        help="父进程加载一份模型后 fork 出工作进程共享权重，减少多进程内存占用（Linux/macOS）"
+    )
+    group.add_argument(
+        "--cache_db",
+        type=str,
+        default=None,
+        help="结果缓存 SQLite 文件，重复的音频直接复用已有结果（可选）"
+    )
+    group.add_argument(
+        "--no_resume",
+        action="store_true",
+        help="不跳过已完成的条目，全部重新识别"
+    )
+    return group
+
+
+def main():
+    from backends import add_backend_argument
+    from model_registry import add_pipeline_argument
+
+    parser = argparse.ArgumentParser(description="使用 SenseVoice 批量识别音频")
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default=None,
+        help="本地模型目录路径（可选，如果不提供将自动下载）"
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="small",
+        choices=["small", "medium"],
+        help="模型大小 (默认: small)"
+    )
+    add_backend_argument(parser)
+    add_pipeline_argument(parser)
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.inputs and not args.manifest:
+        parser.error("需要提供 --inputs 或 --manifest")
+
+    ok, failed, skipped = run_batch(
+        inputs=args.inputs,
+        manifest=args.manifest,
+        output=args.output,
+        fmt=args.format,
+        workers=args.workers,
+        model_dir=args.model_dir,
+        model_name=args.model,
+        resume=not args.no_resume,
+        cache_db=args.cache_db,
+        backend=args.backend,
+        threads=args.threads,
+        inter_threads=args.inter_threads,
+        pin_cpus=args.pin_cpus,
+        pipeline=args.pipeline,
+        share_weights=args.share_weights,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    exit(main())
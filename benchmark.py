@@ -0,0 +1,639 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 性能基准测试
+用示例音频和合成长音频分别测量解码、VAD、识别、标点各阶段及端到端耗时，
+输出实时率（RTF）、p50/p95 延迟、不同并发下的吞吐量、各识别流程（只识别 / VAD+识别 / 完整）的耗时、
+静音预过滤在以静音为主的音频上节省的计算量和峰值内存，
+结果写入 JSON 便于跨版本对比
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_utils import MODEL_SAMPLE_RATE, load_audio
+from backends import BACKENDS, add_backend_argument
+from cpu_tuning import cpu_count
+from memory_stats import peak_rss_mb, reset_peak_rss
+from model_registry import (DEFAULT_MODEL_DIR, PIPELINES, ModelKey, asr_only, get_registry, make_key,
+                            pipeline_key)
+
+
+# 示例音频
+EXAMPLE_CLIPS = os.path.join(DEFAULT_MODEL_DIR, "example", "*.mp3")
+
+# 启动路径上的模块及导入耗时预算（秒）：torch / funasr 应在后台导入，不计入启动时间
+IMPORT_BUDGETS = {
+    "launcher": 0.5,
+    "webui": 5.0,
+    "api_server": 6.0,
+}
+
+
+def percentile(values, q):
+    """线性插值百分位数"""
+    if not values:
+        return 0.0
+    return float(np.percentile(np.asarray(values, dtype=np.float64), q))
+
+
+def summarize(latencies, audio_seconds):
+    """汇总一组耗时（秒）"""
+    total = sum(latencies)
+    return {
+        "count": len(latencies),
+        "total_s": round(total, 4),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "rtf": round(total / audio_seconds, 4) if audio_seconds else None,
+    }
+
+
+def package_versions():
+    """记录影响性能的依赖版本"""
+    versions = {}
+    for name in ("funasr", "torch", "torchaudio", "numpy", "scipy", "modelscope", "onnxruntime"):
+        try:
+            module = __import__(name)
+            versions[name] = getattr(module, "__version__", "unknown")
+        except Exception:
+            versions[name] = None
+    return versions
+
+
+def environment():
+    info = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "available_cpus": cpu_count(),
+        "versions": package_versions(),
+    }
+    try:
+        import torch
+        info["torch_threads"] = torch.get_num_threads()
+        info["torch_interop_threads"] = torch.get_num_interop_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def measure_import(module, repeats=3):
+    """在新的解释器中测量模块冷导入耗时（秒），取多次中的最小值；导入失败返回 None"""
+    code = ("import time; start = time.perf_counter(); import {0}; "
+            "print(time.perf_counter() - start)").format(module)
+    best = None
+    for _ in range(repeats):
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+        if proc.returncode != 0:
+            return None
+        seconds = float(proc.stdout.strip().splitlines()[-1])
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def bench_imports(budgets=IMPORT_BUDGETS, repeats=3, scale=1.0):
+    """测量启动路径上各模块的导入耗时，并与预算对比"""
+    results = {}
+    for module, budget in budgets.items():
+        seconds = measure_import(module, repeats)
+        budget = budget * scale
+        ok = seconds is not None and seconds <= budget
+        results[module] = {
+            "seconds": round(seconds, 3) if seconds is not None else None,
+            "budget_s": round(budget, 3),
+            "within_budget": ok,
+        }
+        shown = f"{seconds:7.3f}s" if seconds is not None else "导入失败"
+        print(f"{module:>24}: {shown}  预算 {budget:.2f}s  {'✓' if ok else '✗ 超出预算'}")
+    return results
+
+
+def load_clips(pattern=EXAMPLE_CLIPS, long_seconds=0):
+    """
+    读取测试音频
+
+    Returns:
+        [(名称, 路径或 None, 16kHz 波形, 解码耗时)]，合成长音频没有路径和解码耗时
+    """
+    clips = []
+    for path in sorted(glob.glob(pattern)):
+        pcm, elapsed = timed(load_audio, path)
+        clips.append((os.path.basename(path), path, pcm, elapsed))
+    if long_seconds and clips:
+        # 把示例音频循环拼接成指定时长的合成长音频
+        joined = np.concatenate([pcm for _, _, pcm, _ in clips])
+        repeat = int(np.ceil(long_seconds * MODEL_SAMPLE_RATE / float(len(joined))))
+        synthetic = np.tile(joined, repeat)[:int(long_seconds * MODEL_SAMPLE_RATE)]
+        clips.append((f"synthetic_{int(long_seconds)}s", None, synthetic, None))
+    return clips
+
+
+def bench_stages(clips, key, repeats=3):
+    """逐阶段测量：解码 → VAD → 识别 → 标点，以及完整流水线"""
+    registry = get_registry()
+    vad_pool = registry.get_pool(ModelKey(key.vad_model or "fsmn-vad", None, None, key.device))
+    asr_pool = registry.get_pool(asr_only(key))
+    punc_pool = registry.get_pool(ModelKey(key.punc_model or "ct-punc", None, None, key.device))
+    full_pool = registry.get_pool(key)
+
+    results = {}
+    for name, path, pcm, decode_time in clips:
+        seconds = len(pcm) / float(MODEL_SAMPLE_RATE)
+        stages = {"decode": [], "vad": [], "asr": [], "punc": [], "end_to_end": []}
+        reset_peak_rss()
+        for _ in range(repeats):
+            if path:
+                _, elapsed = timed(load_audio, path)
+                stages["decode"].append(elapsed)
+
+            with vad_pool.acquire() as vad:
+                res, elapsed = timed(vad.generate, input=pcm)
+            stages["vad"].append(elapsed)
+            segments = res[0].get("value", []) if res else []
+
+            texts = []
+            start = time.perf_counter()
+            with asr_pool.acquire() as asr:
+                for beg, end in segments:
+                    piece = pcm[beg * MODEL_SAMPLE_RATE // 1000:end * MODEL_SAMPLE_RATE // 1000]
+                    out = asr.generate(input=piece)
+                    texts.append(out[0].get("text", "") if out else "")
+            stages["asr"].append(time.perf_counter() - start)
+
+            text = "".join(texts)
+            if text:
+                with punc_pool.acquire() as punc:
+                    _, elapsed = timed(punc.generate, input=text)
+                stages["punc"].append(elapsed)
+
+            with full_pool.acquire() as model:
+                _, elapsed = timed(model.generate, input=pcm)
+            stages["end_to_end"].append(elapsed)
+
+        results[name] = {
+            "audio_seconds": round(seconds, 3),
+            "segments": len(segments),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": {stage: summarize(values, seconds * len(values))
+                       for stage, values in stages.items() if values},
+        }
+        e2e = results[name]["stages"]["end_to_end"]
+        print(f"{name:>24}: {seconds:7.1f}s  端到端 p50 {e2e['p50_ms']:9.1f} ms  RTF {e2e['rtf']:.4f}")
+    return results
+
+
+def bench_concurrency(clips, key, levels=(1, 2, 4, 8), requests_per_level=16):
+    """不同并发下通过请求合并调度器（与 Web 界面同一路径）的吞吐量"""
+    from micro_batcher import MicroBatcher
+
+    short = [pcm for _, _, pcm, _ in clips if len(pcm) < 60 * MODEL_SAMPLE_RATE] or [clips[0][2]]
+    results = {}
+    for level in levels:
+        batcher = MicroBatcher(workers=get_registry().replicas)
+        inputs = [short[i % len(short)] for i in range(requests_per_level)]
+        latencies = []
+
+        def one(pcm):
+            _, elapsed = timed(batcher.transcribe, pcm, key)
+            latencies.append(elapsed)
+
+        reset_peak_rss()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as executor:
+            list(executor.map(one, inputs))
+        wall = time.perf_counter() - start
+        batcher.close()
+
+        audio_seconds = sum(len(p) for p in inputs) / float(MODEL_SAMPLE_RATE)
+        results[str(level)] = {
+            "requests": len(inputs),
+            "wall_s": round(wall, 3),
+            "requests_per_s": round(len(inputs) / wall, 3),
+            "audio_s_per_s": round(audio_seconds / wall, 3),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "mean_batch_size": batcher.stats()["mean_batch_size"],
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        r = results[str(level)]
+        print(f"并发 {level:>3}: {r['requests_per_s']:7.2f} 请求/秒  {r['audio_s_per_s']:8.2f} 音频秒/秒  "
+              f"p50 {r['p50_ms']:9.1f} ms  p95 {r['p95_ms']:9.1f} ms  平均批大小 {r['mean_batch_size']}")
+    return results
+
+
+def edit_distance(a, b):
+    """字符级编辑距离"""
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def plain_text(result):
+    """去掉语言/情感/事件标签后的识别文本"""
+    text = result.get("text", "") if result else ""
+    try:
+        from funasr.utils.postprocess_utils import rich_transcription_postprocess
+        return rich_transcription_postprocess(text)
+    except ImportError:
+        return text
+
+
+def bench_backends(clips, model_dir, model_name, backends=BACKENDS, repeats=3):
+    """
+    对比各推理后端的速度和准确度
+
+    示例音频没有人工标注，准确度以第一个后端（通常为 fp32 的 torch）的输出为参考，计算字错误率（CER）
+    """
+    clips = [c for c in clips if c[1]]
+    registry = get_registry()
+    results = {}
+    reference = {}
+    for backend in backends:
+        key = make_key(model_dir, model_name, backend=backend)
+        try:
+            pool, load_s = timed(registry.get_pool, key)
+        except Exception as e:
+            print(f"{backend:>8}: 加载失败 ({e})")
+            results[backend] = {"error": str(e)}
+            continue
+
+        latencies, audio_seconds, errors, ref_chars = [], 0.0, 0, 0
+        reset_peak_rss()
+        for name, _, pcm, _ in clips:
+            with pool.acquire() as model:
+                model.generate(input=pcm)  # 预热
+                for _ in range(repeats):
+                    result, elapsed = timed(model.generate, input=pcm)
+                    latencies.append(elapsed)
+            audio_seconds += repeats * len(pcm) / float(MODEL_SAMPLE_RATE)
+            text = plain_text(result[0] if result else None)
+            if name not in reference:
+                reference[name] = text
+            errors += edit_distance(reference[name], text)
+            ref_chars += len(reference[name])
+
+        results[backend] = dict(
+            summarize(latencies, audio_seconds),
+            model_load_s=round(load_s, 3),
+            cer_vs_reference=round(errors / ref_chars, 4) if ref_chars else None,
+            peak_rss_mb=peak_rss_mb(),
+        )
+        r = results[backend]
+        print(f"{backend:>8}: RTF {r['rtf']:.4f}  p50 {r['p50_ms']:9.1f} ms  "
+              f"CER(相对参考) {r['cer_vs_reference']}  峰值内存 {r['peak_rss_mb']} MB")
+        # 释放当前后端的模型，避免多份模型同时占用内存影响测量
+        registry.evict(key)
+    return results
+
+
+def bench_pipelines(clips, key, repeats=3, max_seconds=60):
+    """
+    对比各识别流程在短音频上的延迟
+
+    以完整流程（VAD+识别+标点）为基准，报告每个流程节省的延迟和相对完整流程输出的 CER；
+    超过 max_seconds 的音频不做比较（不带 VAD 的流程不适合长音频）
+    """
+    short = [c for c in clips if len(c[2]) <= max_seconds * MODEL_SAMPLE_RATE]
+    registry = get_registry()
+    results = {}
+    reference = {}
+    # 先跑完整流程作为基准
+    for pipeline in sorted(PIPELINES, key=lambda p: p != "full"):
+        pipe_key, generate_kwargs = pipeline_key(key, pipeline)
+        pool, load_s = timed(registry.get_pool, pipe_key)
+
+        latencies, audio_seconds, errors, ref_chars = [], 0.0, 0, 0
+        reset_peak_rss()
+        for name, _, pcm, _ in short:
+            with pool.acquire() as model:
+                model.generate(input=pcm, **generate_kwargs)  # 预热
+                for _ in range(repeats):
+                    result, elapsed = timed(model.generate, input=pcm, **generate_kwargs)
+                    latencies.append(elapsed)
+            audio_seconds += repeats * len(pcm) / float(MODEL_SAMPLE_RATE)
+            text = plain_text(result[0] if result else None)
+            reference.setdefault(name, text)
+            errors += edit_distance(reference[name], text)
+            ref_chars += len(reference[name])
+
+        results[pipeline] = dict(
+            summarize(latencies, audio_seconds),
+            model_load_s=round(load_s, 3),
+            cer_vs_full=round(errors / ref_chars, 4) if ref_chars else None,
+            peak_rss_mb=peak_rss_mb(),
+        )
+        # 释放当前流程的模型，避免多份模型同时占用内存影响测量
+        registry.evict(pipe_key)
+
+    full = results["full"]
+    for pipeline, r in results.items():
+        r["saved_p50_ms"] = round(full["p50_ms"] - r["p50_ms"], 2)
+        r["saved_ratio"] = round(r["saved_p50_ms"] / full["p50_ms"], 4) if full["p50_ms"] else None
+        print(f"{pipeline:>8}: p50 {r['p50_ms']:9.1f} ms  节省 {r['saved_p50_ms']:8.1f} ms "
+              f"({(r['saved_ratio'] or 0) * 100:5.1f}%)  CER(相对完整流程) {r['cer_vs_full']}  "
+              f"加载 {r['model_load_s']:.2f}s")
+    return results
+
+
+def silent_corpus(clips, speech_ratio=0.2, noise_dbfs=-65.0, seed=0):
+    """
+    由示例音频构造以静音为主的测试集：每段音频前后补底噪，使语音只占 speech_ratio，
+    另外每段配一个同样时长的纯底噪文件（模拟整段无人说话的录音）
+
+    Returns:
+        [(名称, 16kHz 波形)]
+    """
+    rng = np.random.RandomState(seed)
+    noise_amp = 10 ** (noise_dbfs / 20.0)
+    corpus = []
+    for name, _, pcm, _ in clips:
+        total = int(len(pcm) / speech_ratio)
+        lead = (total - len(pcm)) // 2
+
+        def noise(n):
+            return (rng.randn(n) * noise_amp).astype(np.float32)
+
+        corpus.append((f"padded_{name}", np.concatenate([noise(lead), pcm, noise(total - len(pcm) - lead)])))
+        corpus.append((f"silent_{name}", noise(total)))
+    return corpus
+
+
+# 静音预过滤测试集的底噪电平（dBFS）：安静录音，以及接近能量阈值的嘈杂房间
+SILENCE_NOISE_DBFS = (-65.0, -55.0, -50.0)
+
+
+def bench_silence(clips, key, speech_ratio=0.2, noise_levels=SILENCE_NOISE_DBFS):
+    """
+    静音预过滤在以静音为主的测试集上节省的计算量
+
+    每种底噪电平构造一个测试集，用完整流程（VAD+识别+标点）各跑一遍：不过滤 / 过滤，报告总耗时、跳过的音频比例、
+    过滤本身的耗时，以及过滤后相对不过滤输出的 CER
+
+    Returns:
+        {底噪电平: 结果}
+    """
+    full_key, generate_kwargs = pipeline_key(key, "full")
+    pool = get_registry().get_pool(full_key)
+    results = {}
+    for noise_dbfs in noise_levels:
+        print(f"底噪 {noise_dbfs:g} dBFS")
+        corpus = silent_corpus(clips, speech_ratio, noise_dbfs)
+        results[f"{noise_dbfs:g}"] = _bench_silence_corpus(corpus, pool, generate_kwargs)
+    return results
+
+
+def _bench_silence_corpus(corpus, pool, generate_kwargs):
+    from silence_gate import gate
+
+    with pool.acquire() as model:
+        model.generate(input=corpus[0][1], **generate_kwargs)  # 预热
+
+    audio_seconds = sum(len(pcm) for _, pcm in corpus) / float(MODEL_SAMPLE_RATE)
+    reference, off_s = {}, 0.0
+    for name, pcm in corpus:
+        with pool.acquire() as model:
+            result, elapsed = timed(model.generate, input=pcm, **generate_kwargs)
+        off_s += elapsed
+        reference[name] = plain_text(result[0] if result else None)
+
+    on_s = gate_s = kept_seconds = 0.0
+    errors = ref_chars = empty = 0
+    for name, pcm in corpus:
+        (kept, _, info), elapsed = timed(gate, pcm, enabled=True)
+        gate_s += elapsed
+        on_s += elapsed
+        kept_seconds += len(kept) / float(MODEL_SAMPLE_RATE)
+        text = ""
+        if info["empty"]:
+            empty += 1
+        else:
+            with pool.acquire() as model:
+                result, elapsed = timed(model.generate, input=kept, **generate_kwargs)
+            on_s += elapsed
+            text = plain_text(result[0] if result else None)
+        errors += edit_distance(reference[name], text)
+        ref_chars += len(reference[name])
+
+    result = {
+        "files": len(corpus),
+        "empty_files": empty,
+        "audio_s": round(audio_seconds, 2),
+        "skipped_ratio": round(1.0 - kept_seconds / audio_seconds, 4),
+        "ungated_s": round(off_s, 3),
+        "gated_s": round(on_s, 3),
+        "gate_ms": round(gate_s * 1000, 2),
+        "saved_ratio": round(1.0 - on_s / off_s, 4) if off_s else None,
+        "cer_vs_ungated": round(errors / ref_chars, 4) if ref_chars else None,
+    }
+    print(f"  {result['files']} 个文件（{result['audio_s']:.0f} 秒，整段静音 {empty} 个），"
+          f"跳过 {result['skipped_ratio'] * 100:.1f}% 音频")
+    print(f"  不过滤 {result['ungated_s']:.2f}s  过滤 {result['gated_s']:.2f}s（含过滤本身 {result['gate_ms']:.1f} ms）"
+          f"  节省 {(result['saved_ratio'] or 0) * 100:.1f}%  CER(相对不过滤) {result['cer_vs_ungated']}")
+    return result
+
+
+def compare(paths):
+    """对比多个结果文件的端到端 RTF 和吞吐量"""
+    runs = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            runs.append((os.path.basename(path), json.load(f)))
+
+    print("端到端 RTF（越小越快）")
+    clips = sorted({name for _, run in runs for name in run.get("stages", {})})
+    print(f"{'':>24}" + "".join(f"{name:>28}" for name, _ in runs))
+    for clip in clips:
+        row = f"{clip:>24}"
+        for _, run in runs:
+            e2e = run.get("stages", {}).get(clip, {}).get("stages", {}).get("end_to_end")
+            row += f"{(e2e['rtf'] if e2e else '-'):>28}"
+        print(row)
+
+    print("\n导入耗时（秒）")
+    modules = sorted({m for _, run in runs for m in run.get("imports", {})})
+    for module in modules:
+        row = f"{module:>24}"
+        for _, run in runs:
+            r = run.get("imports", {}).get(module)
+            row += f"{(r['seconds'] if r and r['seconds'] is not None else '-'):>28}"
+        print(row)
+
+    backends = [b for b in BACKENDS if any(b in run.get("backends", {}) for _, run in runs)]
+    if backends:
+        print("\n推理后端 RTF / CER")
+        for backend in backends:
+            row = f"{backend:>24}"
+            for _, run in runs:
+                r = run.get("backends", {}).get(backend)
+                cell = f"{r['rtf']} / {r['cer_vs_reference']}" if r and "rtf" in r else "-"
+                row += f"{cell:>28}"
+            print(row)
+
+    pipelines = [p for p in PIPELINES if any(p in run.get("pipelines", {}) for _, run in runs)]
+    if pipelines:
+        print("\n识别流程 p50 延迟（ms）/ 相对完整流程节省")
+        for pipeline in pipelines:
+            row = f"{pipeline:>24}"
+            for _, run in runs:
+                r = run.get("pipelines", {}).get(pipeline)
+                cell = f"{r['p50_ms']} / {r['saved_p50_ms']}" if r else "-"
+                row += f"{cell:>28}"
+            print(row)
+
+    levels = sorted({lvl for _, run in runs for lvl in run.get("silence", {})}, key=float)
+    if levels:
+        print("\n静音预过滤 节省耗时比例 / 跳过音频比例")
+        for level in levels:
+            row = f"{'底噪 ' + level + ' dBFS':>24}"
+            for _, run in runs:
+                r = run.get("silence", {}).get(level)
+                cell = f"{r['saved_ratio']} / {r['skipped_ratio']}" if r else "-"
+                row += f"{cell:>28}"
+            print(row)
+
+    print("\n吞吐量（音频秒/秒）")
+    levels = sorted({lvl for _, run in runs for lvl in run.get("concurrency", {})}, key=int)
+    for level in levels:
+        row = f"{'并发 ' + level:>24}"
+        for _, run in runs:
+            r = run.get("concurrency", {}).get(level)
+            row += f"{(r['audio_s_per_s'] if r else '-'):>28}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SenseVoice 性能基准测试")
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default=DEFAULT_MODEL_DIR,
+        help=f"本地模型目录路径 (默认: {DEFAULT_MODEL_DIR})"
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="small",
+        choices=["small", "medium"],
+        help="模型大小 (默认: small)"
+    )
+    parser.add_argument("--clips", type=str, default=EXAMPLE_CLIPS, help="测试音频通配符")
+    parser.add_argument("--long_seconds", type=float, default=600, help="合成长音频时长，0 表示不测 (默认: 600)")
+    parser.add_argument("--repeats", type=int, default=3, help="每段音频重复测量次数 (默认: 3)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8], help="并发级别")
+    parser.add_argument("--requests", type=int, default=16, help="每个并发级别的请求数 (默认: 16)")
+    parser.add_argument("--output", type=str, default=None, help="结果 JSON 路径 (默认: bench_results/<时间>.json)")
+    parser.add_argument("--compare", type=str, nargs="+", default=None, help="对比已有的结果文件")
+    parser.add_argument("--import_budget_scale", type=float, default=1.0,
+                        help="导入耗时预算倍数，较慢的机器上可适当放宽 (默认: 1.0)")
+    parser.add_argument("--imports_only", action="store_true", help="只测量启动导入耗时，超出预算时返回非零")
+    add_backend_argument(parser)
+    parser.add_argument("--backends", type=str, nargs="+", default=None, choices=BACKENDS,
+                        help="只对比这些推理后端在示例音频上的速度和准确度，例如 --backends torch int8 onnx")
+    parser.add_argument("--pipelines_only", action="store_true",
+                        help="只对比各识别流程（asr / vad_asr / full）在示例音频上的延迟")
+    parser.add_argument("--silence_only", action="store_true",
+                        help="只测试静音预过滤在以静音为主的测试集上节省的计算量")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return 0
+
+    key = make_key(args.model_dir, args.model, backend=args.backend)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": key.model,
+        "backend": key.backend,
+        "environment": environment(),
+    }
+
+    print("=" * 60)
+    print("启动导入耗时")
+    report["imports"] = bench_imports(scale=args.import_budget_scale)
+    if args.imports_only:
+        all_ok = all(r["within_budget"] for r in report["imports"].values())
+        write_report(report, args.output)
+        return 0 if all_ok else 1
+
+    if args.backends:
+        print("=" * 60)
+        print("推理后端对比")
+        report["backends"] = bench_backends(load_clips(args.clips), args.model_dir, args.model,
+                                            args.backends, args.repeats)
+        write_report(report, args.output)
+        return 0
+
+    if args.pipelines_only:
+        print("=" * 60)
+        print("识别流程对比")
+        report["pipelines"] = bench_pipelines(load_clips(args.clips), key, args.repeats)
+        write_report(report, args.output)
+        return 0
+
+    if args.silence_only:
+        print("=" * 60)
+        print("静音预过滤")
+        report["silence"] = bench_silence(load_clips(args.clips), key)
+        write_report(report, args.output)
+        return 0
+
+    print("=" * 60)
+    print("加载模型...")
+    _, report["model_load_s"] = timed(get_registry().get_pool, key)
+    print(f"模型加载耗时: {report['model_load_s']:.2f} 秒")
+
+    clips = load_clips(args.clips, args.long_seconds)
+    if not clips:
+        print(f"错误: 没有找到测试音频: {args.clips}")
+        return 1
+
+    print("=" * 60)
+    print("分阶段测试")
+    report["stages"] = bench_stages(clips, key, args.repeats)
+    print("=" * 60)
+    print("并发吞吐测试")
+    report["concurrency"] = bench_concurrency(clips, key, args.concurrency, args.requests)
+    print("=" * 60)
+    print("识别流程对比")
+    report["pipelines"] = bench_pipelines(clips, key, args.repeats)
+    print("=" * 60)
+    print("静音预过滤")
+    report["silence"] = bench_silence([c for c in clips if c[1] is not None], key)
+    report["peak_rss_mb"] = peak_rss_mb()
+    write_report(report, args.output)
+    return 0
+
+
+def write_report(report, output=None):
+    output = output or os.path.join("bench_results", time.strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print("=" * 60)
+    print(f"结果已写入: {output}")
+
+
+if __name__ == "__main__":
+    exit(main())
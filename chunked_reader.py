@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分块音频读取
+WAV 用内存映射，压缩格式（mp3/m4a 等）用 ffmpeg 管道或 soundfile 增量解码，
+按固定窗口输出 16kHz float32 单声道波形，峰值内存与文件时长无关
+"""
+
+import os
+import math
+import shutil
+import struct
+import subprocess
+
+import numpy as np
+
+from audio_utils import MODEL_SAMPLE_RATE, resample, resample_kernel, resample_ratio, to_mono, to_mono_float32
+
+
+# 每个窗口的时长（秒）
+WINDOW_SECONDS = 10
+
+# 超过该大小（MB）的文件走分块识别，不一次性解码到内存
+STREAM_FILE_MB = float(os.environ.get("SENSEVOICE_STREAM_FILE_MB", "50"))
+
+# 解码后 float32 波形超过该大小（MB）时也走分块识别；低码率压缩文件本身很小，解码后可能很大
+STREAM_DECODED_MB = float(os.environ.get("SENSEVOICE_STREAM_DECODED_MB", "200"))
+
+
+def _probe_samples(path):
+    """从文件头读取 (帧数, 声道数)，无法读取时返回 None"""
+    try:
+        info = read_wav_info(path)
+    except (OSError, struct.error):
+        info = None
+    if info is not None:
+        return info["frames"], info["channels"]
+    try:
+        import soundfile as sf
+        info = sf.info(path)
+        if info.frames > 0:
+            return info.frames, info.channels
+    except Exception:
+        pass
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe:
+        cmd = [
+            ffprobe, "-v", "error", "-select_streams", "a:0",
+            "-show_entries", "stream=sample_rate,channels:format=duration",
+            "-of", "default=noprint_wrappers=1", path
+        ]
+        try:
+            out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                 timeout=30, check=True).stdout.decode("utf-8", "replace")
+            fields = dict(line.split("=", 1) for line in out.splitlines() if "=" in line)
+            frames = float(fields["duration"]) * int(fields["sample_rate"])
+            return int(frames), int(fields["channels"])
+        except (subprocess.SubprocessError, OSError, KeyError, ValueError):
+            pass
+    return None
+
+
+def should_stream(path):
+    """
+    文件是否需要分块读取
+
+    按解码后的波形大小判断（帧数 × 声道数 × 4 字节），文件大小只作为快速判断；
+    读不到文件头的压缩格式一律分块，避免整段解码
+    """
+    try:
+        if os.path.getsize(path) > STREAM_FILE_MB * 1024 * 1024:
+            return True
+    except OSError:
+        return False
+    probed = _probe_samples(path)
+    if probed is None:
+        return os.path.splitext(path)[1].lower() not in (".wav", ".flac")
+    frames, channels = probed
+    return frames * channels * 4 > STREAM_DECODED_MB * 1024 * 1024
+
+
+def read_wav_info(path):
+    """
+    解析 WAV 头，返回可内存映射的数据区信息；格式不支持映射（如 24bit）时返回 None
+
+    Returns:
+        {"offset", "frames", "channels", "sample_rate", "dtype"}
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] not in (b"RIFF", b"RF64") or header[8:12] != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+            if chunk_id == b"fmt ":
+                data = f.read(size)
+                fmt_tag, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", data[:16])
+                if fmt_tag == 0xFFFE and size >= 26:
+                    # WAVE_FORMAT_EXTENSIBLE：真实格式在 SubFormat GUID 的前两个字节
+                    fmt_tag = struct.unpack("<H", data[24:26])[0]
+                fmt = (fmt_tag, channels, sample_rate, block_align, bits)
+                if size & 1:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    return None
+                fmt_tag, channels, sample_rate, block_align, bits = fmt
+                dtype = {
+                    (1, 8): np.uint8,
+                    (1, 16): np.dtype("<i2"),
+                    (1, 32): np.dtype("<i4"),
+                    (3, 32): np.dtype("<f4"),
+                    (3, 64): np.dtype("<f8"),
+                }.get((fmt_tag, bits))
+                if dtype is None:
+                    return None
+                offset = f.tell()
+                # 流式写出的 WAV 可能没有回填长度（0 或 0xFFFFFFFF）
+                if size in (0, 0xFFFFFFFF) or offset + size > file_size:
+                    size = file_size - offset
+                return {
+                    "offset": offset,
+                    "frames": size // block_align,
+                    "channels": channels,
+                    "sample_rate": sample_rate,
+                    "dtype": dtype,
+                }
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+
+
+class StreamResampler:
+    """
+    分块重采样，相邻窗口之间保留上下文，避免块边界处的滤波失真
+    """
+
+    def __init__(self, orig_sr, target_sr=MODEL_SAMPLE_RATE):
+        self.orig_sr = int(orig_sr)
+        self.target_sr = int(target_sr)
+        self.up, self.down = resample_ratio(self.orig_sr, self.target_sr)
+        # 上下文长度取 down 的整数倍，保证输出采样点严格对齐
+        self.pad = self.down * int(math.ceil(0.02 * self.orig_sr / self.down))
+        self.history = np.zeros(0, dtype=np.float32)
+        self.buffer = np.zeros(0, dtype=np.float32)
+        try:
+            from scipy.signal import resample_poly
+            self._resample_poly = resample_poly
+            # 各窗口共用同一个滤波器，不必每块重新设计
+            self.kernel = resample_kernel(self.up, self.down) if self.up != self.down else None
+        except ImportError:
+            self._resample_poly = None
+
+    def process(self, data, final=False):
+        """输入一块原始采样率的波形，返回可以确定输出的 16kHz 波形"""
+        if self.up == self.down:
+            return data
+        if self._resample_poly is None:
+            return resample(data, self.orig_sr, self.target_sr)
+
+        self.buffer = np.concatenate([self.buffer, data]) if len(self.buffer) else data
+        if final:
+            usable = len(self.buffer)
+            right = 0
+        else:
+            # 保留 pad 个采样点作为右侧上下文，留到下一块再输出
+            usable = max(0, (len(self.buffer) - self.pad) // self.down * self.down)
+            right = self.pad
+        if usable == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        block = np.concatenate([self.history, self.buffer[:usable + right]])
+        y = self._resample_poly(block, self.up, self.down, window=self.kernel)
+        start = len(self.history) * self.up // self.down
+        count = int(math.ceil(usable * self.up / float(self.down)))
+        out = y[start:start + count].astype(np.float32, copy=False)
+
+        self.history = self.buffer[max(0, usable - self.pad):usable]
+        self.buffer = self.buffer[usable:]
+        return out
+
+
+def _iter_wav_memmap(path, info, window_frames):
+    mm = np.memmap(path, dtype=info["dtype"], mode="r", offset=info["offset"],
+                   shape=(info["frames"], info["channels"]))
+    try:
+        for i in range(0, info["frames"], window_frames):
+            # 只有当前窗口会被读入内存
+            # 整数多声道直接在下混时转换为 float32，不生成多声道副本
+            block = to_mono_float32(mm[i:i + window_frames], channels_last=True)
+            # 单声道 float32 时得到的是内存映射的视图，复制出来，文件关闭后不再被引用
+            yield np.array(block) if np.may_share_memory(block, mm) else block
+    finally:
+        del mm
+
+
+def _iter_ffmpeg(path, window_frames):
+    cmd = [
+        shutil.which("ffmpeg"), "-nostdin", "-v", "error", "-i", path,
+        "-f", "f32le", "-ac", "1", "-ar", str(MODEL_SAMPLE_RATE), "-"
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        nbytes = window_frames * 4
+        while True:
+            data = proc.stdout.read(nbytes)
+            if not data:
+                break
+            usable = len(data) // 4 * 4
+            yield np.frombuffer(data[:usable], dtype=np.float32)
+        proc.wait()
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg 解码失败: {proc.stderr.read().decode('utf-8', 'replace').strip()}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+
+
+def _iter_soundfile(path, window_seconds):
+    import soundfile as sf
+    with sf.SoundFile(path) as f:
+        frames = int(window_seconds * f.samplerate)
+        for block in f.blocks(blocksize=frames, dtype="float32", always_2d=True):
+            yield f.samplerate, to_mono(block, channels_last=True)
+
+
+def iter_audio_windows(path, window_seconds=WINDOW_SECONDS):
+    """
+    按窗口读取音频文件
+
+    Args:
+        path: 音频文件路径
+        window_seconds: 每个窗口的时长（秒）
+
+    Yields:
+        16kHz float32 单声道 ndarray
+    """
+    info = read_wav_info(path)
+    if info is not None:
+        resampler = StreamResampler(info["sample_rate"])
+        window_frames = int(window_seconds * info["sample_rate"])
+        for block in _iter_wav_memmap(path, info, window_frames):
+            out = resampler.process(block)
+            if len(out):
+                yield out
+        out = resampler.process(np.zeros(0, dtype=np.float32), final=True)
+        if len(out):
+            yield out
+        return
+
+    if shutil.which("ffmpeg"):
+        # ffmpeg 直接输出 16kHz 单声道，无需再重采样
+        for block in _iter_ffmpeg(path, int(window_seconds * MODEL_SAMPLE_RATE)):
+            yield block
+        return
+
+    # 没有 ffmpeg 时用 libsndfile 增量解码（1.1+ 支持 mp3）
+    resampler = None
+    for sample_rate, block in _iter_soundfile(path, window_seconds):
+        if resampler is None:
+            resampler = StreamResampler(sample_rate)
+        out = resampler.process(block)
+        if len(out):
+            yield out
+    if resampler is not None:
+        out = resampler.process(np.zeros(0, dtype=np.float32), final=True)
+        if len(out):
+            yield out
@@ -0,0 +1,794 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 多机识别
+协调进程接收识别任务放入共享队列，各机器上的工作进程领取任务，按现有的模型加载和 generate 流程识别后回传结果；
+工作进程定期发送心跳为手上的任务续约，超过租约时间未续约的任务（进程崩溃、断网）自动重新排队
+
+队列后端（--queue 或环境变量 SENSEVOICE_CLUSTER_QUEUE）：
+    sqlite:./jobs/cluster.db      SQLite 文件，同一台机器上的多个进程共用，不需要协调进程（不支持放在 NFS 等网络文件系统上）
+    tcp://127.0.0.1:7870          协调进程内置的 socket 服务，工作进程通过网络连接
+    unix:/tmp/sensevoice.sock     协调进程内置的 Unix socket 服务
+    redis://host:6379/0           Redis（需要 pip install redis）
+
+socket 服务可读取全部任务的音频和识别结果：默认只监听 127.0.0.1，监听其他地址时必须设置共享口令
+SENSEVOICE_CLUSTER_TOKEN（协调进程、工作进程和提交方使用相同的值），口令不符的请求直接断开
+
+用法:
+    export SENSEVOICE_CLUSTER_TOKEN=<口令>
+    python cluster.py coordinator --queue tcp://0.0.0.0:7870
+    python cluster.py worker --queue tcp://<协调机器>:7870
+    python cluster.py submit --queue tcp://<协调机器>:7870 a.wav b.mp3 --wait
+    python cluster.py status --queue tcp://<协调机器>:7870 [任务 ID ...]
+"""
+
+import os
+import json
+import time
+import hmac
+import uuid
+import base64
+import socket
+import ipaddress
+import sqlite3
+import argparse
+import tempfile
+import threading
+import socketserver
+
+from job_queue import JOB_DIR, STATUS_TEXT
+from result_cache import _json_default
+
+
+# 默认队列
+CLUSTER_QUEUE = os.environ.get("SENSEVOICE_CLUSTER_QUEUE", "sqlite:" + os.path.join(JOB_DIR, "cluster.db"))
+
+# 任务租约（秒）：工作进程超过该时间没有心跳，手上的任务重新排队
+LEASE_S = float(os.environ.get("SENSEVOICE_CLUSTER_LEASE_S", "60"))
+
+# 同一任务最多被领取的次数，超过后（反复导致工作进程中断）标记为失败
+MAX_ATTEMPTS = int(os.environ.get("SENSEVOICE_CLUSTER_MAX_ATTEMPTS", "3"))
+
+# socket 服务的共享口令，监听非本机地址时必须设置
+CLUSTER_TOKEN = os.environ.get("SENSEVOICE_CLUSTER_TOKEN", "")
+
+# 队列为空时工作进程的轮询间隔（秒）
+POLL_S = 1.0
+
+# 超过该时间没有心跳的工作进程在状态中显示为离线（秒）
+WORKER_TIMEOUT_S = LEASE_S
+
+
+def _now():
+    return time.time()
+
+
+class SqliteWorkQueue:
+    """
+    SQLite 任务队列，同一台机器上的多个进程可同时打开同一文件
+
+    使用 WAL 日志模式，依赖同一主机上的共享内存，不能放在 NFS / SMB 等网络文件系统上供多台机器共用；
+    多台机器请用 socket 服务（协调进程）或 Redis。
+    任务音频以 BLOB 保存，工作进程不需要访问提交方的文件系统；结束后清空音频只保留结果
+    """
+
+    COLUMNS = ("job_id", "filename", "options", "status", "worker", "lease_until", "attempts",
+               "result", "error", "created_at", "started_at", "finished_at")
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS work ("
+            "job_id TEXT PRIMARY KEY, filename TEXT, audio BLOB, options TEXT, status TEXT NOT NULL, "
+            "worker TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS workers ("
+            "worker_id TEXT PRIMARY KEY, started_at REAL, last_seen REAL, done INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_work_status ON work(status, created_at)")
+
+    def _to_dict(self, row):
+        job = dict(zip(self.COLUMNS, row))
+        job["options"] = json.loads(job["options"]) if job["options"] else {}
+        if job["result"]:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def put(self, filename, audio, options=None):
+        """提交任务，返回任务 ID"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO work (job_id, filename, audio, options, status, created_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, filename, sqlite3.Binary(audio), json.dumps(options or {}, ensure_ascii=False), _now()),
+            )
+        return job_id
+
+    def claim(self, worker_id, lease_s=LEASE_S):
+        """领取最早提交的排队任务，返回带 audio 的任务字典；没有任务时返回 None"""
+        self.requeue_expired()
+        now = _now()
+        with self._lock:
+            # IMMEDIATE 事务保证多个进程不会领取到同一任务
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    f"SELECT {', '.join(self.COLUMNS)}, audio FROM work "
+                    "WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE work SET status = 'running', worker = ?, lease_until = ?, "
+                        "attempts = attempts + 1, started_at = ? WHERE job_id = ?",
+                        (worker_id, now + lease_s, now, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = self._to_dict(row[:-1])
+        job["audio"] = bytes(row[-1])
+        return job
+
+    def heartbeat(self, worker_id, job_ids=(), lease_s=LEASE_S, done=0):
+        """工作进程心跳：记录在线状态，为手上的任务续约"""
+        now = _now()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO workers (worker_id, started_at, last_seen, done) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET last_seen = excluded.last_seen, done = excluded.done",
+                (worker_id, now, now, done),
+            )
+            for job_id in job_ids:
+                self._db.execute(
+                    "UPDATE work SET lease_until = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                    (now + lease_s, job_id, worker_id),
+                )
+
+    def _finish(self, job_id, worker_id, **fields):
+        # 任务已被重新排队并由其他工作进程领取时，忽略原工作进程迟到的结果
+        with self._lock:
+            cursor = self._db.execute(
+                f"UPDATE work SET {', '.join(f'{k} = ?' for k in fields)}, audio = NULL, lease_until = NULL, "
+                "finished_at = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                tuple(fields.values()) + (_now(), job_id, worker_id),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result):
+        data = json.dumps(result, ensure_ascii=False, default=_json_default)
+        return self._finish(job_id, worker_id, status="finished", result=data)
+
+    def fail(self, job_id, worker_id, error):
+        return self._finish(job_id, worker_id, status="failed", error=error)
+
+    def requeue_expired(self, max_attempts=MAX_ATTEMPTS):
+        """把租约过期的任务重新排队（多次中断的标记为失败），返回处理的任务数"""
+        now = _now()
+        with self._lock:
+            failed = self._db.execute(
+                "UPDATE work SET status = 'failed', error = ?, audio = NULL, lease_until = NULL, finished_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (f"工作进程 {max_attempts} 次中断，放弃该任务", now, now, max_attempts),
+            ).rowcount
+            requeued = self._db.execute(
+                "UPDATE work SET status = 'queued', worker = NULL, lease_until = NULL, started_at = NULL "
+                "WHERE status = 'running' AND lease_until < ?",
+                (now,),
+            ).rowcount
+        return failed + requeued
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM work WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def stats(self):
+        """各状态的任务数和工作进程列表"""
+        now = _now()
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM work GROUP BY status").fetchall())
+            rows = self._db.execute(
+                "SELECT worker_id, started_at, last_seen, done FROM workers ORDER BY worker_id"
+            ).fetchall()
+        workers = [
+            {"worker_id": w, "online": now - seen < WORKER_TIMEOUT_S, "done": done,
+             "jobs_per_min": round(done * 60.0 / max(seen - started, 1.0), 2)}
+            for w, started, seen, done in rows
+        ]
+        return {"jobs": counts, "workers": workers}
+
+
+# Redis 队列的 Lua 脚本：出队与登记租约、检查与写入结果、过期任务重新排队都在一个脚本内完成，
+# 进程在两步之间退出不会让任务既不在队列中也不在租约中
+
+# KEYS: 排队列表, 租约集合  ARGV: 任务哈希前缀, 工作进程, 租约到期时间, 当前时间
+_REDIS_CLAIM = """
+local id = redis.call('LPOP', KEYS[1])
+if not id then return false end
+local h = ARGV[1] .. id
+redis.call('HSET', h, 'status', 'running', 'worker', ARGV[2], 'lease_until', ARGV[3], 'started_at', ARGV[4])
+redis.call('HINCRBY', h, 'attempts', 1)
+redis.call('ZADD', KEYS[2], ARGV[3], id)
+return id
+"""
+
+# KEYS: 任务哈希, 租约集合, 音频  ARGV: 任务 ID, 工作进程, 字段1, 值1, ...
+_REDIS_FINISH = """
+if redis.call('HGET', KEYS[1], 'worker') ~= ARGV[2] or redis.call('HGET', KEYS[1], 'status') ~= 'running' then
+    return 0
+end
+for i = 3, #ARGV, 2 do redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1]) end
+redis.call('HDEL', KEYS[1], 'lease_until')
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('DEL', KEYS[3])
+return 1
+"""
+
+# KEYS: 任务哈希, 租约集合  ARGV: 任务 ID, 工作进程, 新的到期时间
+_REDIS_RENEW = """
+if redis.call('HGET', KEYS[1], 'worker') ~= ARGV[2] then return 0 end
+return redis.call('ZADD', KEYS[2], 'XX', 'CH', ARGV[3], ARGV[1])
+"""
+
+# KEYS: 租约集合, 排队列表, 任务哈希, 音频  ARGV: 任务 ID, 当前时间, 最多领取次数, 失败原因
+_REDIS_REQUEUE = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not score or tonumber(score) > tonumber(ARGV[2]) then return 0 end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[3], 'lease_until')
+if tonumber(redis.call('HGET', KEYS[3], 'attempts') or '0') >= tonumber(ARGV[3]) then
+    redis.call('HSET', KEYS[3], 'status', 'failed', 'error', ARGV[4], 'finished_at', ARGV[2])
+    redis.call('DEL', KEYS[4])
+else
+    redis.call('HSET', KEYS[3], 'status', 'queued', 'worker', '')
+    redis.call('LPUSH', KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+
+class RedisWorkQueue:
+    """
+    Redis 任务队列：排队任务 ID 在列表中，租约在有序集合中（分数为到期时间），任务字段在哈希中
+
+    状态变更由 Lua 脚本原子完成。需要 pip install redis；兼容 Redis 协议的服务（如 KeyDB、Valkey）均可
+    """
+
+    def __init__(self, url, prefix="sensevoice:cluster:"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("redis 队列需要安装 redis: pip install redis")
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._claim = self._redis.register_script(_REDIS_CLAIM)
+        self._finish_script = self._redis.register_script(_REDIS_FINISH)
+        self._renew = self._redis.register_script(_REDIS_RENEW)
+        self._requeue = self._redis.register_script(_REDIS_REQUEUE)
+
+    def _key(self, *parts):
+        return self.prefix + ":".join(parts)
+
+    def _hash(self, job_id):
+        return self._key("job", job_id)
+
+    def put(self, filename, audio, options=None):
+        job_id = uuid.uuid4().hex
+        pipe = self._redis.pipeline()
+        pipe.hset(self._hash(job_id), mapping={
+            "job_id": job_id, "filename": filename, "status": "queued", "attempts": 0,
+            "options": json.dumps(options or {}, ensure_ascii=False), "created_at": _now(),
+        })
+        pipe.set(self._key("audio", job_id), audio)
+        pipe.rpush(self._key("queued"), job_id)
+        pipe.execute()
+        return job_id
+
+    def _decode(self, fields):
+        job = {k.decode(): v.decode() for k, v in fields.items()}
+        job["options"] = json.loads(job.get("options") or "{}")
+        job["result"] = json.loads(job["result"]) if job.get("result") else None
+        job["attempts"] = int(job.get("attempts", 0))
+        for name in ("lease_until", "created_at", "started_at", "finished_at"):
+            job[name] = float(job[name]) if job.get(name) else None
+        for name in ("worker", "error"):
+            job.setdefault(name, None)
+        return job
+
+    def claim(self, worker_id, lease_s=LEASE_S):
+        self.requeue_expired()
+        now = _now()
+        job_id = self._claim(keys=[self._key("queued"), self._key("leases")],
+                             args=[self._hash(""), worker_id, now + lease_s, now])
+        if job_id is None:
+            return None
+        job_id = job_id.decode()
+        job = self.get(job_id)
+        job["audio"] = self._redis.get(self._key("audio", job_id)) or b""
+        return job
+
+    def heartbeat(self, worker_id, job_ids=(), lease_s=LEASE_S, done=0):
+        now = _now()
+        worker_key = self._key("worker", worker_id)
+        pipe = self._redis.pipeline()
+        pipe.hsetnx(worker_key, "started_at", now)
+        pipe.hset(worker_key, mapping={"last_seen": now, "done": done})
+        pipe.sadd(self._key("workers"), worker_id)
+        pipe.execute()
+        for job_id in job_ids:
+            # XX：只更新仍在租约集合中的任务，不会复活已被重新排队的任务
+            self._renew(keys=[self._hash(job_id), self._key("leases")], args=[job_id, worker_id, now + lease_s])
+
+    def _finish(self, job_id, worker_id, **fields):
+        # 任务已被重新排队或由其他工作进程领取时，忽略原工作进程迟到的结果
+        args = [job_id, worker_id]
+        for name, value in dict(fields, finished_at=_now()).items():
+            args += [name, value]
+        return self._finish_script(keys=[self._hash(job_id), self._key("leases"), self._key("audio", job_id)],
+                                   args=args) == 1
+
+    def complete(self, job_id, worker_id, result):
+        data = json.dumps(result, ensure_ascii=False, default=_json_default)
+        return self._finish(job_id, worker_id, status="finished", result=data)
+
+    def fail(self, job_id, worker_id, error):
+        return self._finish(job_id, worker_id, status="failed", error=error)
+
+    def requeue_expired(self, max_attempts=MAX_ATTEMPTS):
+        count = 0
+        now = _now()
+        for job_id in self._redis.zrangebyscore(self._key("leases"), 0, now):
+            job_id = job_id.decode()
+            # 脚本内再次检查租约，多个进程同时检查时只处理一次，期间续约的任务不受影响
+            count += self._requeue(
+                keys=[self._key("leases"), self._key("queued"), self._hash(job_id), self._key("audio", job_id)],
+                args=[job_id, now, max_attempts, f"工作进程 {max_attempts} 次中断，放弃该任务"],
+            )
+        return count
+
+    def get(self, job_id):
+        fields = self._redis.hgetall(self._hash(job_id))
+        return self._decode(fields) if fields else None
+
+    def stats(self):
+        now = _now()
+        counts = {}
+        workers = []
+        for worker_id in sorted(self._redis.smembers(self._key("workers"))):
+            info = {k.decode(): float(v) for k, v in self._redis.hgetall(self._key("worker", worker_id.decode())).items()}
+            seen, started, done = info.get("last_seen", 0), info.get("started_at", 0), int(info.get("done", 0))
+            workers.append({"worker_id": worker_id.decode(), "online": now - seen < WORKER_TIMEOUT_S, "done": done,
+                            "jobs_per_min": round(done * 60.0 / max(seen - started, 1.0), 2)})
+        counts["queued"] = self._redis.llen(self._key("queued"))
+        counts["running"] = self._redis.zcard(self._key("leases"))
+        return {"jobs": counts, "workers": workers}
+
+
+# ---- socket 服务 ----
+
+# 可以通过 socket 调用的队列方法
+REMOTE_METHODS = ("put", "claim", "heartbeat", "complete", "fail", "get", "stats")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    每行一个 JSON 请求 {"method", "args", "token"}，返回一行 JSON {"result"} 或 {"error"}；音频以 base64 传输
+
+    服务端设置了口令时，口令不符的请求返回错误并断开连接
+    """
+
+    def _authorized(self, request):
+        if not self.server.token:
+            return True
+        token = request.get("token") if isinstance(request, dict) else None
+        return isinstance(token, str) and hmac.compare_digest(token.encode("utf-8"), self.server.token.encode("utf-8"))
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                request = None
+            if not self._authorized(request):
+                self.wfile.write(json.dumps({"error": "口令错误，拒绝访问"}, ensure_ascii=False).encode("utf-8") + b"\n")
+                return
+            try:
+                method = request["method"]
+                if method not in REMOTE_METHODS:
+                    raise ValueError(f"不支持的方法: {method}")
+                args = request.get("args", [])
+                if method == "put":
+                    args[1] = base64.b64decode(args[1])
+                result = getattr(self.server.queue, method)(*args)
+                if method == "claim" and result is not None:
+                    result["audio"] = base64.b64encode(result["audio"]).decode("ascii")
+                response = {"result": result}
+            except Exception as e:
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response, ensure_ascii=False, default=_json_default).encode("utf-8") + b"\n")
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def serve(queue, address, token=None):
+    """
+    在 address（"tcp://host:port" 或 "unix:/path"）上提供队列服务，返回 server（已在后台线程运行）
+
+    协调进程内的实际存储为 queue（通常是本地 SQLite），任务状态在协调进程重启后保留。
+    token 默认取环境变量 SENSEVOICE_CLUSTER_TOKEN；监听非本机地址时必须设置
+    """
+    token = CLUSTER_TOKEN if token is None else token
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if os.path.exists(path):
+            os.remove(path)
+        server = _UnixServer(path, _Handler)
+    else:
+        host, port = _parse_tcp(address)
+        if not token and not _is_loopback(host):
+            raise ValueError(f"在 {host} 上提供队列服务会暴露全部任务的音频和结果，"
+                             f"请设置 SENSEVOICE_CLUSTER_TOKEN，或只监听 127.0.0.1")
+        server = _TCPServer((host, port), _Handler)
+    server.queue = queue
+    server.token = token
+    threading.Thread(target=server.serve_forever, name="cluster-server", daemon=True).start()
+    return server
+
+
+def _parse_tcp(address):
+    host, _, port = address[len("tcp://"):].rpartition(":")
+    return host.strip("[]") or "127.0.0.1", int(port)
+
+
+def _is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class SocketWorkQueue:
+    """
+    通过 socket 访问协调进程中的队列，接口与 SqliteWorkQueue 相同；连接中断时重试
+
+    token 默认取环境变量 SENSEVOICE_CLUSTER_TOKEN，需与协调进程一致
+    """
+
+    def __init__(self, address, timeout=LEASE_S, retries=3, token=None):
+        self.address = address
+        self.timeout = timeout
+        self.retries = retries
+        self.token = CLUSTER_TOKEN if token is None else token
+        self._local = threading.local()
+
+    def _connect(self):
+        if self.address.startswith("unix:"):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.address[len("unix:"):])
+        else:
+            sock = socket.create_connection(_parse_tcp(self.address), timeout=self.timeout)
+        return sock, sock.makefile("rb")
+
+    def _call(self, method, *args):
+        message = {"method": method, "args": list(args)}
+        if self.token:
+            message["token"] = self.token
+        request = json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+        for attempt in range(self.retries):
+            # 每个线程一个连接（工作进程的心跳线程和识别线程互不阻塞）
+            conn = getattr(self._local, "conn", None)
+            try:
+                if conn is None:
+                    conn = self._local.conn = self._connect()
+                conn[0].sendall(request)
+                line = conn[1].readline()
+                if not line:
+                    raise ConnectionError("协调进程关闭了连接")
+                break
+            except OSError:
+                self._local.conn = None
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(2 ** attempt)
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def put(self, filename, audio, options=None):
+        return self._call("put", filename, base64.b64encode(audio).decode("ascii"), options)
+
+    def claim(self, worker_id, lease_s=LEASE_S):
+        job = self._call("claim", worker_id, lease_s)
+        if job is not None:
+            job["audio"] = base64.b64decode(job["audio"])
+        return job
+
+    def heartbeat(self, worker_id, job_ids=(), lease_s=LEASE_S, done=0):
+        return self._call("heartbeat", worker_id, list(job_ids), lease_s, done)
+
+    def complete(self, job_id, worker_id, result):
+        return self._call("complete", job_id, worker_id, result)
+
+    def fail(self, job_id, worker_id, error):
+        return self._call("fail", job_id, worker_id, error)
+
+    def requeue_expired(self, max_attempts=MAX_ATTEMPTS):
+        # 由协调进程定期处理
+        return 0
+
+    def get(self, job_id):
+        return self._call("get", job_id)
+
+    def stats(self):
+        return self._call("stats")
+
+
+def make_queue(spec=None):
+    """按 spec 创建队列客户端：sqlite:路径、tcp://主机:端口、unix:路径、redis://..."""
+    spec = spec or CLUSTER_QUEUE
+    if spec.startswith("sqlite:"):
+        return SqliteWorkQueue(spec[len("sqlite:"):])
+    if spec.startswith(("tcp://", "unix:")):
+        return SocketWorkQueue(spec)
+    if spec.startswith(("redis://", "rediss://", "unix+redis://")):
+        return RedisWorkQueue(spec.replace("unix+redis://", "unix://", 1))
+    raise ValueError(f"不支持的队列地址: {spec}，可选: sqlite:路径、tcp://主机:端口、unix:路径、redis://主机:端口")
+
+
+# ---- 协调进程 ----
+
+def run_coordinator(spec=None, db_path=None, interval=None):
+    """
+    协调进程：socket 地址时启动队列服务（任务保存在本地 SQLite），定期把超时工作进程手上的任务重新排队
+    """
+    spec = spec or CLUSTER_QUEUE
+    if spec.startswith(("tcp://", "unix:")):
+        queue = SqliteWorkQueue(db_path or os.path.join(JOB_DIR, "cluster.db"))
+        serve(queue, spec)
+        print(f"协调进程已启动: {spec}（任务保存在 {db_path or os.path.join(JOB_DIR, 'cluster.db')}）")
+    else:
+        queue = make_queue(spec)
+        print(f"协调进程已启动，队列: {spec}")
+    interval = interval or max(LEASE_S / 4, 1.0)
+    last = None
+    while True:
+        requeued = queue.requeue_expired()
+        if requeued:
+            print(f"重新排队 {requeued} 个超时任务")
+        stats = queue.stats()
+        summary = (tuple(sorted(stats["jobs"].items())), sum(w["online"] for w in stats["workers"]))
+        if summary != last:
+            last = summary
+            print(format_stats(stats))
+        time.sleep(interval)
+
+
+# ---- 工作进程 ----
+
+def _transcribe(path, key, pipeline):
+    """按现有流程识别（与 Web UI 后台任务相同），返回带分段信息的结构化结果"""
+    from micro_batcher import estimate_duration
+    from model_registry import pipeline_key
+    from transcript import transcribe_segments
+
+    model_key, generate_kwargs = pipeline_key(key, pipeline, estimate_duration(path))
+    return transcribe_segments(path, model_key, generate_kwargs)
+
+
+def run_worker(queue, key, pipeline=None, worker_id=None, lease_s=LEASE_S, max_jobs=None, transcribe=None):
+    """
+    工作进程主循环：领取任务 → 识别 → 回传结果；后台线程每 lease_s/4 秒发送心跳
+
+    Args:
+        queue: make_queue 返回的队列
+        key: 注册表键（model_registry.make_key），各流程的模型在首次用到时加载
+        pipeline: 任务未指定流程时使用的流程
+        worker_id: 工作进程标识，默认 "主机名-进程号"
+        max_jobs: 处理完该数量的任务后退出（测试用），默认一直运行
+        transcribe: 识别函数 transcribe(音频路径, key, pipeline)，默认 _transcribe
+
+    Returns:
+        处理的任务数
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    transcribe = transcribe or _transcribe
+    current = set()
+    done = [0]
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.is_set():
+            try:
+                queue.heartbeat(worker_id, list(current), lease_s, done[0])
+            except Exception as e:
+                print(f"心跳失败: {e}")
+            stop.wait(lease_s / 4)
+
+    thread = threading.Thread(target=heartbeat, name="cluster-heartbeat", daemon=True)
+    thread.start()
+    print(f"工作进程 {worker_id} 已启动")
+    try:
+        while max_jobs is None or done[0] < max_jobs:
+            job = queue.claim(worker_id, lease_s)
+            if job is None:
+                time.sleep(POLL_S)
+                continue
+            current.add(job["job_id"])
+            suffix = os.path.splitext(job["filename"] or "")[1] or ".wav"
+            fd, path = tempfile.mkstemp(suffix=suffix, prefix="sensevoice_cluster_")
+            start = time.perf_counter()
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(job["audio"])
+                options = job["options"] or {}
+                result = transcribe(path, key, options.get("pipeline") or pipeline)
+                if not result:
+                    raise RuntimeError("识别失败，未返回结果")
+                accepted = queue.complete(job["job_id"], worker_id, result)
+                status = "完成" if accepted else "完成（任务已被重新分配，结果未采用）"
+            except Exception as e:
+                queue.fail(job["job_id"], worker_id, str(e))
+                status = f"失败: {e}"
+            finally:
+                current.discard(job["job_id"])
+                os.remove(path)
+            done[0] += 1
+            print(f"{job['job_id']} {job['filename']} {status}（{time.perf_counter() - start:.2f}s）")
+    finally:
+        stop.set()
+        thread.join(timeout=1)
+        try:
+            queue.heartbeat(worker_id, (), lease_s, done[0])
+        except Exception:
+            pass
+    return done[0]
+
+
+# ---- 提交与查询 ----
+
+def submit(queue, paths, options=None):
+    """提交音频文件，返回任务 ID 列表"""
+    job_ids = []
+    for path in paths:
+        with open(path, "rb") as f:
+            job_ids.append(queue.put(os.path.basename(path), f.read(), options))
+    return job_ids
+
+
+def wait(queue, job_ids, timeout=None, interval=POLL_S):
+    """等待任务全部结束，返回任务字典列表"""
+    deadline = None if timeout is None else time.time() + timeout
+    pending = list(job_ids)
+    jobs = {}
+    while pending:
+        for job_id in list(pending):
+            job = queue.get(job_id)
+            if job and job["status"] in ("finished", "failed"):
+                jobs[job_id] = job
+                pending.remove(job_id)
+        if pending:
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(f"等待任务超时，未完成 {len(pending)} 个")
+            time.sleep(interval)
+    return [jobs[job_id] for job_id in job_ids]
+
+
+def format_job(job):
+    """任务状态的一行描述"""
+    if job is None:
+        return "任务不存在"
+    text = f"任务 {job['job_id']}  {job['filename']}  {STATUS_TEXT.get(job['status'], job['status'])}"
+    if job["status"] == "running":
+        text += f"（{job['worker']}，第 {job['attempts']} 次）"
+    elif job["status"] == "failed":
+        text += f": {job['error']}"
+    elif job["status"] == "finished" and job.get("result"):
+        text += f": {job['result'].get('plain_text', job['result'].get('text', ''))}"
+    return text
+
+
+def format_stats(stats):
+    jobs = "  ".join(f"{STATUS_TEXT.get(k, k)} {v}" for k, v in sorted(stats["jobs"].items()))
+    lines = [f"任务: {jobs or '无'}"]
+    for w in stats["workers"]:
+        lines.append(f"  {w['worker_id']}  {'在线' if w['online'] else '离线'}  已处理 {w['done']}  "
+                     f"{w['jobs_per_min']} 个/分钟")
+    return "\n".join(lines)
+
+
+def main():
+    from backends import add_backend_argument
+    from model_registry import add_pipeline_argument
+
+    parser = argparse.ArgumentParser(description="SenseVoice 多机识别")
+    parser.add_argument("--queue", type=str, default=CLUSTER_QUEUE,
+                        help=f"队列地址：sqlite:路径、tcp://主机:端口、unix:路径、redis://主机:端口 (默认: {CLUSTER_QUEUE})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    coordinator = commands.add_parser("coordinator", help="启动协调进程")
+    coordinator.add_argument("--db", type=str, default=None,
+                             help="socket 服务模式下保存任务的 SQLite 文件 (默认: jobs/cluster.db)")
+
+    worker = commands.add_parser("worker", help="启动工作进程")
+    worker.add_argument("--model_dir", type=str, default=None, help="本地模型目录路径（可选，如果不提供将自动下载）")
+    worker.add_argument("--model", type=str, default="small", choices=["small", "medium"], help="模型大小 (默认: small)")
+    worker.add_argument("--device", type=str, default="cpu", help="推理设备 (默认: cpu)")
+    worker.add_argument("--worker_id", type=str, default=None, help="工作进程标识 (默认: 主机名-进程号)")
+    add_backend_argument(worker)
+    add_pipeline_argument(worker)
+
+    submit_parser = commands.add_parser("submit", help="提交音频文件")
+    submit_parser.add_argument("paths", nargs="+", help="音频文件")
+    submit_parser.add_argument("--pipeline", type=str, default=None, help="识别流程（默认由工作进程决定）")
+    submit_parser.add_argument("--wait", action="store_true", help="等待识别完成并输出结果")
+
+    status = commands.add_parser("status", help="查询任务或队列状态")
+    status.add_argument("job_ids", nargs="*", help="任务 ID（不提供时显示队列和工作进程状态）")
+
+    args = parser.parse_args()
+
+    if args.command == "coordinator":
+        try:
+            run_coordinator(args.queue, args.db)
+        except ValueError as e:
+            print(f"错误: {e}")
+            return 1
+        return 0
+
+    if args.command == "worker":
+        from cpu_tuning import configure_from_env
+        from model_registry import make_key
+        configure_from_env()
+        key = make_key(args.model_dir, args.model, device=args.device, backend=args.backend)
+        run_worker(make_queue(args.queue), key, args.pipeline, args.worker_id)
+        return 0
+
+    queue = make_queue(args.queue)
+    if args.command == "submit":
+        missing = [p for p in args.paths if not os.path.exists(p)]
+        if missing:
+            print(f"错误: 音频文件不存在: {', '.join(missing)}")
+            return 1
+        job_ids = submit(queue, args.paths, {"pipeline": args.pipeline} if args.pipeline else None)
+        for path, job_id in zip(args.paths, job_ids):
+            print(f"{job_id}  {path}")
+        if not args.wait:
+            return 0
+        jobs = wait(queue, job_ids)
+        for job in jobs:
+            print(format_job(job))
+        return 1 if any(job["status"] == "failed" for job in jobs) else 0
+
+    if args.job_ids:
+        for job_id in args.job_ids:
+            print(format_job(queue.get(job_id)))
+    else:
+        print(format_stats(queue.stats()))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
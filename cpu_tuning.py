@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice CPU 线程与核心绑定
+同一台机器上运行多个 Web UI / 批量工作进程时，为每个进程设置 intra-op / inter-op 线程数，
+并可把各进程绑定到互不重叠的核心上；--tune 在示例音频上测试不同的 进程数×线程数 组合，选出总吞吐量最高的配置
+
+环境变量：
+    SENSEVOICE_INTRA_THREADS   每个进程的 intra-op 线程数（默认: 分到的核心数）
+    SENSEVOICE_INTER_THREADS   每个进程的 inter-op 线程数（默认: 1）
+    SENSEVOICE_CPUS            可用核心列表，如 "0-7,16-23"（默认: 当前进程可用的全部核心）
+    SENSEVOICE_WORKERS         本机同类进程总数，用于划分核心（默认: 1）
+    SENSEVOICE_WORKER_INDEX    本进程序号，从 0 开始（默认: 0）
+    SENSEVOICE_PIN_CPUS        设为 1 时把本进程绑定到分到的核心上
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+from audio_utils import MODEL_SAMPLE_RATE
+
+
+def parse_cpu_list(text):
+    """解析 "0-3,8,10-11" 形式的核心列表"""
+    cpus = set()
+    for part in text.replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus):
+    """把核心列表格式化为 "0-3,8" 形式"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{a}-{b}" if a != b else str(a) for a, b in ranges)
+
+
+def available_cpus():
+    """当前进程可用的核心（受 taskset / cgroup 限制），不支持查询时按核心总数返回"""
+    configured = os.environ.get("SENSEVOICE_CPUS")
+    if configured:
+        return parse_cpu_list(configured)
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def cpu_count():
+    return len(available_cpus())
+
+
+# configure_worker 为本进程分配的核心及 intra-op 线程数（未调用时为 None）
+_worker_cpus = None
+_worker_intra = None
+
+
+def worker_cpus():
+    """本进程分到的核心；未调用 configure_worker 时为全部可用核心"""
+    return list(_worker_cpus) if _worker_cpus is not None else available_cpus()
+
+
+def partition_cpus(workers, cpus=None):
+    """把核心平均划分给 workers 个进程，返回互不重叠的核心列表；核心数不足时多个进程共用"""
+    cpus = available_cpus() if cpus is None else list(cpus)
+    workers = max(1, workers)
+    if workers > len(cpus):
+        return [[cpus[i % len(cpus)]] for i in range(workers)]
+    size, extra = divmod(len(cpus), workers)
+    parts, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        parts.append(cpus[start:end])
+        start = end
+    return parts
+
+
+def pin_to_cpus(cpus):
+    """把当前进程绑定到指定核心，平台不支持时返回 False"""
+    try:
+        os.sched_setaffinity(0, cpus)
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+# set_threads 请求的线程数；torch 尚未导入时由 apply_torch_threads 在导入后应用
+_requested_intra = None
+_requested_inter = None
+
+
+def set_threads(intra, inter=None):
+    """
+    设置 intra-op / inter-op 线程数
+
+    torch 尚未导入时 intra-op 通过 OMP_NUM_THREADS / MKL_NUM_THREADS 生效，inter-op 没有对应的环境变量，
+    记下后由 apply_torch_threads 在 torch 导入后设置；已导入时直接调用 torch 接口
+    """
+    global _requested_intra, _requested_inter
+    _requested_intra = max(1, int(intra))
+    os.environ["OMP_NUM_THREADS"] = str(_requested_intra)
+    os.environ["MKL_NUM_THREADS"] = str(_requested_intra)
+    if inter:
+        _requested_inter = max(1, int(inter))
+    apply_torch_threads()
+
+
+def apply_torch_threads():
+    """
+    torch 已导入时应用 set_threads 请求的线程数（加载模型、后台导入 torch 之后调用，未导入时不做任何事）
+
+    inter-op 线程池只能在首次并行计算前设置一次，之后的设置会被忽略
+    """
+    global _requested_inter
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
+    if _requested_intra:
+        torch.set_num_threads(_requested_intra)
+    if _requested_inter:
+        try:
+            torch.set_num_interop_threads(_requested_inter)
+        except RuntimeError:
+            pass
+        _requested_inter = None
+
+
+def intra_threads():
+    """当前进程的 intra-op 线程数（供 ONNX Runtime 等非 torch 后端及长音频并行识别使用）"""
+    if _worker_intra is not None:
+        return _worker_intra
+    configured = os.environ.get("SENSEVOICE_INTRA_THREADS") or os.environ.get("OMP_NUM_THREADS")
+    if configured:
+        return max(1, int(configured))
+    return len(worker_cpus())
+
+
+def configure_worker(index=0, workers=1, intra=None, inter=None, pin=False, cpus=None):
+    """
+    为第 index 个（共 workers 个）进程分配核心、设置线程数，可选绑定核心
+
+    单进程且未指定线程数时保持 torch 的默认线程配置
+
+    Returns:
+        {"index", "cpus", "intra_threads", "inter_threads", "pinned"}
+    """
+    global _worker_cpus, _worker_intra
+    assigned = partition_cpus(workers, cpus)[index % max(1, workers)]
+    explicit = bool(intra or inter) or workers > 1
+    intra = intra or len(assigned)
+    inter = inter or 1
+    pinned = pin_to_cpus(assigned) if pin else False
+    if explicit:
+        set_threads(intra, inter)
+    _worker_cpus = assigned
+    _worker_intra = intra if explicit else None
+    return {
+        "index": index,
+        "cpus": format_cpu_list(assigned),
+        "intra_threads": intra,
+        "inter_threads": inter,
+        "pinned": pinned,
+    }
+
+
+def configure_from_env():
+    """按环境变量配置当前进程（Web UI / HTTP 接口启动时调用，需在导入 torch 之前）"""
+    env = os.environ.get
+    config = configure_worker(
+        index=int(env("SENSEVOICE_WORKER_INDEX", "0")),
+        workers=int(env("SENSEVOICE_WORKERS", "1")),
+        intra=int(env("SENSEVOICE_INTRA_THREADS", "0")) or None,
+        inter=int(env("SENSEVOICE_INTER_THREADS", "0")) or None,
+        pin=env("SENSEVOICE_PIN_CPUS", "0") == "1",
+    )
+    return config
+
+
+def candidate_layouts(cpus=None):
+    """待测试的 进程数×线程数 组合：进程数取 1, 2, 4, ...，每个进程分到 核心数/进程数 个线程"""
+    total = cpu_count() if cpus is None else len(cpus)
+    layouts, workers = [], 1
+    while workers <= total:
+        layouts.append((workers, total // workers))
+        workers *= 2
+    return layouts
+
+
+# ---- 自动调优 ----
+
+_tune_model = None
+_tune_clips = None
+
+
+def _init_tune_worker(counter, workers, barrier, model_dir, model_name, backend, pattern, pin):
+    """调优工作进程：分配核心、加载模型并预热，全部就绪后一起开始计时"""
+    global _tune_model, _tune_clips
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    configure_worker(index, workers, pin=pin)
+
+    from benchmark import load_clips
+    from model_registry import get_registry
+
+    _tune_clips = [pcm for _, _, pcm, _ in load_clips(pattern)]
+    _tune_model = get_registry().load(model_dir, model_name, backend=backend)
+    with _tune_model.acquire() as model:
+        model.generate(input=_tune_clips[0])
+    barrier.wait()
+
+
+def _tune_request(i):
+    pcm = _tune_clips[i % len(_tune_clips)]
+    with _tune_model.acquire() as model:
+        model.generate(input=pcm)
+    return len(pcm) / float(MODEL_SAMPLE_RATE)
+
+
+def measure_layout(workers, model_dir, model_name, backend, pattern, requests, pin=True):
+    """用 workers 个进程并行识别 requests 段示例音频，返回每秒处理的音频秒数"""
+    ctx = multiprocessing.get_context("spawn")
+    counter = ctx.Value("i", 0)
+    barrier = ctx.Barrier(workers + 1)
+    pool = ctx.Pool(
+        workers,
+        initializer=_init_tune_worker,
+        initargs=(counter, workers, barrier, model_dir, model_name, backend, pattern, pin),
+    )
+    try:
+        barrier.wait()
+        start = time.perf_counter()
+        audio_seconds = sum(pool.map(_tune_request, range(requests), chunksize=1))
+        wall = time.perf_counter() - start
+    finally:
+        pool.terminate()
+        pool.join()
+    return audio_seconds / wall
+
+
+def tune(model_dir=None, model_name="small", backend=None, pattern=None, requests=None, pin=True):
+    """
+    逐个测试候选组合，返回按吞吐量从高到低排序的结果
+
+    每个组合的请求数相同（默认每个核心 4 段），以便比较总吞吐量
+    """
+    from benchmark import EXAMPLE_CLIPS
+
+    pattern = pattern or EXAMPLE_CLIPS
+    requests = requests or cpu_count() * 4
+    results = []
+    for workers, threads in candidate_layouts():
+        throughput = measure_layout(workers, model_dir, model_name, backend, pattern, requests, pin)
+        results.append({
+            "workers": workers,
+            "intra_threads": threads,
+            "audio_s_per_s": round(throughput, 3),
+        })
+        print(f"{workers:>3} 进程 × {threads:>3} 线程: {throughput:8.2f} 音频秒/秒")
+    results.sort(key=lambda r: r["audio_s_per_s"], reverse=True)
+    return results
+
+
+def main():
+    from backends import add_backend_argument
+    from model_registry import DEFAULT_MODEL_DIR
+
+    parser = argparse.ArgumentParser(description="SenseVoice CPU 线程与核心绑定")
+    parser.add_argument("--tune", action="store_true", help="测试不同的 进程数×线程数 组合，选出吞吐量最高的配置")
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default=DEFAULT_MODEL_DIR,
+        help=f"本地模型目录路径 (默认: {DEFAULT_MODEL_DIR})"
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="small",
+        choices=["small", "medium"],
+        help="模型大小 (默认: small)"
+    )
+    add_backend_argument(parser)
+    parser.add_argument("--clips", type=str, default=None, help="测试音频通配符 (默认: 模型自带示例)")
+    parser.add_argument("--requests", type=int, default=None, help="每个组合识别的音频段数 (默认: 核心数×4)")
+    parser.add_argument("--no_pin", action="store_true", help="调优时不绑定核心")
+    parser.add_argument("--output", type=str, default=None, help="调优结果 JSON 路径")
+    args = parser.parse_args()
+
+    cpus = available_cpus()
+    print(f"可用核心: {format_cpu_list(cpus)}（共 {len(cpus)} 个）")
+    if not args.tune:
+        print("候选组合: " + "  ".join(f"{w}×{t}" for w, t in candidate_layouts()))
+        return 0
+
+    results = tune(args.model_dir, args.model, args.backend, args.clips, args.requests, not args.no_pin)
+    best = results[0]
+    print("=" * 60)
+    print(f"最佳配置: {best['workers']} 个进程 × {best['intra_threads']} 线程 "
+          f"({best['audio_s_per_s']} 音频秒/秒)")
+    print("批量识别: python batch_transcribe.py ... "
+          f"--workers {best['workers']} --threads {best['intra_threads']} --pin_cpus")
+    print(f"多个 Web UI 进程: SENSEVOICE_WORKERS={best['workers']} SENSEVOICE_WORKER_INDEX=<序号> "
+          f"SENSEVOICE_INTRA_THREADS={best['intra_threads']} SENSEVOICE_PIN_CPUS=1")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"cpus": format_cpu_list(cpus), "layouts": results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -24,11 +24,15 @@ def get_resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 def check_model():
-    """检查模型是否存在"""
+    """检查模型是否存在且完整"""
+    from download_model import verify_model
     model_path = "./models/iic/SenseVoiceSmall"
-    if os.path.exists(model_path) and os.path.exists(os.path.join(model_path, "model.pt")):
-        return True, model_path
-    return False, None
+    if not os.path.exists(model_path):
+        return False, None
+    problems = verify_model(model_path)
+    for problem in problems:
+        print(f"模型文件不完整: {problem}")
+    return (False, None) if problems else (True, model_path)
 
 def download_model():
     """下载模型"""
@@ -70,7 +74,7 @@ def main():
     model_exists, model_path = check_model()
     
     if not model_exists:
-        print("检测到模型文件不存在")
+        print("检测到模型文件不存在或不完整")
         response = input("是否现在下载模型? (y/n): ")
         if response.lower() == 'y':
             if not download_model():
@@ -4,71 +4,515 @@
 SenseVoice 模型下载脚本
 支持下载 SenseVoiceSmall 和 SenseVoiceMedium 模型
 支持配置镜像源以加速下载
+
+大文件按范围分片并行下载，中断后从已下载的分片继续；每个文件按 .msc 清单校验大小和 SHA-256。
+下载源可以是 ModelScope、本地镜像目录（如共享盘上已下载好的 ./models）或 HTTP 服务（如对 ./models 运行
+python -m http.server），便于批量分发到多台机器或离线测试。
 """
 
 import os
+import sys
+import json
+import time
+import pickle
+import hashlib
 import argparse
-from modelscope.hub.snapshot_download import snapshot_download
+import threading
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# 模型映射
+MODEL_MAP = {
+    "small": "iic/SenseVoiceSmall",
+    "medium": "iic/SenseVoiceMedium"
+}
+
+# 下载源：本地镜像目录或 HTTP 地址（目录结构与 ./models 相同），默认从 ModelScope 下载
+MODEL_SOURCE = os.environ.get("SENSEVOICE_MODEL_SOURCE")
+
+# 并行下载的连接数
+DOWNLOAD_WORKERS = int(os.environ.get("SENSEVOICE_DOWNLOAD_WORKERS", "4"))
+
+# 超过该大小的文件拆成多个范围并行下载
+SPLIT_MIN_BYTES = 32 * 1024 * 1024
+
+# 读写块大小
+BLOCK_BYTES = 1024 * 1024
+
+# 网络超时（秒）与单个分片的重试次数
+TIMEOUT_S = 60
+RETRIES = 3
+
+# 清单文件（与 ModelScope 缓存格式兼容的 pickle 列表，额外记录 Size / Sha256）
+MANIFEST_FILE = ".msc"
+
+# 完整校验通过后记录各文件的 (大小, 修改时间, SHA-256)，启动时的快速检查据此跳过哈希计算
+VERIFIED_FILE = ".verified.json"
+
+# 启动前必须存在的文件
+REQUIRED_FILES = ("model.pt", "config.yaml")
+
+# 未拉取 LFS 对象时得到的指针文件
+LFS_POINTER_PREFIX = b"version https://git-lfs"
+
 
 # 配置 ModelScope 镜像源（如果需要）
 def setup_mirror():
     """配置 ModelScope 镜像源"""
     # 检查环境变量
     mirror_url = os.environ.get('MODELSCOPE_MIRROR')
-    
+
     if mirror_url:
         print(f"使用镜像源: {mirror_url}")
         # 设置 ModelScope 的镜像源
         os.environ['MODELSCOPE_ENVIRONMENT'] = 'cn'
         return mirror_url
-    
+
     # 如果没有设置，尝试使用默认的国内镜像
     # ModelScope 会自动检测并使用国内镜像（如果可用）
     return None
 
 
-def download_model(model_name="small", cache_dir="./models", use_mirror=False):
+# ---- 清单与校验 ----
+
+class _ManifestUnpickler(pickle.Unpickler):
+    """只允许列表 / 字典 / 字符串等基本类型，拒绝加载任意对象"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"清单中不允许的类型: {module}.{name}")
+
+
+def _normalize_entry(entry):
+    """把 ModelScope 文件信息 {"Path", "Size", "Sha256"} 转为 {"path", "size", "sha256"}"""
+    return {
+        "path": entry.get("Path") or entry.get("path"),
+        "size": entry.get("Size", entry.get("size")),
+        "sha256": entry.get("Sha256") or entry.get("sha256"),
+    }
+
+
+def parse_manifest(data):
+    """解析 .msc 内容，返回文件列表；无法解析（如 LFS 指针）时返回 None"""
+    if not data or data.startswith(LFS_POINTER_PREFIX):
+        return None
+    try:
+        import io
+        entries = _ManifestUnpickler(io.BytesIO(data)).load()
+    except Exception:
+        return None
+    if not isinstance(entries, list):
+        return None
+    files = [_normalize_entry(e) for e in entries if isinstance(e, dict)]
+    return [f for f in files if f["path"]]
+
+
+def read_manifest(model_dir):
+    """读取模型目录中的 .msc 清单，不存在或无法解析时返回 None"""
+    path = os.path.join(model_dir, MANIFEST_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        return parse_manifest(f.read())
+
+
+def write_manifest(model_dir, files, revision="master"):
+    """写入 .msc 清单（ModelScope 缓存只读取 Path / Revision，额外字段不影响其使用）"""
+    entries = [
+        {"Path": f["path"], "Revision": revision, "Size": f["size"], "Sha256": f["sha256"]}
+        for f in files
+    ]
+    with open(os.path.join(model_dir, MANIFEST_FILE), "wb") as f:
+        pickle.dump(entries, f, protocol=2)
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_BYTES), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def is_lfs_pointer(path):
+    """是否为 Git LFS 指针文件（几百字节的文本，而不是实际内容）"""
+    if os.path.getsize(path) > 1024:
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(LFS_POINTER_PREFIX)) == LFS_POINTER_PREFIX
+
+
+def _load_verified(model_dir):
+    try:
+        with open(os.path.join(model_dir, VERIFIED_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_verified(model_dir, verified):
+    with open(os.path.join(model_dir, VERIFIED_FILE), "w", encoding="utf-8") as f:
+        json.dump(verified, f, ensure_ascii=False, indent=2)
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def verify_model(model_dir, full=False):
+    """
+    检查模型目录，返回问题列表（为空表示通过）
+
+    快速检查（默认）：必需文件存在、不是 LFS 指针、大小与清单一致；文件自上次完整校验后未改动时视为哈希一致
+    完整检查（full=True）：重新计算所有文件的 SHA-256，通过后记录校验结果供快速检查使用
+    """
+    if not model_dir or not os.path.isdir(model_dir):
+        return [f"模型目录不存在: {model_dir}"]
+    problems = []
+    for name in REQUIRED_FILES:
+        path = os.path.join(model_dir, name)
+        if not os.path.isfile(path):
+            problems.append(f"缺少文件: {name}")
+        elif is_lfs_pointer(path):
+            problems.append(f"{name} 是 Git LFS 指针文件（{os.path.getsize(path)} 字节），不是实际模型文件")
+
+    files = read_manifest(model_dir) or []
+    verified = _load_verified(model_dir)
+    updated = False
+    for entry in files:
+        path = os.path.join(model_dir, entry["path"])
+        if not os.path.isfile(path):
+            problems.append(f"缺少文件: {entry['path']}")
+            continue
+        if entry["size"] is not None and os.path.getsize(path) != int(entry["size"]):
+            problems.append(f"{entry['path']} 大小不符: {os.path.getsize(path)} != {entry['size']}")
+            continue
+        if not entry["sha256"]:
+            continue
+        record = verified.get(entry["path"])
+        if not full and record and record[:2] == _stamp(path) and record[2] == entry["sha256"]:
+            continue
+        if not full:
+            # 快速检查不计算哈希，大小一致即可
+            continue
+        if file_sha256(path) != entry["sha256"]:
+            problems.append(f"{entry['path']} SHA-256 校验失败")
+            verified.pop(entry["path"], None)
+        else:
+            verified[entry["path"]] = _stamp(path) + [entry["sha256"]]
+        updated = True
+    if updated:
+        _save_verified(model_dir, verified)
+    return problems
+
+
+# ---- 下载源 ----
+
+class HttpSource:
+    """HTTP 下载源，目录结构与 ./models 相同：{base}/{model_id}/{文件}"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def url(self, model_id, path, revision):
+        return f"{self.base_url}/{model_id}/{urllib.parse.quote(path)}"
+
+    def manifest(self, model_id, revision):
+        with urllib.request.urlopen(self.url(model_id, MANIFEST_FILE, revision), timeout=TIMEOUT_S) as resp:
+            files = parse_manifest(resp.read())
+        if files is None:
+            raise RuntimeError(f"无法解析清单: {self.url(model_id, MANIFEST_FILE, revision)}")
+        return files
+
+    def read_range(self, model_id, path, revision, start, end):
+        """读取 [start, end) 字节（end 为 None 时读到文件末尾），逐块返回；服务端不支持 Range 时跳过前面的数据"""
+        headers = {}
+        if end is not None:
+            headers["Range"] = f"bytes={start}-{end - 1}"
+        elif start:
+            headers["Range"] = f"bytes={start}-"
+        request = urllib.request.Request(self.url(model_id, path, revision), headers=headers)
+        with urllib.request.urlopen(request, timeout=TIMEOUT_S) as resp:
+            skip = start if resp.status == 200 else 0
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                block = resp.read(BLOCK_BYTES if remaining is None else min(BLOCK_BYTES, remaining + skip))
+                if not block:
+                    break
+                if skip:
+                    dropped = min(skip, len(block))
+                    block, skip = block[dropped:], skip - dropped
+                if remaining is not None:
+                    block = block[:remaining]
+                    remaining -= len(block)
+                if block:
+                    yield block
+
+
+class ModelScopeSource(HttpSource):
+    """ModelScope 下载源，文件列表（含 SHA-256）来自 ModelScope 接口"""
+
+    def __init__(self):
+        endpoint = os.environ.get("MODELSCOPE_DOMAIN", "www.modelscope.cn")
+        if not endpoint.startswith("http"):
+            endpoint = "https://" + endpoint
+        super().__init__(endpoint)
+
+    def url(self, model_id, path, revision):
+        query = urllib.parse.urlencode({"Revision": revision, "FilePath": path})
+        return f"{self.base_url}/api/v1/models/{model_id}/repo?{query}"
+
+    def manifest(self, model_id, revision):
+        from modelscope.hub.api import HubApi
+        entries = HubApi().get_model_files(model_id, revision=revision, recursive=True)
+        return [_normalize_entry(e) for e in entries if e.get("Type", "blob") == "blob"]
+
+
+class DirSource:
+    """本地镜像目录下载源，目录结构与 ./models 相同：{root}/{model_id}/{文件}"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def manifest(self, model_id, revision):
+        model_dir = os.path.join(self.root, model_id)
+        files = read_manifest(model_dir)
+        if files is not None:
+            return files
+        # 镜像目录没有清单时按现有文件计算（信任该目录）
+        print(f"镜像目录没有 {MANIFEST_FILE} 清单，按现有文件计算校验值: {model_dir}")
+        files = []
+        for dirpath, _, names in os.walk(model_dir):
+            for name in sorted(names):
+                if name in (MANIFEST_FILE, VERIFIED_FILE) or ".part" in name:
+                    continue
+                full = os.path.join(dirpath, name)
+                files.append({"path": os.path.relpath(full, model_dir).replace(os.sep, "/"),
+                              "size": os.path.getsize(full), "sha256": file_sha256(full)})
+        return files
+
+    def read_range(self, model_id, path, revision, start, end):
+        with open(os.path.join(self.root, model_id, path), "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                block = f.read(BLOCK_BYTES if remaining is None else min(BLOCK_BYTES, remaining))
+                if not block:
+                    break
+                if remaining is not None:
+                    remaining -= len(block)
+                yield block
+
+
+def make_source(source=None):
+    """按 source（或环境变量 SENSEVOICE_MODEL_SOURCE）创建下载源：HTTP 地址、本地目录，默认 ModelScope"""
+    source = source or MODEL_SOURCE
+    if not source:
+        return ModelScopeSource()
+    if source.startswith(("http://", "https://")):
+        return HttpSource(source)
+    if os.path.isdir(source):
+        return DirSource(source)
+    raise ValueError(f"下载源不存在: {source}")
+
+
+# ---- 分片并行下载 ----
+
+def split_ranges(size, parts):
+    """把 [0, size) 分成 parts 个连续范围；空文件为 [(0, 0)]，大小未知时为 [(0, None)]（整个文件一次请求）"""
+    if size is None:
+        return [(0, None)]
+    if size <= 0:
+        return [(0, 0)]
+    parts = max(1, min(parts, size // BLOCK_BYTES or 1))
+    step = -(-size // parts)
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+
+class _Progress:
+    """已下载字节数统计，定期打印速度"""
+
+    def __init__(self, total, already=0):
+        self.total = total
+        self.done = already
+        self.started = time.time()
+        self.base = already
+        self._lock = threading.Lock()
+        self._printed = 0.0
+
+    def add(self, n):
+        with self._lock:
+            self.done += n
+            now = time.time()
+            if now - self._printed < 1.0 and self.done < self.total:
+                return
+            self._printed = now
+        speed = (self.done - self.base) / max(now - self.started, 1e-6) / 1024 / 1024
+        percent = self.done * 100.0 / self.total if self.total else 100.0
+        sys.stdout.write(f"\r已下载 {self.done / 1024 / 1024:8.1f} / {self.total / 1024 / 1024:.1f} MB "
+                         f"({percent:5.1f}%)  {speed:6.2f} MB/s")
+        sys.stdout.flush()
+
+
+def _part_path(target, index):
+    return f"{target}.part{index}"
+
+
+def _fetch_part(source, model_id, revision, entry, target, index, start, end, progress):
+    """下载一个范围到 .partN 文件，已有部分跳过；失败时重试。end 为 None（大小未知）时读到服务端结束为止"""
+    part = _part_path(target, index)
+    # 空文件也要有分片文件，供 _assemble 拼接
+    open(part, "ab").close()
+    for attempt in range(RETRIES):
+        have = os.path.getsize(part)
+        if end is not None and have > end - start:
+            # 分片比预期大（范围划分变化），重新下载
+            os.remove(part)
+            open(part, "ab").close()
+            have = 0
+        if end is not None and have == end - start:
+            return
+        try:
+            with open(part, "ab") as f:
+                for block in source.read_range(model_id, entry["path"], revision, start + have, end):
+                    f.write(block)
+                    progress.add(len(block))
+            if end is None or os.path.getsize(part) == end - start:
+                return
+        except OSError as e:
+            if attempt == RETRIES - 1:
+                raise RuntimeError(f"下载失败: {entry['path']} ({e})")
+            time.sleep(2 ** attempt)
+    raise RuntimeError(f"下载不完整: {entry['path']}")
+
+
+def _assemble(target, ranges, entry):
+    """按顺序拼接分片并计算 SHA-256，校验通过后原子替换目标文件"""
+    h = hashlib.sha256()
+    tmp = target + ".tmp"
+    with open(tmp, "wb") as out:
+        for index in range(len(ranges)):
+            with open(_part_path(target, index), "rb") as f:
+                for block in iter(lambda: f.read(BLOCK_BYTES), b""):
+                    h.update(block)
+                    out.write(block)
+    for index in range(len(ranges)):
+        os.remove(_part_path(target, index))
+    if entry["sha256"] and h.hexdigest() != entry["sha256"]:
+        os.remove(tmp)
+        raise RuntimeError(f"{entry['path']} SHA-256 校验失败，已删除，请重新下载")
+    os.replace(tmp, target)
+    return h.hexdigest()
+
+
+def _file_ok(path, entry, verified):
+    """已存在且与清单一致的文件不再下载（大小未知时只比较哈希）"""
+    if not os.path.isfile(path) or (entry["size"] is not None and os.path.getsize(path) != entry["size"]):
+        return False
+    record = verified.get(entry["path"])
+    if record and record[:2] == _stamp(path) and record[2] == entry["sha256"]:
+        return True
+    return not entry["sha256"] or file_sha256(path) == entry["sha256"]
+
+
+def provision(model_id, cache_dir="./models", source=None, workers=DOWNLOAD_WORKERS, revision="master"):
+    """
+    下载（或从镜像复制）模型到 cache_dir/model_id，返回模型目录
+
+    已完整且校验通过的文件跳过；未完成的文件从 .partN 分片继续下载
+    """
+    source = make_source(source) if source is None or isinstance(source, str) else source
+    model_dir = os.path.join(cache_dir, model_id)
+    os.makedirs(model_dir, exist_ok=True)
+    files = [f for f in source.manifest(model_id, revision) if f["path"] not in (MANIFEST_FILE, VERIFIED_FILE)]
+    verified = _load_verified(model_dir)
+
+    pending = []
+    for entry in files:
+        # 清单中没有大小的文件整个一次请求下载，下载后按实际大小写入清单
+        entry["size"] = None if entry["size"] in (None, "") else int(entry["size"])
+        target = os.path.join(model_dir, entry["path"])
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if _file_ok(target, entry, verified):
+            verified[entry["path"]] = _stamp(target) + [entry["sha256"] or file_sha256(target)]
+            continue
+        parts = workers if (entry["size"] or 0) >= SPLIT_MIN_BYTES else 1
+        pending.append((entry, target, split_ranges(entry["size"], parts)))
+
+    total = sum(entry["size"] or 0 for entry, _, _ in pending)
+    already = sum(os.path.getsize(_part_path(target, i))
+                  for _, target, ranges in pending for i in range(len(ranges))
+                  if os.path.exists(_part_path(target, i)))
+    print(f"共 {len(files)} 个文件，需下载 {len(pending)} 个（{total / 1024 / 1024:.1f} MB，"
+          f"已下载 {already / 1024 / 1024:.1f} MB）")
+    progress = _Progress(total, already)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            entry["path"]: [
+                executor.submit(_fetch_part, source, model_id, revision, entry, target, i, start, end, progress)
+                for i, (start, end) in enumerate(ranges)
+            ]
+            for entry, target, ranges in pending
+        }
+        for entry, target, ranges in pending:
+            for future in futures[entry["path"]]:
+                future.result()
+            digest = _assemble(target, ranges, entry)
+            verified[entry["path"]] = _stamp(target) + [digest]
+    if pending:
+        print()
+
+    for entry in files:
+        entry["sha256"] = entry["sha256"] or verified[entry["path"]][2]
+        if entry["size"] is None:
+            entry["size"] = verified[entry["path"]][0]
+    write_manifest(model_dir, files, revision)
+    _save_verified(model_dir, verified)
+    return model_dir
+
+
+def download_model(model_name="small", cache_dir="./models", use_mirror=False, source=None,
+                   workers=DOWNLOAD_WORKERS):
     """
     下载 SenseVoice 模型
-    
+
     Args:
         model_name: 模型大小，可选 "small" 或 "medium"
         cache_dir: 模型缓存目录
         use_mirror: 是否使用镜像源
+        source: 下载源（本地镜像目录或 HTTP 地址），默认取环境变量 SENSEVOICE_MODEL_SOURCE，未设置时从 ModelScope 下载
+        workers: 并行下载的连接数
     """
     # 配置镜像源
     if use_mirror:
         setup_mirror()
-    
-    # 模型映射
-    model_map = {
-        "small": "iic/SenseVoiceSmall",
-        "medium": "iic/SenseVoiceMedium"
-    }
-    
-    if model_name not in model_map:
+
+    if model_name not in MODEL_MAP:
         print(f"错误: 不支持的模型名称 '{model_name}'")
-        print(f"支持的模型: {', '.join(model_map.keys())}")
+        print(f"支持的模型: {', '.join(MODEL_MAP.keys())}")
         return None
-    
-    model_id = model_map[model_name]
-    
+
+    model_id = MODEL_MAP[model_name]
+
     print(f"开始下载模型: {model_id}")
     print(f"保存目录: {os.path.abspath(cache_dir)}")
+    if source or MODEL_SOURCE:
+        print(f"下载源: {source or MODEL_SOURCE}")
     if use_mirror:
         print("使用镜像源加速下载...")
-    print("这可能需要一些时间，请耐心等待...")
-    
+    print("这可能需要一些时间，请耐心等待（中断后重新运行会从断点继续）...")
+
     try:
         # 如果使用镜像，设置环境变量
         if use_mirror:
             os.environ['MODELSCOPE_ENVIRONMENT'] = 'cn'
-        
-        model_dir = snapshot_download(
-            model_id, 
-            cache_dir=cache_dir,
-            revision="master"
-        )
+
+        model_dir = provision(model_id, cache_dir, source, workers)
+        problems = verify_model(model_dir)
+        if problems:
+            raise RuntimeError("；".join(problems))
         print(f"\n✓ 模型下载完成!")
         print(f"模型路径: {model_dir}")
         return model_dir
@@ -91,6 +535,9 @@ def download_model(model_name="small", cache_dir="./models", use_mirror=False):
             print("  https://www.modelscope.cn/models/iic/SenseVoiceMedium")
         print("\n  下载后解压到: ./models/iic/SenseVoiceSmall/")
         print("  详细说明请查看: 手动下载模型.md")
+        print("\n方法 4: 从其他机器复制")
+        print("  python download_model.py --model small --source /mnt/share/models")
+        print("  python download_model.py --model small --source http://<已下载模型的机器>:8000")
         print("\n" + "="*60)
         return None
 
@@ -98,8 +545,8 @@ def download_model(model_name="small", cache_dir="./models", use_mirror=False):
 def main():
     parser = argparse.ArgumentParser(description="下载 SenseVoice 模型")
     parser.add_argument(
-        "--model", 
-        type=str, 
+        "--model",
+        type=str,
         default="small",
         choices=["small", "medium"],
         help="要下载的模型大小 (默认: small)"
@@ -115,12 +562,37 @@ def main():
         action="store_true",
         help="使用国内镜像源加速下载（推荐在中国大陆使用）"
     )
-    
+    parser.add_argument(
+        "--source",
+        type=str,
+        default=None,
+        help="下载源：本地镜像目录或 HTTP 地址，目录结构与 ./models 相同 (默认: ModelScope)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DOWNLOAD_WORKERS,
+        help=f"并行下载的连接数 (默认: {DOWNLOAD_WORKERS})"
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="不下载，只按 .msc 清单完整校验已下载的模型（计算 SHA-256）"
+    )
+
     args = parser.parse_args()
-    
-    download_model(args.model, args.cache_dir, args.mirror)
 
+    if args.verify:
+        model_dir = os.path.join(args.cache_dir, MODEL_MAP[args.model])
+        problems = verify_model(model_dir, full=True)
+        for problem in problems:
+            print(f"✗ {problem}")
+        if not problems:
+            print(f"✓ 模型校验通过: {model_dir}")
+        return 1 if problems else 0
+
+    return 0 if download_model(args.model, args.cache_dir, args.mirror, args.source, args.workers) else 1
 
-if __name__ == "__main__":
-    main()
 
+if __name__ == "__main__":
+    exit(main())
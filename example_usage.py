@@ -2,15 +2,22 @@
 # -*- coding: utf-8 -*-
 """
 SenseVoice 使用示例
-支持音频文件的语音识别
+支持音频文件的语音识别，以及目录/通配符/清单文件的批量识别
 """
 
 import os
 import argparse
-from funasr import AutoModel
+from backends import add_backend_argument
+from model_registry import MODEL_MAP, add_pipeline_argument, get_registry, make_key, pipeline_key
+from batch_transcribe import add_batch_arguments, run_batch
+from audio_utils import MODEL_SAMPLE_RATE, load_audio
+from long_audio import LONG_AUDIO_SECONDS, transcribe_file, transcribe_long
+from chunked_reader import should_stream
+from silence_gate import gate
+from result_cache import get_cache
 
 
-def transcribe_audio(audio_path, model_dir=None, model_name="small"):
+def transcribe_audio(audio_path, model_dir=None, model_name="small", backend=None, pipeline=None):
     """
     转录音频文件
     
@@ -18,6 +25,9 @@ def transcribe_audio(audio_path, model_dir=None, model_name="small"):
         audio_path: 音频文件路径
         model_dir: 模型目录路径（如果为None，将自动下载）
         model_name: 模型名称，可选 "small" 或 "medium"
+        backend: 推理后端 "torch" / "int8" / "onnx"，默认取环境变量 SENSEVOICE_BACKEND
+        pipeline: 识别流程 "auto" / "asr" / "vad_asr" / "full"，默认取环境变量 SENSEVOICE_PIPELINE；
+            短音频只识别时不加载 VAD 和标点模型
     
     Returns:
         识别结果文本
@@ -26,46 +36,53 @@ def transcribe_audio(audio_path, model_dir=None, model_name="small"):
     if not os.path.exists(audio_path):
         raise FileNotFoundError(f"音频文件不存在: {audio_path}")
     
-    # 模型映射
-    model_map = {
-        "small": "iic/SenseVoiceSmall",
-        "medium": "iic/SenseVoiceMedium"
-    }
-    
-    if model_name not in model_map:
+    if model_name not in MODEL_MAP:
         raise ValueError(f"不支持的模型名称: {model_name}")
     
-    model_id = model_map[model_name]
+    model_id = MODEL_MAP[model_name]
     
     print(f"加载模型: {model_id}")
     if model_dir:
         print(f"使用本地模型: {model_dir}")
     
-    # 初始化模型
     # 如果提供了 model_dir，使用本地模型；否则自动下载
-    if model_dir and os.path.exists(model_dir):
-        model = AutoModel(
-            model=model_dir,
-            device="cpu",  # 使用 CPU，如果有 GPU 可改为 "cuda"
-            vad_model="fsmn-vad",
-            punc_model="ct-punc",
-        )
-    else:
-        model = AutoModel(
-            model=model_id,
-            device="cpu",
-            vad_model="fsmn-vad",
-            punc_model="ct-punc",
-        )
+    # 使用 CPU，如果有 GPU 可将 device 改为 "cuda"
+    key = make_key(model_dir, model_name, device="cpu", backend=backend)
+    print(f"推理后端: {key.backend}")
     
     print(f"正在识别音频: {audio_path}")
     
-    # 执行识别
-    result = model.generate(input=audio_path)
+    if should_stream(audio_path):
+        # 大文件分块读取识别，不一次性解码到内存
+        key, generate_kwargs = pipeline_key(key, pipeline)
+        result = transcribe_file(audio_path, key, generate_kwargs=generate_kwargs)
+    else:
+        # 整段静音不送入模型，首尾长静音裁掉后再识别
+        pcm, _, silence = gate(load_audio(audio_path))
+        if silence is not None and silence["empty"]:
+            print("音频中没有检测到语音")
+            return ""
+        if silence is not None and silence["skipped_ratio"]:
+            print(f"裁掉首尾静音 {silence['skipped_ratio'] * 100:.1f}%")
+        key, generate_kwargs = pipeline_key(key, pipeline, len(pcm) / float(MODEL_SAMPLE_RATE))
+        print(f"识别流程: {'VAD+' if key.vad_model else ''}识别{'+标点' if key.punc_model else ''}")
+        
+        # 执行识别（相同音频 + 相同模型配置直接返回缓存结果）
+        def run(pcm):
+            if len(pcm) > LONG_AUDIO_SECONDS * MODEL_SAMPLE_RATE:
+                # 长音频总是按 VAD 分段并行识别
+                return transcribe_long(pcm, key, generate_kwargs=generate_kwargs)
+            # 从注册表获取模型，同一进程内重复调用不会重新加载
+            with get_registry().get_pool(key).acquire() as model:
+                result = model.generate(input=pcm, **generate_kwargs)
+            return result[0] if result else None
+        
+        cache = get_cache()
+        result = cache.get_or_compute(pcm, key, run, **generate_kwargs) if cache else run(pcm)
     
     # 提取文本结果
-    if result and len(result) > 0:
-        text = result[0].get("text", "")
+    if result:
+        text = result.get("text", "")
         return text
     else:
         return "识别失败，未返回结果"
@@ -76,8 +93,8 @@ def main():
     parser.add_argument(
         "--audio_path",
         type=str,
-        required=True,
-        help="音频文件路径"
+        default=None,
+        help="音频文件路径（单文件模式）"
     )
     parser.add_argument(
         "--model_dir",
@@ -92,14 +109,42 @@ def main():
         choices=["small", "medium"],
         help="模型大小 (默认: small)"
     )
+    add_backend_argument(parser)
+    add_pipeline_argument(parser)
+    add_batch_arguments(parser)
     
     args = parser.parse_args()
     
+    if args.inputs or args.manifest:
+        ok, failed, skipped = run_batch(
+            inputs=args.inputs,
+            manifest=args.manifest,
+            output=args.output,
+            fmt=args.format,
+            workers=args.workers,
+            model_dir=args.model_dir,
+            model_name=args.model,
+            resume=not args.no_resume,
+            cache_db=args.cache_db,
+            backend=args.backend,
+            threads=args.threads,
+            inter_threads=args.inter_threads,
+            pin_cpus=args.pin_cpus,
+            pipeline=args.pipeline,
+            share_weights=args.share_weights,
+        )
+        return 1 if failed else 0
+    
+    if not args.audio_path:
+        parser.error("需要提供 --audio_path，或使用 --inputs / --manifest 进行批量识别")
+    
     try:
         result = transcribe_audio(
             args.audio_path,
             model_dir=args.model_dir,
-            model_name=args.model
+            model_name=args.model,
+            backend=args.backend,
+            pipeline=args.pipeline
         )
         
         print("\n" + "="*50)
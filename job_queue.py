@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 后台识别任务
+提交音频后立即返回任务 ID，由有界线程池按音频时长优先（短音频先处理）执行；
+任务状态、进度和结果保存在 SQLite 中，服务重启后未完成的任务自动重新排队
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import sqlite3
+import itertools
+import threading
+
+from micro_batcher import estimate_duration
+from result_cache import _json_default
+
+
+# 任务数据目录（SQLite 文件和待处理的上传文件）
+JOB_DIR = os.environ.get("SENSEVOICE_JOB_DIR", "./jobs")
+
+# 同时执行的任务数
+JOB_WORKERS = int(os.environ.get("SENSEVOICE_JOB_WORKERS", "2"))
+
+# 最多排队的任务数，超出时拒绝提交
+JOB_MAX_QUEUE = int(os.environ.get("SENSEVOICE_JOB_MAX_QUEUE", "100"))
+
+# 已结束任务的保留天数
+JOB_RETENTION_DAYS = float(os.environ.get("SENSEVOICE_JOB_RETENTION_DAYS", "7"))
+
+# 进度写入数据库的最小间隔（秒），查询时优先返回内存中的最新进度
+PROGRESS_INTERVAL_S = 1.0
+
+FINAL_STATES = ("finished", "failed", "cancelled")
+
+STATUS_TEXT = {
+    "queued": "排队中",
+    "running": "识别中",
+    "finished": "已完成",
+    "failed": "失败",
+    "cancelled": "已取消",
+}
+
+
+class QueueFull(Exception):
+    """排队任务数已达上限"""
+
+
+class JobStore:
+    """任务状态的 SQLite 存储"""
+
+    COLUMNS = ("job_id", "group_id", "filename", "path", "status", "duration", "done", "total",
+               "result", "error", "created_at", "started_at", "finished_at", "options")
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, group_id TEXT, filename TEXT, path TEXT, "
+            "status TEXT NOT NULL, duration REAL, done INTEGER NOT NULL DEFAULT 0, total INTEGER, "
+            "result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "options TEXT)"
+        )
+        # 旧版本创建的数据库没有 options 列
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "options" not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN options TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_group ON jobs(group_id)")
+        self._db.commit()
+
+    def _to_dict(self, row):
+        job = dict(zip(self.COLUMNS, row))
+        if job["result"]:
+            job["result"] = json.loads(job["result"])
+        job["options"] = json.loads(job["options"]) if job["options"] else {}
+        return job
+
+    def add(self, job):
+        if job.get("options") is not None:
+            job = dict(job, options=json.dumps(job["options"], ensure_ascii=False))
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO jobs ({', '.join(job)}) VALUES ({', '.join('?' * len(job))})",
+                tuple(job.values()),
+            )
+            self._db.commit()
+
+    def update(self, job_id, **fields):
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False, default=_json_default)
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE job_id = ?",
+                tuple(fields.values()) + (job_id,),
+            )
+            self._db.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def group(self, group_id):
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE group_id = ? ORDER BY created_at",
+                (group_id,),
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def unfinished(self):
+        """未结束的任务（重启后需要重新排队）"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs "
+                "WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def purge(self, before):
+        """删除 before 之前结束的任务"""
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (before,)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def counts(self):
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class JobQueue:
+    """
+    后台任务队列
+
+    Args:
+        run: 执行函数 run(音频路径, progress, **options)，返回识别结果字典；progress(已完成段数, 总段数)，
+             options 为提交时的识别选项
+        job_dir: 数据目录，保存 jobs.db 和待处理的上传文件
+        workers: 同时执行的任务数
+        max_queue: 最多排队的任务数
+    """
+
+    def __init__(self, run, job_dir=JOB_DIR, workers=JOB_WORKERS, max_queue=JOB_MAX_QUEUE):
+        self.run = run
+        self.max_queue = max_queue
+        self.job_dir = job_dir
+        self.upload_dir = os.path.join(job_dir, "uploads")
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self.store = JobStore(os.path.join(job_dir, "jobs.db"))
+        self._queue = queue.PriorityQueue()
+        # 仍在排队的任务 ID；取消的任务留在 _queue 中直到被取出时丢弃，不计入排队数
+        self._queued = set()
+        self._seq = itertools.count()
+        self._progress = {}
+        self._lock = threading.Lock()
+
+        self.store.purge(time.time() - JOB_RETENTION_DAYS * 86400)
+        self.recovered = self._recover()
+        self._threads = [
+            threading.Thread(target=self._loop, name=f"job-{i}", daemon=True) for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _enqueue(self, job_id, duration):
+        # 时长短的先处理；时长相同按提交顺序
+        with self._lock:
+            self._queued.add(job_id)
+        self._queue.put((duration or 0.0, next(self._seq), job_id))
+
+    def queue_depth(self):
+        """排队中（未取消、未开始）的任务数"""
+        with self._lock:
+            return len(self._queued)
+
+    def _recover(self):
+        """把上次运行中断的任务重新排队，从头开始识别"""
+        jobs = self.store.unfinished()
+        for job in jobs:
+            if not job["path"] or not os.path.exists(job["path"]):
+                self.store.update(job["job_id"], status="failed", error="上传文件已丢失",
+                                  finished_at=time.time())
+                continue
+            self.store.update(job["job_id"], status="queued", done=0, started_at=None)
+            self._enqueue(job["job_id"], job["duration"])
+        return len(jobs)
+
+    def submit(self, path, filename=None, group_id=None, move=False, options=None):
+        """
+        提交任务，返回任务 ID
+
+        音频复制（move 为 True 时移动）到任务目录，确保服务重启后仍可处理；
+        options 为传给执行函数的识别选项（如 {"pipeline": "asr"}），随任务一起保存
+        """
+        if self.queue_depth() >= self.max_queue:
+            raise QueueFull(f"排队任务已达上限 ({self.max_queue})，请稍后再试")
+        job_id = uuid.uuid4().hex
+        stored = os.path.join(self.upload_dir, job_id + os.path.splitext(path)[1])
+        if move:
+            shutil.move(path, stored)
+        else:
+            shutil.copyfile(path, stored)
+        duration = estimate_duration(stored)
+        self.store.add({
+            "job_id": job_id,
+            "group_id": group_id,
+            "filename": filename or os.path.basename(path),
+            "path": stored,
+            "status": "queued",
+            "duration": round(duration, 3),
+            "done": 0,
+            "created_at": time.time(),
+            "options": {k: v for k, v in (options or {}).items() if v is not None},
+        })
+        self._enqueue(job_id, duration)
+        return job_id
+
+    def get(self, job_id):
+        """查询任务，运行中的任务附带内存中的最新进度"""
+        job = self.store.get(job_id)
+        if job is not None:
+            with self._lock:
+                progress = self._progress.get(job_id)
+            if progress is not None:
+                job["done"], job["total"] = progress
+            job["queue_position"] = self.position(job_id) if job["status"] == "queued" else None
+        return job
+
+    def group(self, group_id):
+        return [self.get(job["job_id"]) for job in self.store.group(group_id)]
+
+    def position(self, job_id):
+        """排队位置（从 1 开始），不在队列中时返回 None"""
+        with self._queue.mutex:
+            ordered = sorted(self._queue.queue)
+        with self._lock:
+            ordered = [queued_id for _, _, queued_id in ordered if queued_id in self._queued]
+        for i, queued_id in enumerate(ordered, 1):
+            if queued_id == job_id:
+                return i
+        return None
+
+    def cancel(self, job_id):
+        """取消排队中的任务，已开始的任务不能取消"""
+        job = self.store.get(job_id)
+        if job is None or job["status"] != "queued":
+            return False
+        with self._lock:
+            # 与 _loop 取出任务互斥：已被工作线程取走的任务不能再取消
+            if job_id not in self._queued:
+                return False
+            self._queued.discard(job_id)
+        self.store.update(job_id, status="cancelled", finished_at=time.time())
+        self._remove_upload(job)
+        return True
+
+    def stats(self):
+        counts = self.store.counts()
+        counts["queue_depth"] = self.queue_depth()
+        return counts
+
+    def _remove_upload(self, job):
+        try:
+            os.remove(job["path"])
+        except OSError:
+            pass
+
+    def _loop(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            with self._lock:
+                if job_id not in self._queued:
+                    # 已取消
+                    continue
+                self._queued.discard(job_id)
+            job = self.store.get(job_id)
+            if job is None or job["status"] != "queued":
+                continue
+            self._execute(job)
+
+    def _execute(self, job):
+        job_id = job["job_id"]
+        self.store.update(job_id, status="running", started_at=time.time(), done=0, total=None)
+        last_write = [0.0]
+
+        def progress(done, total):
+            with self._lock:
+                self._progress[job_id] = (done, total)
+            now = time.time()
+            if now - last_write[0] >= PROGRESS_INTERVAL_S:
+                last_write[0] = now
+                self.store.update(job_id, done=done, total=total)
+
+        try:
+            result = self.run(job["path"], progress, **job["options"])
+            if not result:
+                raise RuntimeError("识别失败，未返回结果")
+            with self._lock:
+                done, total = self._progress.get(job_id, (1, 1))
+            total = total or done or 1
+            self.store.update(job_id, status="finished", result=result, done=total, total=total,
+                              finished_at=time.time())
+        except Exception as e:
+            self.store.update(job_id, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._progress.pop(job_id, None)
+            self._remove_upload(job)
+
+
+def format_job(job):
+    """任务状态的一行描述，用于界面展示"""
+    if job is None:
+        return "任务不存在"
+    text = f"任务 {job['job_id']}  {STATUS_TEXT.get(job['status'], job['status'])}"
+    if job["status"] == "queued" and job.get("queue_position"):
+        text += f"，前面还有 {job['queue_position'] - 1} 个任务"
+    elif job["status"] == "running":
+        total = job.get("total")
+        text += f"，已完成 {job['done']}/{total if total else '?'} 段"
+    elif job["status"] == "failed":
+        text += f": {job['error']}"
+    if job.get("duration"):
+        text += f"（音频约 {job['duration']:.0f} 秒）"
+    return text
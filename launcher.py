@@ -10,6 +10,7 @@ import sys
 import subprocess
 import webbrowser
 import time
+import socket
 import threading
 from pathlib import Path
 
@@ -25,11 +26,19 @@ def get_resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 def check_model():
-    """检查模型是否存在"""
-    model_path = "./models/iic/SenseVoiceSmall"
-    if os.path.exists(model_path) and os.path.exists(os.path.join(model_path, "model.pt")):
-        return True, model_path
-    return False, None
+    """检查模型是否存在且完整（大小与 .msc 清单一致、不是 Git LFS 指针文件）"""
+    from model_registry import DEFAULT_MODEL_DIR
+    from download_model import verify_model
+    model_path = DEFAULT_MODEL_DIR
+    if not os.path.exists(model_path):
+        return False, None
+    problems = verify_model(model_path)
+    if problems:
+        print("⚠️  模型文件不完整:")
+        for problem in problems:
+            print(f"   - {problem}")
+        return False, None
+    return True, model_path
 
 def download_model():
     """下载模型"""
@@ -57,9 +66,20 @@ def download_model():
         print("请检查网络连接后重试")
         return False
 
+def wait_for_port(host="127.0.0.1", port=7860, timeout=60):
+    """等待服务开始监听端口，超时返回 False"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
 def open_browser():
-    """延迟打开浏览器"""
-    time.sleep(3)  # 等待服务启动
+    """服务开始监听后打开浏览器"""
+    wait_for_port()
     try:
         webbrowser.open('http://localhost:7860')
         print("\n✓ 浏览器已自动打开")
@@ -67,7 +87,7 @@ def open_browser():
         print(f"\n无法自动打开浏览器: {e}")
         print("请手动访问: http://localhost:7860")
 
-def start_webui():
+def start_webui(model_path=None):
     """启动 Web UI"""
     print("\n" + "=" * 60)
     print("正在启动 SenseVoice Web 界面...")
@@ -81,9 +101,9 @@ def start_webui():
     browser_thread.start()
     
     try:
-        # 导入并启动 webui
+        # 导入并启动 webui，模型在后台预加载并预热，加载完成前的请求排队等待
         from webui import main
-        main()
+        main(preload_dir=model_path)
     except KeyboardInterrupt:
         print("\n\n程序已停止")
     except Exception as e:
@@ -103,7 +123,7 @@ def main():
     model_exists, model_path = check_model()
     
     if not model_exists:
-        print("⚠️  检测到模型文件不存在")
+        print("⚠️  检测到模型文件不存在或不完整")
         print()
         print("首次使用需要下载模型文件（约 900MB）")
         print("需要网络连接，下载时间取决于网速")
@@ -133,7 +153,7 @@ def main():
     print()
     
     # 启动 Web UI
-    start_webui()
+    start_webui(model_path or check_model()[1])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 长音频并行识别
+先用 fsmn-vad 切分语音段，再用线程池或进程池并行识别各段，最后按时间顺序拼接文本和时间戳；
+大文件可分块读取、增量 VAD，峰值内存与文件时长无关
+"""
+
+import os
+import time
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_utils import MODEL_SAMPLE_RATE, load_audio
+from backends import add_backend_argument
+from cpu_tuning import configure_worker, intra_threads, worker_cpus
+from chunked_reader import iter_audio_windows
+from memory_stats import peak_rss_mb, reset_peak_rss
+from model_registry import ModelKey, asr_only, get_registry, make_key
+from pcm_transport import PcmHandle, PcmRing, open_pcm, slice_handle
+
+
+# 合并后单段最长时长（毫秒），与 funasr 默认的 max_single_segment_time 一致
+MAX_SEGMENT_MS = 30000
+
+# 超过该时长（秒）的音频在 Web 界面中走并行识别
+LONG_AUDIO_SECONDS = float(os.environ.get("SENSEVOICE_LONG_AUDIO_S", "600"))
+
+# 分块识别时每次送入 VAD 的音频长度（毫秒）
+VAD_WINDOW_MS = 1000
+
+# 进程池工作进程内的识别模型及 generate 参数
+_worker_model = None
+_worker_kwargs = {}
+
+
+# 默认并行度上限：线程方式下每个并行线程占一份模型副本
+MAX_DEFAULT_WORKERS = 4
+
+
+def default_workers():
+    """默认并行度：本进程分到的核心数的一半（见 cpu_tuning.configure_worker），至少 1，至多 MAX_DEFAULT_WORKERS"""
+    return max(1, min(len(worker_cpus()) // 2, MAX_DEFAULT_WORKERS))
+
+
+def set_torch_threads(n):
+    """设置 torch 的 intra-op 线程数，返回原值；未安装 torch 时返回 None"""
+    try:
+        import torch
+    except ImportError:
+        return None
+    previous = torch.get_num_threads()
+    torch.set_num_threads(max(1, int(n)))
+    return previous
+
+
+def vad_segments(pcm, device="cpu", max_segment_ms=MAX_SEGMENT_MS):
+    """运行 fsmn-vad，返回语音段列表 [(开始毫秒, 结束毫秒), ...]"""
+    pool = get_registry().get_pool(ModelKey("fsmn-vad", None, None, device))
+    with pool.acquire() as vad:
+        res = vad.generate(input=pcm, max_single_segment_time=max_segment_ms)
+    if not res:
+        return []
+    return [(int(beg), int(end)) for beg, end in res[0].get("value", [])]
+
+
+def merge_segments(segments, max_ms=MAX_SEGMENT_MS):
+    """把相邻的短语音段合并到不超过 max_ms，减少调用次数"""
+    merged = []
+    for beg, end in segments:
+        if merged and end - merged[-1][0] <= max_ms:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((beg, end))
+    return merged
+
+
+def _slice(pcm, beg_ms, end_ms):
+    return pcm[beg_ms * MODEL_SAMPLE_RATE // 1000:end_ms * MODEL_SAMPLE_RATE // 1000]
+
+
+def _init_process_worker(asr_key, threads, generate_kwargs=None):
+    """进程池初始化：设置线程数并加载仅识别（无 VAD/标点）的模型"""
+    global _worker_model, _worker_kwargs
+    set_torch_threads(threads)
+    from backends import build_model
+    _worker_model = build_model(asr_key)
+    _worker_kwargs = generate_kwargs or {}
+
+
+def _decode_in_process(segment):
+    if isinstance(segment, PcmHandle):
+        # 直接读取父进程写入共享内存的波形，不复制
+        segment = open_pcm(segment)
+    res = _worker_model.generate(input=segment, **_worker_kwargs)
+    return dict(res[0]) if res else {}
+
+
+def _decoder(pool, generate_kwargs):
+    """线程池中识别单段的函数：每次调用从模型池取出一个副本独占使用"""
+    def decode(segment):
+        with pool.acquire() as model:
+            res = model.generate(input=segment, **generate_kwargs)
+        return res[0] if res else {}
+    return decode
+
+
+def decoded_segment(beg, end, item):
+    """
+    单段识别结果 {"start", "end", "text"}（毫秒）
+
+    模型输出词级时间戳（generate 传 output_timestamp=True）时附带 "timestamp" / "words"，
+    时间换算为在整段音频中的毫秒
+    """
+    segment = {"start": beg, "end": end, "text": item.get("text", "") if item else ""}
+    if item and item.get("timestamp"):
+        segment["timestamp"] = [[beg + int(s), beg + int(e)] for s, e in item["timestamp"]]
+        if item.get("words"):
+            segment["words"] = list(item["words"])
+    return segment
+
+
+def _assemble(texts, model_key, segments=None):
+    """按时间顺序拼接各段文本，有标点模型时对整段文本加标点；segments 为 None 时结果中不带各段"""
+    result = {"text": "".join(texts)}
+    if segments is not None:
+        result["segments"] = segments
+
+    if model_key.punc_model and result["text"]:
+        punc_pool = get_registry().get_pool(ModelKey(model_key.punc_model, None, None, model_key.device))
+        with punc_pool.acquire() as punc:
+            res = punc.generate(input=result["text"])
+        if res:
+            result["text"] = res[0].get("text", result["text"])
+    return result
+
+
+def transcribe_long(pcm, model_key, workers=None, mode="thread", max_segment_ms=MAX_SEGMENT_MS,
+                    progress=None, generate_kwargs=None, on_segment=None):
+    """
+    长音频并行识别
+
+    Args:
+        pcm: 16kHz float32 单声道波形
+        model_key: 注册表键；其 vad_model 用于切分，punc_model 用于拼接后加标点
+        workers: 并行度，默认见 default_workers
+        mode: "thread"（每个线程独占长音频专用模型池中的一个副本）或 "process"（每个进程一份模型，波形经共享内存传给工作进程）
+        max_segment_ms: 合并后单段最长时长
+        progress: 进度回调 progress(已完成段数, 总段数)
+        generate_kwargs: 识别各段时额外的 generate 参数
+        on_segment: 每段识别完成后按时间顺序回调 on_segment(段结果)，用于边识别边写出字幕；
+            给出时各段交给回调后不再保留
+
+    Returns:
+        与 model.generate 单条结果同结构的字典；没有 on_segment 时额外包含按时间排序的 "segments"
+    """
+    workers = workers or default_workers()
+    generate_kwargs = generate_kwargs or {}
+
+    segments = merge_segments(vad_segments(pcm, model_key.device, max_segment_ms), max_segment_ms)
+    texts = []
+    kept = [] if on_segment is None else None
+
+    def report(item):
+        segment = decoded_segment(*segments[len(texts)], item)
+        texts.append(segment["text"])
+        if on_segment is not None:
+            on_segment(segment)
+        else:
+            kept.append(segment)
+        if progress is not None:
+            progress(len(texts), len(segments))
+
+    if progress is not None:
+        progress(0, len(segments))
+    if mode == "process":
+        # 整段波形写入共享内存一次，各段只向工作进程发送句柄，不再逐段 pickle 波形
+        ring = PcmRing(size_bytes=max(pcm.nbytes, 4))
+        whole = ring.put(pcm)
+        handles = [slice_handle(whole, beg * MODEL_SAMPLE_RATE // 1000, end * MODEL_SAMPLE_RATE // 1000)
+                   for beg, end in segments]
+        # 把本进程的 intra-op 线程数分给各工作进程，避免 workers × 全部核数 的过度订阅
+        threads = max(1, intra_threads() // workers)
+        ctx = multiprocessing.get_context("spawn")
+        try:
+            with ctx.Pool(workers, initializer=_init_process_worker,
+                          initargs=(asr_only(model_key), threads, generate_kwargs)) as pool:
+                for item in pool.imap(_decode_in_process, handles, chunksize=1):
+                    report(item)
+        finally:
+            ring.close()
+    else:
+        pieces = [_slice(pcm, beg, end) for beg, end in segments]
+        # 每段独占一个副本（funasr 的 generate 会修改实例上的参数，不能多线程共用一个实例）；
+        # intra-op 线程数在进程启动时由 cpu_tuning.configure_worker 设定，这里不再修改
+        decode = _decoder(get_registry().get_decode_pool(asr_only(model_key), workers), generate_kwargs)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for item in executor.map(decode, pieces):
+                report(item)
+
+    return _assemble(texts, model_key, kept)
+
+
+def iter_vad_segments(windows, device="cpu", max_segment_ms=MAX_SEGMENT_MS):
+    """
+    增量 VAD：逐窗口输入 16kHz 波形，语音段一结束就产出，只缓存尚未结束的语音段
+
+    Yields:
+        (开始毫秒, 结束毫秒, 该段波形)
+    """
+    pool = get_registry().get_pool(ModelKey("fsmn-vad", None, None, device))
+    step = VAD_WINDOW_MS * MODEL_SAMPLE_RATE // 1000
+    cache = {}
+    buffer = np.zeros(0, dtype=np.float32)
+    offset = 0          # buffer[0] 在整段音频中的采样点位置
+    fed = 0             # 已送入 VAD 的采样点数
+    total = 0
+    segment_start = None
+
+    def run_vad(chunk, is_final):
+        with pool.acquire() as vad:
+            res = vad.generate(input=chunk, cache=cache, is_final=is_final,
+                               chunk_size=VAD_WINDOW_MS, max_single_segment_time=max_segment_ms)
+        return res[0].get("value", []) if res else []
+
+    windows = iter(windows)
+    exhausted = False
+    while True:
+        if not exhausted and total - fed < step:
+            window = next(windows, None)
+            if window is None:
+                exhausted = True
+            else:
+                buffer = np.concatenate([buffer, window])
+                total += len(window)
+            continue
+        if exhausted and fed >= total:
+            break
+
+        end = min(fed + step, total)
+        is_final = exhausted and end == total
+        for beg_ms, end_ms in run_vad(buffer[fed - offset:end - offset], is_final):
+            if beg_ms >= 0:
+                segment_start = beg_ms * MODEL_SAMPLE_RATE // 1000
+            if end_ms >= 0 and segment_start is not None:
+                seg_end = min(end_ms * MODEL_SAMPLE_RATE // 1000, total)
+                begin = max(segment_start - offset, 0)
+                yield (segment_start * 1000 // MODEL_SAMPLE_RATE, end_ms,
+                       buffer[begin:seg_end - offset].copy())
+                segment_start = None
+        fed = end
+
+        # 丢弃已处理且不属于未结束语音段的音频，保留 2 秒回看余量
+        keep_from = segment_start if segment_start is not None else fed - MODEL_SAMPLE_RATE * 2
+        drop = keep_from - offset
+        if drop > 0:
+            buffer = buffer[drop:]
+            offset += drop
+
+    if segment_start is not None and total > segment_start:
+        yield (segment_start * 1000 // MODEL_SAMPLE_RATE, total * 1000 // MODEL_SAMPLE_RATE,
+               buffer[max(segment_start - offset, 0):].copy())
+
+
+def transcribe_file(path, model_key, workers=None, max_segment_ms=MAX_SEGMENT_MS, progress=None,
+                    generate_kwargs=None, on_segment=None):
+    """
+    分块读取音频文件并识别，峰值内存只取决于窗口大小和并行度，与文件时长无关
+
+    Args:
+        path: 音频文件路径
+        model_key: 注册表键；其 punc_model 用于拼接后加标点
+        workers: 并行识别的线程数，默认见 default_workers
+        max_segment_ms: 单段最长时长
+        progress: 进度回调 progress(已完成段数, 总段数)；读取完成前总段数未知，传 None
+        generate_kwargs: 识别各段时额外的 generate 参数
+        on_segment: 每段识别完成后按时间顺序回调 on_segment(段结果)；给出时各段交给回调后不再保留
+
+    Returns:
+        与 transcribe_long 相同结构的字典
+    """
+    workers = workers or default_workers()
+    generate_kwargs = generate_kwargs or {}
+    decode = _decoder(get_registry().get_decode_pool(asr_only(model_key), workers), generate_kwargs)
+
+    # 已提交但尚未取回结果的语音段起止时间
+    pending = deque()
+    texts = []
+    kept = [] if on_segment is None else None
+    in_flight = deque()
+
+    def collect():
+        beg, end = pending.popleft()
+        segment = decoded_segment(beg, end, in_flight.popleft().result())
+        texts.append(segment["text"])
+        if on_segment is not None:
+            on_segment(segment)
+        else:
+            kept.append(segment)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for beg, end, pcm in iter_vad_segments(iter_audio_windows(path), model_key.device, max_segment_ms):
+            pending.append((beg, end))
+            in_flight.append(executor.submit(decode, pcm))
+            # 限制同时在内存中的语音段数量
+            while len(in_flight) >= workers * 2:
+                collect()
+                if progress is not None:
+                    progress(len(texts), None)
+        total = len(texts) + len(in_flight)
+        while in_flight:
+            collect()
+            if progress is not None:
+                progress(len(texts), total)
+
+    return _assemble(texts, model_key, kept)
+
+
+def benchmark(audio_path, model_dir=None, model_name="small", workers=None, mode="thread", repeat=1,
+              backend=None):
+    """对比单次 model.generate 与并行分段识别的耗时"""
+    pcm = load_audio(audio_path)
+    if repeat > 1:
+        # 拼接成合成长音频
+        pcm = np.tile(pcm, repeat)
+    duration = len(pcm) / float(MODEL_SAMPLE_RATE)
+    key = make_key(model_dir, model_name, backend=backend)
+    registry = get_registry()
+
+    # 预先加载全部模型，计时只包含推理
+    pool = registry.get_pool(key)
+    registry.get_pool(asr_only(key))
+
+    start = time.perf_counter()
+    with pool.acquire() as model:
+        model.generate(input=pcm)
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = transcribe_long(pcm, key, workers=workers, mode=mode)
+    parallel = time.perf_counter() - start
+
+    print("=" * 50)
+    print(f"音频时长: {duration:.1f} 秒，语音段数: {len(result['segments'])}")
+    print(f"单次 generate:   {baseline:.2f} 秒 (RTF {baseline / duration:.3f})")
+    print(f"并行 ({mode} × {workers or default_workers()}): {parallel:.2f} 秒 (RTF {parallel / duration:.3f})")
+    print(f"加速比: {baseline / parallel:.2f}x")
+    print("=" * 50)
+    return {"duration": duration, "baseline": baseline, "parallel": parallel}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SenseVoice 长音频并行识别")
+    parser.add_argument("--audio_path", type=str, required=True, help="音频文件路径")
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default=None,
+        help="本地模型目录路径（可选，如果不提供将自动下载）"
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="small",
+        choices=["small", "medium"],
+        help="模型大小 (默认: small)"
+    )
+    add_backend_argument(parser)
+    parser.add_argument("--workers", type=int, default=None, help="并行度 (默认: 分到的核心数的一半，至多 4)")
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="thread",
+        choices=["thread", "process"],
+        help="并行方式 (默认: thread)"
+    )
+    parser.add_argument("--chunked", action="store_true", help="分块读取文件，不一次性解码到内存")
+    parser.add_argument("--benchmark", action="store_true", help="与单次 generate 对比耗时")
+    parser.add_argument("--repeat", type=int, default=1, help="基准测试时把音频重复 N 次拼成长音频")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.audio_path, args.model_dir, args.model, args.workers, args.mode, args.repeat,
+                  args.backend)
+        return 0
+
+    workers = args.workers or default_workers()
+    if args.chunked or args.mode == "thread":
+        # 各并行线程共用本进程的 intra-op 线程池，加载模型前按并行度分配一次
+        configure_worker(intra=max(1, intra_threads() // workers))
+    key = make_key(args.model_dir, args.model, backend=args.backend)
+    get_registry().get_pool(key)
+    reset_peak_rss()
+    if args.chunked:
+        result = transcribe_file(args.audio_path, key, workers=workers)
+    else:
+        result = transcribe_long(load_audio(args.audio_path), key, workers=workers, mode=args.mode)
+    for segment in result["segments"]:
+        print(f"[{segment['start'] / 1000:.2f} - {segment['end'] / 1000:.2f}] {segment['text']}")
+    print("\n" + "=" * 50)
+    print(result["text"])
+    print("=" * 50)
+    print(f"峰值内存: {peak_rss_mb()} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
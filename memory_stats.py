@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+进程内存统计
+读取当前/峰值 RSS，支持在 Linux 上重置峰值以便按文件统计；
+多进程共享模型权重时按进程统计独占（USS）与共享内存，用于确认节省的内存
+
+用法: python memory_stats.py <pid> [<pid> ...]
+"""
+
+import os
+import sys
+
+
+def _read_status(field):
+    """读取 /proc/self/status 中的字段（kB），不可用时返回 None"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_mb():
+    """当前常驻内存（MB）"""
+    kb = _read_status("VmRSS")
+    return round(kb / 1024.0, 1) if kb is not None else None
+
+
+def reset_peak_rss():
+    """重置峰值 RSS（Linux 4.0+ 写 /proc/self/clear_refs），成功返回 True"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """峰值常驻内存（MB）；无法重置峰值的平台上返回进程生命周期内的峰值"""
+    kb = _read_status("VmHWM")
+    if kb is not None:
+        return round(kb / 1024.0, 1)
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 单位是字节，Linux 是 kB
+        return round(peak / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0), 1)
+    except ImportError:
+        return None
+
+
+def memory_breakdown(pid="self"):
+    """
+    进程内存明细（MB），读取 /proc/<pid>/smaps_rollup（旧内核读 smaps），不可用时返回 None
+
+    Returns:
+        {"rss_mb": 常驻内存, "pss_mb": 共享页按共享进程数均摊后的内存,
+         "uss_mb": 独占内存（进程退出后释放的部分）, "shared_mb": 与其他进程共享的内存}
+    """
+    fields = {}
+    for name in ("smaps_rollup", "smaps"):
+        try:
+            with open(f"/proc/{pid}/{name}") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 3 and parts[2] == "kB":
+                        fields[parts[0][:-1]] = fields.get(parts[0][:-1], 0) + int(parts[1])
+            break
+        except OSError:
+            continue
+    if "Rss" not in fields:
+        return None
+
+    def mb(*names):
+        return round(sum(fields.get(n, 0) for n in names) / 1024.0, 1)
+
+    return {
+        "rss_mb": mb("Rss"),
+        "pss_mb": mb("Pss"),
+        "uss_mb": mb("Private_Clean", "Private_Dirty"),
+        "shared_mb": mb("Shared_Clean", "Shared_Dirty"),
+    }
+
+
+def report_processes(pids, labels=None):
+    """
+    打印多个进程的内存明细，返回 {pid: 明细}
+
+    所有进程 PSS 之和约等于这组进程实际占用的物理内存；共享权重时各工作进程的 USS 应远小于 RSS
+    """
+    labels = labels or {}
+    stats = {}
+    print(f"{'进程':<16}{'RSS':>10}{'PSS':>10}{'USS':>10}{'共享':>10}  (MB)")
+    for pid in pids:
+        info = memory_breakdown(pid)
+        if info is None:
+            continue
+        stats[pid] = info
+        print(f"{labels.get(pid, str(pid)):<16}{info['rss_mb']:>10.1f}{info['pss_mb']:>10.1f}"
+              f"{info['uss_mb']:>10.1f}{info['shared_mb']:>10.1f}")
+    if stats:
+        print(f"{'合计':<16}{sum(s['rss_mb'] for s in stats.values()):>10.1f}"
+              f"{sum(s['pss_mb'] for s in stats.values()):>10.1f}"
+              f"{sum(s['uss_mb'] for s in stats.values()):>10.1f}")
+    return stats
+
+
+if __name__ == "__main__":
+    pids = [int(p) for p in sys.argv[1:]] or [os.getpid()]
+    exit(0 if report_processes(pids) else 1)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 性能指标
+按阶段（音频读取、重采样、VAD、识别、标点、后处理）记录耗时直方图，导出 Prometheus 文本格式；
+可选按请求输出 cProfile / torch profiler 结果
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+logger = logging.getLogger("sensevoice")
+
+# 直方图分桶（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# 请求总耗时超过该值（毫秒）时记录分阶段明细日志
+SLOW_REQUEST_MS = float(os.environ.get("SENSEVOICE_SLOW_REQUEST_MS", "5000"))
+
+# 性能剖析：""（关闭）、"cprofile" 或 "torch"
+PROFILE_MODE = os.environ.get("SENSEVOICE_PROFILE", "").lower()
+PROFILE_DIR = os.environ.get("SENSEVOICE_PROFILE_DIR", "./profiles")
+
+
+class Histogram:
+    """累积分桶直方图"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    """进程内指标汇总"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            hist = self.stages.get(stage)
+            if hist is None:
+                hist = self.stages[stage] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = [
+            "# HELP sensevoice_stage_seconds Time spent in each pipeline stage.",
+            "# TYPE sensevoice_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage in sorted(self.stages):
+                hist = self.stages[stage]
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f'sensevoice_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'sensevoice_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {hist.count}')
+                lines.append(f'sensevoice_stage_seconds_sum{{stage="{stage}"}} {hist.sum:.6f}')
+                lines.append(f'sensevoice_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+            counters = sorted(self.counters.items())
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+_local = threading.local()
+
+
+@contextmanager
+def span(stage):
+    """记录一个阶段的耗时；在 trace() 内调用时同时记入当前请求的明细"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe(stage, elapsed)
+        current = getattr(_local, "trace", None)
+        if current is not None:
+            current.append((stage, elapsed))
+
+
+def observe(stage, seconds):
+    """直接记录一个耗时（如排队等待时间）"""
+    registry.observe(stage, seconds)
+
+
+@contextmanager
+def trace(name):
+    """
+    跟踪一次请求：汇总总耗时和结果状态，慢请求与失败请求输出分阶段明细
+
+    Yields:
+        本请求已记录的 [(阶段, 秒)] 列表
+    """
+    spans = []
+    previous = getattr(_local, "trace", None)
+    _local.trace = spans
+    start = time.perf_counter()
+    try:
+        yield spans
+    except Exception as e:
+        stage = spans[-1][0] if spans else "unknown"
+        registry.inc("sensevoice_errors_total", {"request": name, "after_stage": stage})
+        logger.exception("请求失败 request=%s after_stage=%s spans=%s error=%s",
+                         name, stage, _format_spans(spans), e)
+        raise
+    else:
+        registry.inc("sensevoice_requests_total", {"request": name})
+    finally:
+        _local.trace = previous
+        elapsed = time.perf_counter() - start
+        registry.observe("request_" + name, elapsed)
+        if elapsed * 1000 > SLOW_REQUEST_MS:
+            logger.warning("慢请求 request=%s total=%.3fs spans=%s", name, elapsed, _format_spans(spans))
+
+
+def _format_spans(spans):
+    return " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in spans)
+
+
+def instrument_model(auto_model):
+    """
+    给 funasr AutoModel 实例打点：generate 内部对 VAD / 识别 / 标点子模型的每次 inference 分别计时
+    """
+    original = getattr(auto_model, "inference", None)
+    if original is None or getattr(auto_model, "_sensevoice_instrumented", False):
+        return auto_model
+
+    stages = {}
+    for attr, stage in (("vad_model", "vad"), ("punc_model", "punc"), ("spk_model", "spk")):
+        sub = getattr(auto_model, attr, None)
+        if sub is not None:
+            stages[id(sub)] = stage
+
+    def inference(*args, **kwargs):
+        model = kwargs.get("model")
+        stage = stages.get(id(model), "asr") if model is not None else "asr"
+        with span(stage):
+            return original(*args, **kwargs)
+
+    auto_model.inference = inference
+    auto_model._sensevoice_instrumented = True
+    return auto_model
+
+
+def profiling_enabled(mode=None):
+    return (mode if mode is not None else PROFILE_MODE) in ("cprofile", "torch")
+
+
+@contextmanager
+def profiled(name, mode=None):
+    """
+    按请求剖析性能，结果写入 PROFILE_DIR
+
+    Args:
+        name: 文件名前缀
+        mode: "cprofile" / "torch"，默认取环境变量 SENSEVOICE_PROFILE
+    """
+    mode = mode if mode is not None else PROFILE_MODE
+    if not profiling_enabled(mode):
+        yield None
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d_%H%M%S") + f"_{int(time.time() * 1000) % 1000:03d}"
+    if mode == "torch":
+        from torch.profiler import ProfilerActivity, profile
+        path = os.path.join(PROFILE_DIR, f"{name}_{stamp}.trace.json")
+        with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as prof:
+            yield path
+        prof.export_chrome_trace(path)
+    else:
+        import cProfile
+        path = os.path.join(PROFILE_DIR, f"{name}_{stamp}.prof")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    logger.info("性能剖析结果: %s", path)
+
+
+def render_all():
+    """全部指标：阶段直方图、请求计数，以及调度器和结果缓存的状态（已初始化时）"""
+    lines = [registry.render()]
+
+    batcher_module = sys.modules.get("micro_batcher")
+    batcher = getattr(batcher_module, "_batcher", None)
+    if batcher is not None:
+        s = batcher.stats()
+        lines.append("# TYPE sensevoice_batch_requests_total counter")
+        lines.append(f"sensevoice_batch_requests_total {s['requests']}")
+        lines.append("# TYPE sensevoice_batches_total counter")
+        lines.append(f"sensevoice_batches_total {s['batches']}")
+        lines.append("# TYPE sensevoice_batch_queue_depth gauge")
+        lines.append(f"sensevoice_batch_queue_depth {s['queue_depth']}")
+
+    cache_module = sys.modules.get("result_cache")
+    cache = getattr(cache_module, "_cache", None)
+    if cache is not None:
+        s = cache.stats()
+        lines.append("# TYPE sensevoice_cache_hits_total counter")
+        lines.append(f"sensevoice_cache_hits_total {s['hits']}")
+        lines.append("# TYPE sensevoice_cache_misses_total counter")
+        lines.append(f"sensevoice_cache_misses_total {s['misses']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 请求合并调度器
+把短时间窗口内到达的并发请求按时长分组，合并成一次 model.generate 批量调用，再把结果分发回各调用方
+"""
+
+import os
+import time
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import observe, span
+from model_registry import get_registry
+
+
+def estimate_duration(audio):
+    """估算音频时长（秒），用于按时长分组，无法获取时返回 0"""
+    try:
+        if isinstance(audio, tuple):
+            sample_rate, data = audio
+            return len(data) / float(sample_rate)
+        if hasattr(audio, "shape"):
+            # 已预处理的 16kHz 波形
+            return audio.shape[-1] / 16000.0
+        if isinstance(audio, str) and os.path.exists(audio):
+            try:
+                import soundfile as sf
+                return sf.info(audio).duration
+            except Exception:
+                # 压缩格式无法快速读取头信息时，按 16kbps 粗略估算
+                return os.path.getsize(audio) / 2000.0
+    except Exception:
+        pass
+    return 0.0
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class _Request:
+    __slots__ = ("key", "audio", "duration", "kwargs", "future", "enqueued_at")
+
+    def __init__(self, key, audio, duration, kwargs=None):
+        self.key = key
+        self.audio = audio
+        self.duration = duration
+        self.kwargs = kwargs or {}
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    请求合并调度器
+
+    Args:
+        max_batch_size: 单次 generate 的最大请求数
+        max_wait_ms: 收到第一个请求后最多等待多少毫秒再发起推理
+        duration_ratio: 同一批内最长/最短音频时长的最大比值，超出则拆成多批以减少补零
+        workers: 并行执行批次的线程数（通常等于模型副本数）
+        generate_kwargs: 透传给 model.generate 的参数
+    """
+
+    def __init__(self, max_batch_size=8, max_wait_ms=20, duration_ratio=2.0,
+                 workers=1, generate_kwargs=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.duration_ratio = duration_ratio
+        self.generate_kwargs = generate_kwargs or {}
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+        self._closed = False
+
+        # 统计信息
+        self._stats_lock = threading.Lock()
+        self.batch_sizes = Counter()
+        self.queue_delays = deque(maxlen=1000)
+        self.request_count = 0
+        self.batch_count = 0
+
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, audio, key, generate_kwargs=None):
+        """
+        提交一个请求，返回 Future，结果为 generate 返回列表中的对应项
+
+        generate_kwargs 为该请求额外的 generate 参数（如流水线的 use_itn），参数相同的请求才会合并
+        """
+        request = _Request(key, audio, estimate_duration(audio), generate_kwargs)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("调度器已关闭")
+            self._pending.append(request)
+            self._cond.notify()
+        return request.future
+
+    def transcribe(self, audio, key, timeout=None, generate_kwargs=None):
+        """提交请求并等待结果"""
+        return self.submit(audio, key, generate_kwargs).result(timeout=timeout)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _collect(self):
+        """等待第一个请求，然后在 max_wait 窗口内继续收集，直到凑满一批"""
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return []
+            deadline = self._pending[0].enqueued_at + self.max_wait
+            while len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(len(self._pending), self.max_batch_size)
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _split(self, requests):
+        """按模型和 generate 参数分组，组内按时长排序，时长相差过大的拆到不同批次"""
+        groups = {}
+        for request in requests:
+            group = (request.key, tuple(sorted(request.kwargs.items())))
+            groups.setdefault(group, []).append(request)
+
+        batches = []
+        for group in groups.values():
+            group.sort(key=lambda r: r.duration)
+            batch = [group[0]]
+            for request in group[1:]:
+                shortest = max(batch[0].duration, 0.1)
+                if request.duration / shortest > self.duration_ratio:
+                    batches.append(batch)
+                    batch = []
+                batch.append(request)
+            batches.append(batch)
+        return batches
+
+    def _loop(self):
+        while True:
+            requests = self._collect()
+            if not requests:
+                return
+            for batch in self._split(requests):
+                self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        started = time.perf_counter()
+        with self._stats_lock:
+            self.batch_count += 1
+            self.request_count += len(batch)
+            self.batch_sizes[len(batch)] += 1
+            for request in batch:
+                self.queue_delays.append(started - request.enqueued_at)
+                observe("queue_wait", started - request.enqueued_at)
+
+        try:
+            pool = get_registry().get_pool(batch[0].key)
+            with pool.acquire() as model, span("generate"):
+                results = model.generate(
+                    input=[request.audio for request in batch],
+                    **dict(self.generate_kwargs, **batch[0].kwargs)
+                )
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        results = results or []
+        for i, request in enumerate(batch):
+            if i < len(results):
+                request.future.set_result(results[i])
+            else:
+                request.future.set_result(None)
+
+    def stats(self):
+        """返回批大小与排队延迟统计"""
+        with self._stats_lock:
+            delays = list(self.queue_delays)
+            sizes = dict(self.batch_sizes)
+            batches = self.batch_count
+            requests = self.request_count
+        with self._cond:
+            queued = len(self._pending)
+        return {
+            "requests": requests,
+            "batches": batches,
+            "mean_batch_size": round(requests / batches, 2) if batches else 0.0,
+            "batch_size_histogram": dict(sorted(sizes.items())),
+            "queue_delay_p50_ms": round(_percentile(delays, 50) * 1000, 1),
+            "queue_delay_p95_ms": round(_percentile(delays, 95) * 1000, 1),
+            "queue_depth": queued,
+        }
+
+    def format_stats(self):
+        """格式化统计信息，用于界面展示"""
+        s = self.stats()
+        histogram = ", ".join(f"{k}×{v}" for k, v in s["batch_size_histogram"].items()) or "-"
+        return (
+            f"请求数: {s['requests']}  批次数: {s['batches']}  平均批大小: {s['mean_batch_size']}\n"
+            f"批大小分布: {histogram}\n"
+            f"排队延迟 p50: {s['queue_delay_p50_ms']} ms  p95: {s['queue_delay_p95_ms']} ms  "
+            f"当前排队: {s['queue_depth']}"
+        )
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """返回进程内共享的调度器"""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(
+                max_batch_size=int(os.environ.get("SENSEVOICE_MAX_BATCH", "8")),
+                max_wait_ms=float(os.environ.get("SENSEVOICE_MAX_WAIT_MS", "20")),
+                workers=get_registry().replicas,
+            )
+        return _batcher
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 模型注册表
+同一 (model, vad, punc, device) 组合只加载一次，供 webui.py、example_usage.py、launcher.py 共享
+"""
+
+import os
+import queue
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from backends import DEFAULT_BACKEND, build_model, check_backend
+from metrics import instrument_model
+
+
+# 模型映射
+MODEL_MAP = {
+    "small": "iic/SenseVoiceSmall",
+    "medium": "iic/SenseVoiceMedium"
+}
+
+# 默认本地模型路径
+DEFAULT_MODEL_DIR = "./models/iic/SenseVoiceSmall"
+
+# 预热使用的示例音频
+WARMUP_AUDIO = os.path.join(DEFAULT_MODEL_DIR, "example", "zh.mp3")
+
+# backend: 推理后端 "torch" / "int8" / "onnx"，见 backends.py
+ModelKey = namedtuple("ModelKey", ["model", "vad_model", "punc_model", "device", "backend"],
+                      defaults=("torch",))
+
+# 流水线配置：(是否 VAD 切分, 是否 ct-punc 加标点, 传给 generate 的参数)
+# 不加标点时由 SenseVoice 自带的逆文本正则化（use_itn）输出标点
+PIPELINES = {
+    "asr": (False, False, {"use_itn": True}),
+    "vad_asr": (True, False, {"use_itn": True}),
+    "full": (True, True, {}),
+}
+
+# 默认流水线："auto" 按音频时长选择，或 PIPELINES 中的任一项
+DEFAULT_PIPELINE = os.environ.get("SENSEVOICE_PIPELINE", "auto")
+
+# 自动选择时，不超过该时长（秒）的短音频只做识别，跳过 VAD 和标点
+SHORT_CLIP_SECONDS = float(os.environ.get("SENSEVOICE_SHORT_CLIP_S", "15"))
+
+
+def resolve_model(model_dir=None, model_name="small"):
+    """解析模型路径：本地目录存在时优先使用，否则使用 ModelScope 模型 ID"""
+    if model_name not in MODEL_MAP:
+        raise ValueError(f"不支持的模型名称: {model_name}")
+    if model_dir and os.path.exists(model_dir):
+        return model_dir
+    return MODEL_MAP[model_name]
+
+
+def warmup_audio(model_dir=None):
+    """模型目录自带的示例音频，不存在时使用默认模型的示例"""
+    if model_dir:
+        candidate = os.path.join(model_dir, "example", "zh.mp3")
+        if os.path.exists(candidate):
+            return candidate
+    return WARMUP_AUDIO
+
+
+def make_key(model_dir=None, model_name="small", device="cpu",
+             vad_model="fsmn-vad", punc_model="ct-punc", backend=None):
+    """构造注册表键，backend 默认取环境变量 SENSEVOICE_BACKEND"""
+    backend = backend or DEFAULT_BACKEND
+    check_backend(backend, device)
+    return ModelKey(resolve_model(model_dir, model_name), vad_model, punc_model, device, backend)
+
+
+def asr_only(key):
+    """同一识别模型、同一后端，但不带 VAD / 标点的键"""
+    return ModelKey(key.model, None, None, key.device, key.backend)
+
+
+def base_key(key):
+    """识别模型本身（模型、设备、后端），同一识别模型的各流水线键对应同一个基础键"""
+    return (key.model, key.device, key.backend)
+
+
+def select_pipeline(pipeline=None, seconds=None):
+    """确定实际使用的流水线；"auto" 时短音频只识别，其余走完整流程"""
+    pipeline = pipeline or DEFAULT_PIPELINE
+    if pipeline == "auto":
+        return "asr" if seconds is not None and seconds <= SHORT_CLIP_SECONDS else "full"
+    if pipeline not in PIPELINES:
+        raise ValueError(f"不支持的流水线: {pipeline}，可选: auto, {', '.join(PIPELINES)}")
+    return pipeline
+
+
+def pipeline_key(key, pipeline=None, seconds=None):
+    """
+    按流水线去掉不需要的阶段
+
+    Returns:
+        (注册表键, generate 参数)；各流水线的键对应独立的模型池，首次使用时才加载
+    """
+    use_vad, use_punc, kwargs = PIPELINES[select_pipeline(pipeline, seconds)]
+    key = key._replace(
+        vad_model=key.vad_model if use_vad else None,
+        punc_model=key.punc_model if use_punc else None,
+    )
+    return key, dict(kwargs)
+
+
+def add_pipeline_argument(parser):
+    """命令行 --pipeline 参数"""
+    parser.add_argument(
+        "--pipeline",
+        type=str,
+        default=DEFAULT_PIPELINE,
+        choices=["auto"] + list(PIPELINES),
+        help=f"识别流程：auto（不超过 {SHORT_CLIP_SECONDS:g} 秒只识别，其余完整流程）、asr（只识别）、"
+             f"vad_asr（VAD+识别，不加标点）、full（VAD+识别+标点） (默认: {DEFAULT_PIPELINE})"
+    )
+
+
+def available_memory_mb():
+    """返回系统可用内存（MB），无法获取时返回 None"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class ModelPool:
+    """同一模型组合的 N 个副本，每次调用独占一个副本"""
+
+    def __init__(self, key, replicas=1):
+        self.key = key
+        self.replicas = []
+        self._free = queue.Queue()
+        self._lock = threading.Lock()
+        self._grow_lock = threading.Lock()
+        self.in_use = 0
+        self.warmed = False
+        for _ in range(replicas):
+            self._add_replica()
+
+    def grow(self, replicas):
+        """副本不足 replicas 个时加载到 replicas 个"""
+        with self._grow_lock:
+            while len(self.replicas) < replicas:
+                self._add_replica()
+
+    def _add_replica(self):
+        # funasr 依赖 torch，导入耗时数秒，推迟到真正加载模型时（在 build_model 内导入）
+        model = build_model(self.key)
+        # 分别统计 VAD / 识别 / 标点各阶段耗时
+        instrument_model(model)
+        self.replicas.append(model)
+        self._free.put(model)
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """取出一个空闲副本，用完后自动归还"""
+        try:
+            model = self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"等待模型副本超时: {self.key.model}")
+        with self._lock:
+            self.in_use += 1
+        try:
+            yield model
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._free.put(model)
+
+
+class ModelRegistry:
+    """
+    线程安全的模型注册表
+
+    Args:
+        max_entries: 最多同时保留的模型组合数（含长音频专用模型池），超出时按 LRU 淘汰
+        replicas: 每个组合加载的副本数
+        min_free_mb: 加载新组合前要求的最小可用内存（MB），不足时先淘汰最久未用的组合
+
+    正在服务的模型通过 pin 固定，LRU 淘汰时跳过（包括同一识别模型的各流水线组合）
+    """
+
+    def __init__(self, max_entries=2, replicas=1, min_free_mb=None):
+        self.max_entries = max_entries
+        self.replicas = replicas
+        self.min_free_mb = min_free_mb
+        self._pools = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._pinned = {}
+        self._decode_pools = {}
+
+    def load(self, model_dir=None, model_name="small", device="cpu",
+             vad_model="fsmn-vad", punc_model="ct-punc", warmup=False, backend=None):
+        """加载（或复用已加载的）模型组合，返回 ModelPool"""
+        key = make_key(model_dir, model_name, device, vad_model, punc_model, backend)
+        return self.get_pool(key, warmup=warmup)
+
+    def get_pool(self, key, warmup=False):
+        """按键获取模型池，同一键并发请求只会加载一次"""
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is not None:
+                self._pools.move_to_end(key)
+                return pool
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is not None:
+                    self._pools.move_to_end(key)
+                    return pool
+            self._make_room()
+            pool = ModelPool(key, self.replicas)
+            if warmup:
+                self.warmup(pool)
+            with self._lock:
+                self._pools[key] = pool
+                self._loading.pop(key, None)
+            return pool
+
+    def get_decode_pool(self, key, replicas):
+        """
+        长音频分段识别专用的模型池，副本数按需增加到 replicas 个，每段识别独占一个副本
+
+        与 get_pool 的模型池（流式识别、批量调度等共用）分开，但同样计入组合数和内存检查：
+        新建前按 LRU 腾出位置，每加一个副本前检查可用内存，不足时停止增加，各段排队使用已有副本；
+        空闲时优先被淘汰。funasr 的 generate 会就地修改实例上的参数，同一实例不能被多个线程同时调用
+        """
+        with self._lock:
+            pool = self._decode_pools.get(key)
+            if pool is None:
+                pool = self._decode_pools[key] = ModelPool(key, 0)
+        while len(pool.replicas) < replicas:
+            room = self._make_room(count=not pool.replicas, keep=key)
+            if not room and pool.replicas:
+                print(f"可用内存不足，长音频识别副本数限制为 {len(pool.replicas)}: {key.model}")
+                break
+            pool.grow(len(pool.replicas) + 1)
+        return pool
+
+    @contextmanager
+    def acquire(self, model_dir=None, model_name="small", device="cpu",
+                vad_model="fsmn-vad", punc_model="ct-punc", timeout=None, backend=None):
+        """获取一个模型副本独占使用"""
+        pool = self.load(model_dir, model_name, device, vad_model, punc_model, backend=backend)
+        with pool.acquire(timeout=timeout) as model:
+            yield model
+
+    def warmup(self, pool, audio=WARMUP_AUDIO):
+        """在每个副本上执行一次推理，避免首个请求变慢；已预热过的模型池直接跳过"""
+        if pool.warmed:
+            return True
+        if not audio or not os.path.exists(audio):
+            return False
+        for _ in pool.replicas:
+            with pool.acquire() as model:
+                model.generate(input=audio)
+        pool.warmed = True
+        return True
+
+    def is_loaded(self, key):
+        with self._lock:
+            return key in self._pools
+
+    def pin(self, key):
+        """固定识别模型，不被 LRU 淘汰；可重复调用，与 unpin 成对使用"""
+        with self._lock:
+            self._pinned[base_key(key)] = self._pinned.get(base_key(key), 0) + 1
+
+    def unpin(self, key):
+        with self._lock:
+            count = self._pinned.get(base_key(key), 0) - 1
+            if count > 0:
+                self._pinned[base_key(key)] = count
+            else:
+                self._pinned.pop(base_key(key), None)
+
+    def evict(self, key):
+        """移除模型组合；正在使用的副本在调用方释放后回收"""
+        with self._lock:
+            self._decode_pools.pop(key, None)
+            return self._pools.pop(key, None) is not None
+
+    def evict_model(self, key):
+        """移除同一识别模型的所有流水线组合，返回移除的组合数"""
+        with self._lock:
+            victims = [k for k in self._pools if base_key(k) == base_key(key)]
+            for victim in victims:
+                del self._pools[victim]
+            for victim in [k for k in self._decode_pools if base_key(k) == base_key(key)]:
+                del self._decode_pools[victim]
+        return len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._pools.clear()
+            self._decode_pools.clear()
+
+    def _entries(self):
+        # 长音频专用模型池同样是完整的识别模型副本，计入组合数
+        return len(self._pools) + sum(1 for pool in self._decode_pools.values() if pool.replicas)
+
+    def _make_room(self, count=True, keep=None):
+        """
+        按 LRU 淘汰空闲的模型组合，直到数量和内存满足要求；空闲的长音频专用模型池优先淘汰
+
+        Args:
+            count: 是否检查组合数（为已有模型池增加副本时只检查内存）
+            keep: 不淘汰的长音频专用模型池键
+
+        Returns:
+            是否满足要求
+        """
+        while True:
+            with self._lock:
+                too_many = count and self._entries() >= self.max_entries
+                free_mb = available_memory_mb() if self.min_free_mb else None
+                low_memory = free_mb is not None and free_mb < self.min_free_mb
+                if not (too_many or low_memory):
+                    return True
+                victim = next((k for k, p in self._decode_pools.items()
+                               if k != keep and p.replicas and p.in_use == 0), None)
+                if victim is not None:
+                    del self._decode_pools[victim]
+                else:
+                    victim = next((k for k, p in self._pools.items()
+                                   if p.in_use == 0 and base_key(k) not in self._pinned), None)
+                    if victim is None:
+                        return False
+                    del self._pools[victim]
+            print(f"释放模型: {victim.model}")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """返回进程内共享的模型注册表"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            min_free = os.environ.get("SENSEVOICE_MIN_FREE_MB")
+            _registry = ModelRegistry(
+                max_entries=int(os.environ.get("SENSEVOICE_MAX_MODELS", "2")),
+                replicas=int(os.environ.get("SENSEVOICE_MODEL_REPLICAS", "1")),
+                min_free_mb=int(min_free) if min_free else None,
+            )
+        return _registry
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 进程间 PCM 传递
+前端把解码后的 16kHz float32 波形写入共享内存环形缓冲区（只写一次），只把很小的句柄发给识别进程，
+识别进程直接在共享内存上读取，不经过 pickle 或临时文件；--benchmark 对比三种方式在 1 秒到 1 小时音频上的开销
+
+    写入方（单个进程）: ring = PcmRing(); handle = ring.put(pcm); 把 handle 发给识别进程
+    读取方（任意进程）: with read_pcm(handle) as pcm: model.generate(input=pcm)（读完自动释放）
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import threading
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from audio_utils import MODEL_SAMPLE_RATE
+
+
+# 环形缓冲区大小（MB），默认 256MB 约可容纳 70 分钟的 16kHz float32 音频
+RING_MB = int(os.environ.get("SENSEVOICE_PCM_RING_MB", "256"))
+
+# 同时在用（已写入未释放）的音频段上限
+RING_SLOTS = 256
+
+# 数据区起始对齐（字节）
+_ALIGN = 64
+
+# 句柄：共享内存名称、槽位、序号（防止释放已被复用的槽位）、数据在共享内存中的字节偏移、采样点数；可 pickle，只有几十字节
+PcmHandle = namedtuple("PcmHandle", ["name", "slot", "seq", "offset", "samples"])
+
+
+def slice_handle(handle, start, end):
+    """同一段共享内存中 [start, end) 采样点的句柄（不复制，释放仍以整段为单位）"""
+    start = max(0, min(start, handle.samples))
+    end = max(start, min(end, handle.samples))
+    return handle._replace(offset=handle.offset + start * 4, samples=end - start)
+
+
+def _attach(name):
+    """
+    按名称打开已有的共享内存
+
+    独立启动的读取进程有自己的 resource_tracker，打开时会登记该共享内存并在退出时删除它，需取消登记；
+    multiprocessing 创建的子进程与写入方共用 resource_tracker，取消登记会把写入方的登记一并删掉，不做处理
+    """
+    import multiprocessing
+    shm = shared_memory.SharedMemory(name=name)
+    if multiprocessing.parent_process() is None:
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+    return shm
+
+
+class PcmRing:
+    """
+    共享内存环形缓冲区
+
+    头部是 RING_SLOTS 个 int64 槽位（0 表示空闲，否则为占用该槽位的序号），之后是数据区。
+    只有创建它的进程写入（put）；任意进程读取后把槽位清零即为释放，写入方按写入顺序回收连续的已释放空间
+
+    Args:
+        size_bytes: 数据区大小，默认 SENSEVOICE_PCM_RING_MB
+        slots: 槽位数
+        name: 共享内存名称，默认自动生成
+    """
+
+    def __init__(self, size_bytes=None, slots=RING_SLOTS, name=None):
+        self.capacity = int(size_bytes or RING_MB * 1024 * 1024)
+        self.capacity += -self.capacity % 4
+        self.slots = slots
+        self.data_offset = -(-slots * 8 // _ALIGN) * _ALIGN
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=self.data_offset + self.capacity)
+        self.name = self.shm.name
+        self._state = np.ndarray((slots,), dtype=np.int64, buffer=self.shm.buf)
+        self._state[:] = 0
+        self._allocated = deque()
+        self._head = 0
+        self._next_slot = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _reclaim(self):
+        while self._allocated and self._state[self._allocated[0][0]] == 0:
+            self._allocated.popleft()
+        if not self._allocated:
+            self._head = 0
+
+    def _allocate(self, nbytes):
+        """返回可写入 nbytes 的偏移，空间或槽位不足时返回 None"""
+        if self._state[self._next_slot] != 0:
+            return None
+        if not self._allocated:
+            return 0 if nbytes <= self.capacity else None
+        tail = self._allocated[0][1]
+        if self._head > tail:
+            if self._head + nbytes <= self.capacity:
+                return self._head
+            # 尾部放不下时从头开始，尾部剩余空间跳过
+            return 0 if nbytes <= tail else None
+        return self._head if self._head + nbytes <= tail else None
+
+    def put(self, pcm, timeout=None):
+        """
+        写入一段波形，返回句柄；缓冲区已满时等待读取方释放，超时抛出 TimeoutError
+
+        大于整个缓冲区的音频抛出 ValueError，调用方应改用其他方式传递
+        """
+        pcm = np.ascontiguousarray(pcm, dtype=np.float32).reshape(-1)
+        nbytes = pcm.nbytes
+        if nbytes > self.capacity:
+            raise ValueError(f"音频 {nbytes / 1024 / 1024:.1f}MB 超过环形缓冲区大小 "
+                             f"{self.capacity / 1024 / 1024:.1f}MB，请调大 SENSEVOICE_PCM_RING_MB")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while True:
+                self._reclaim()
+                offset = self._allocate(nbytes)
+                if offset is not None:
+                    break
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError("环形缓冲区已满，等待读取方释放超时")
+                time.sleep(0.001)
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % self.slots
+            self._seq += 1
+            np.copyto(np.ndarray((pcm.size,), dtype=np.float32, buffer=self.shm.buf,
+                                 offset=self.data_offset + offset), pcm)
+            self._state[slot] = self._seq
+            self._allocated.append((slot, offset))
+            # 空段也占一个对齐单位，保证各段偏移不同
+            self._head = offset + max(nbytes, _ALIGN) + (-max(nbytes, _ALIGN) % _ALIGN)
+            return PcmHandle(self.name, slot, self._seq, self.data_offset + offset, pcm.size)
+
+    def view(self, handle):
+        return _view(self.shm, handle)
+
+    def release(self, handle):
+        _release(self.shm, handle)
+
+    def in_use(self):
+        """已写入未释放的段数"""
+        with self._lock:
+            self._reclaim()
+            return len(self._allocated)
+
+    def close(self):
+        """关闭并删除共享内存（仍持有视图的读取方需先释放视图）"""
+        self._state = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _view(shm, handle):
+    # 视图直接指向共享内存，读取方不应修改其内容
+    return np.ndarray((handle.samples,), dtype=np.float32, buffer=shm.buf, offset=handle.offset)
+
+
+def _release(shm, handle):
+    state = np.ndarray((1,), dtype=np.int64, buffer=shm.buf, offset=handle.slot * 8)
+    if state[0] == handle.seq:
+        state[0] = 0
+
+
+# 读取进程内已打开的共享内存：名称 → SharedMemory
+_attached = {}
+_attached_lock = threading.Lock()
+
+
+def _open(name):
+    with _attached_lock:
+        shm = _attached.get(name)
+        if shm is None:
+            shm = _attached[name] = _attach(name)
+        return shm
+
+
+def open_pcm(handle):
+    """在读取进程中按句柄取得波形视图（不复制）"""
+    return _view(_open(handle.name), handle)
+
+
+def release_pcm(handle):
+    """读取方用完后释放，写入方即可复用该空间"""
+    _release(_open(handle.name), handle)
+
+
+@contextmanager
+def read_pcm(handle):
+    """读取波形，退出时释放"""
+    try:
+        yield open_pcm(handle)
+    finally:
+        release_pcm(handle)
+
+
+def detach_all():
+    """关闭读取进程内打开的全部共享内存"""
+    with _attached_lock:
+        for shm in _attached.values():
+            try:
+                shm.close()
+            except BufferError:
+                # 仍有视图引用时无法关闭，进程退出时由系统回收映射
+                pass
+        _attached.clear()
+
+
+_ring = None
+_ring_lock = threading.Lock()
+
+
+def get_ring():
+    """返回进程内共享的环形缓冲区（前端写入用），首次调用时创建"""
+    global _ring
+    with _ring_lock:
+        if _ring is None:
+            _ring = PcmRing()
+        return _ring
+
+
+# ---- 基准测试 ----
+
+def _bench_worker(conn):
+    """基准测试的读取进程：按三种方式取得波形，读取首尾采样后回复"""
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        kind, payload = message
+        if kind == "pickle":
+            pcm = payload
+        elif kind == "file":
+            pcm = np.fromfile(payload, dtype=np.float32)
+            os.remove(payload)
+        else:
+            pcm = open_pcm(payload)
+        reply = (pcm.size, float(pcm[0]) + float(pcm[-1]) if pcm.size else 0.0)
+        if kind == "shm":
+            del pcm
+            release_pcm(payload)
+        conn.send(reply)
+    detach_all()
+
+
+def benchmark(durations=(1, 10, 60, 600, 3600), repeats=None):
+    """
+    对比 pickle（经管道发送整段数组）、临时文件（写 float32 裸数据再读回）与共享内存（写入一次，只发送句柄）
+    每个请求的端到端开销（写入 + 传递 + 读取方取得数组），不含识别本身
+
+    Returns:
+        [{"seconds", "mb", "pickle_ms", "file_ms", "shm_ms"}]
+    """
+    import multiprocessing
+
+    max_bytes = max(durations) * MODEL_SAMPLE_RATE * 4
+    try:
+        free = os.statvfs("/dev/shm")
+        free = free.f_bavail * free.f_frsize
+    except (AttributeError, OSError):
+        free = None
+    if free is not None and free < max_bytes * 1.1:
+        # 写入超过 /dev/shm 容量的共享内存会导致进程崩溃（SIGBUS）
+        durations = [d for d in durations if d * MODEL_SAMPLE_RATE * 4 * 1.1 <= free]
+        print(f"/dev/shm 可用 {free / 1024 / 1024:.0f}MB，只测试 {durations} 秒的音频")
+        max_bytes = max(durations) * MODEL_SAMPLE_RATE * 4
+
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe()
+    worker = ctx.Process(target=_bench_worker, args=(child,), daemon=True)
+    worker.start()
+    ring = PcmRing(size_bytes=max_bytes)
+    results = []
+    try:
+        for seconds in durations:
+            pcm = (np.random.randn(int(seconds * MODEL_SAMPLE_RATE)) * 0.1).astype(np.float32)
+            n = repeats or max(3, min(50, int(600 / seconds)))
+            row = {"seconds": seconds, "mb": round(pcm.nbytes / 1024 / 1024, 1)}
+
+            def run(kind, send):
+                times = []
+                for _ in range(n):
+                    start = time.perf_counter()
+                    parent.send((kind, send()))
+                    size, _ = parent.recv()
+                    times.append(time.perf_counter() - start)
+                    assert size == pcm.size
+                times.sort()
+                return round(times[len(times) // 2] * 1000, 3)
+
+            def to_file():
+                fd, path = tempfile.mkstemp(suffix=".f32", prefix="sensevoice_bench_")
+                with os.fdopen(fd, "wb") as f:
+                    pcm.tofile(f)
+                return path
+
+            row["pickle_ms"] = run("pickle", lambda: pcm)
+            row["file_ms"] = run("file", to_file)
+            row["shm_ms"] = run("shm", lambda: ring.put(pcm))
+            results.append(row)
+            print(f"{seconds:>6g} 秒 ({row['mb']:>6.1f}MB)  pickle {row['pickle_ms']:>9.2f} ms  "
+                  f"临时文件 {row['file_ms']:>9.2f} ms  共享内存 {row['shm_ms']:>9.2f} ms")
+    finally:
+        parent.send(None)
+        worker.join(timeout=10)
+        ring.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SenseVoice 进程间 PCM 传递")
+    parser.add_argument("--benchmark", action="store_true", help="对比 pickle、临时文件和共享内存的单次传递开销")
+    parser.add_argument("--durations", type=float, nargs="+", default=[1, 10, 60, 600, 3600],
+                        help="测试音频时长（秒） (默认: 1 10 60 600 3600)")
+    parser.add_argument("--repeats", type=int, default=None, help="每个时长的请求数（默认按时长自动选择）")
+    parser.add_argument("--output", type=str, default=None, help="结果 JSON 路径")
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        parser.print_help()
+        return 0
+    results = benchmark(args.durations, args.repeats)
+    if args.output:
+        import json
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
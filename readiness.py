@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+服务就绪状态
+服务先启动、重量级依赖（torch / funasr 等）在后台线程中导入，界面和健康检查通过这里查询进度
+"""
+
+import time
+import threading
+
+
+# 状态及界面显示文字
+STATES = {
+    "starting": "服务启动中",
+    "importing": "正在后台加载依赖库",
+    "imported": "依赖库已就绪，等待加载模型",
+    "loading_model": "正在加载模型",
+    "warming_up": "正在预热模型",
+    "ready": "模型已就绪",
+    "failed": "启动失败",
+}
+
+# 进行中的状态，界面上显示已用时间
+IN_PROGRESS = ("starting", "importing", "loading_model", "warming_up")
+
+# 后台预先导入的重量级模块
+HEAVY_MODULES = ("torch", "torchaudio", "librosa", "modelscope", "funasr")
+
+
+class Readiness:
+    """线程安全的启动状态"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.state = "starting"
+        self.detail = ""
+        self.started_at = time.time()
+        self.changed_at = self.started_at
+        self.import_seconds = {}
+
+    def set(self, state, detail=""):
+        if state not in STATES:
+            raise ValueError(f"未知状态: {state}")
+        with self._cond:
+            self.state = state
+            self.detail = detail
+            self.changed_at = time.time()
+            self._cond.notify_all()
+
+    def wait_for(self, states, timeout=None):
+        """等待进入指定状态之一，超时返回 False"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self.state not in states:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    @property
+    def is_ready(self):
+        return self.state == "ready"
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "state": self.state,
+                "message": STATES[self.state],
+                "detail": self.detail,
+                "uptime_s": round(time.time() - self.started_at, 2),
+                "import_seconds": dict(self.import_seconds),
+            }
+
+    def describe(self):
+        """界面状态框显示的文字"""
+        s = self.snapshot()
+        text = s["message"]
+        if s["detail"]:
+            text += f": {s['detail']}"
+        if s["state"] in IN_PROGRESS:
+            text += f"（已用 {time.time() - self.changed_at:.0f} 秒）"
+        return text
+
+
+readiness = Readiness()
+
+
+def import_heavy_modules(modules=HEAVY_MODULES):
+    """依次导入重量级模块并记录各自耗时；已导入的模块不会重复计时"""
+    if readiness.state == "starting":
+        readiness.set("importing")
+    try:
+        for name in modules:
+            start = time.perf_counter()
+            try:
+                __import__(name)
+            except ImportError:
+                continue
+            readiness.import_seconds[name] = round(time.perf_counter() - start, 3)
+        from cpu_tuning import apply_torch_threads
+        apply_torch_threads()
+    except Exception as e:
+        readiness.set("failed", str(e))
+        return False
+    if readiness.state == "importing":
+        readiness.set("imported")
+    return True
+
+
+def start_background_imports(modules=HEAVY_MODULES):
+    """在后台线程中导入重量级依赖，返回线程对象"""
+    thread = threading.Thread(target=import_heavy_modules, args=(modules,), name="preimport", daemon=True)
+    thread.start()
+    return thread
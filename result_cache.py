@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 识别结果缓存
+以解码后 PCM 的哈希 + 模型配置为键，内存 LRU 一级缓存 + 可选 SQLite 磁盘二级缓存
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def _json_default(obj):
+    """numpy 数组/标量转成 JSON 可序列化类型"""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    return str(obj)
+
+
+def make_cache_key(pcm, model_key, **config):
+    """
+    计算缓存键
+
+    Args:
+        pcm: 16kHz float32 单声道波形
+        model_key: 注册表中的模型键（模型 + VAD + 标点 + 设备）
+        config: 影响识别结果的其他参数（如 language、use_itn）
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(memoryview(pcm).cast("B"))
+    h.update(repr(tuple(model_key)).encode("utf-8"))
+    h.update(json.dumps(config, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    两级结果缓存
+
+    Args:
+        max_items: 内存 LRU 最多保留的条目数
+        db_path: SQLite 文件路径，为 None 时不启用磁盘缓存
+        max_db_mb: 磁盘缓存上限（MB），超出时按最近使用时间淘汰
+    """
+
+    def __init__(self, max_items=256, db_path=None, max_db_mb=256):
+        self.max_items = max_items
+        self.max_db_bytes = int(max_db_mb * 1024 * 1024)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        if db_path:
+            db_dir = os.path.dirname(os.path.abspath(db_path))
+            os.makedirs(db_dir, exist_ok=True)
+            # 批量模式下多个进程共用同一个文件
+            self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON results(last_used)")
+            self._db.commit()
+
+    def get(self, key):
+        """查询缓存，未命中返回 None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """写入缓存"""
+        with self._lock:
+            self._remember(key, value)
+            if self._db is not None:
+                data = json.dumps(value, ensure_ascii=False, default=_json_default)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, data, len(data.encode("utf-8")), time.time())
+                )
+                self._evict_disk()
+                self._db.commit()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        while total > self.max_db_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM results ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.evictions += 1
+                total -= size
+                if total <= self.max_db_bytes:
+                    break
+
+    def get_or_compute(self, pcm, model_key, compute, **config):
+        """
+        命中则直接返回缓存结果，否则调用 compute(pcm) 并写入缓存
+
+        compute 返回 None（识别失败）时不缓存
+        """
+        key = make_cache_key(pcm, model_key, **config)
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = compute(pcm)
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "memory_items": len(self._memory),
+                "disk_evictions": self.evictions,
+            }
+
+    def format_stats(self):
+        s = self.stats()
+        return (
+            f"缓存命中: {s['hits']}（磁盘 {s['disk_hits']}）  未命中: {s['misses']}  "
+            f"命中率: {s['hit_rate']:.0%}  内存条目: {s['memory_items']}"
+        )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    返回进程内共享的结果缓存
+
+    环境变量:
+        SENSEVOICE_CACHE_SIZE: 内存条目数（默认 256，0 表示关闭缓存）
+        SENSEVOICE_CACHE_DB: SQLite 文件路径（默认不启用磁盘缓存）
+        SENSEVOICE_CACHE_DB_MB: 磁盘缓存上限（默认 256MB）
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            size = int(os.environ.get("SENSEVOICE_CACHE_SIZE", "256"))
+            if size <= 0:
+                return None
+            _cache = ResultCache(
+                max_items=size,
+                db_path=os.environ.get("SENSEVOICE_CACHE_DB") or None,
+                max_db_mb=float(os.environ.get("SENSEVOICE_CACHE_DB_MB", "256")),
+            )
+        return _cache
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 静音预过滤
+在 fsmn-vad 和识别模型之前，按帧能量和过零率快速判断静音（整段向量化运算，1 小时音频约 0.3 秒）：
+整段静音的文件直接返回空结果，首尾较长的静音裁掉后再送入模型；裁掉的时长计入指标
+
+环境变量：
+    SENSEVOICE_SILENCE_GATE        设为 0 时关闭（默认: 1）
+    SENSEVOICE_SILENCE_DB          帧能量阈值（dBFS），没有帧明显高于该值的文件视为整段静音（默认: -50）
+    SENSEVOICE_SILENCE_ZCR         过零率阈值，紧邻有声帧、能量略低（阈值以下 10dB 内）但过零率高于该值的帧（清辅音）也视为有声（默认: 0.25）
+    SENSEVOICE_SILENCE_MIN_TRIM_S  首尾静音超过该时长（秒）才裁剪（默认: 1）
+"""
+
+import os
+import argparse
+import threading
+
+import numpy as np
+
+from audio_utils import MODEL_SAMPLE_RATE
+from metrics import registry as metrics_registry
+
+
+GATE_ENABLED = os.environ.get("SENSEVOICE_SILENCE_GATE", "1") != "0"
+
+SILENCE_DB = float(os.environ.get("SENSEVOICE_SILENCE_DB", "-50"))
+
+ZCR_THRESHOLD = float(os.environ.get("SENSEVOICE_SILENCE_ZCR", "0.25"))
+
+# 过零率判断只对能量在 [阈值 - ZCR_DB_MARGIN, 阈值] 内的帧生效，更安静的帧即使过零率高也是底噪
+ZCR_DB_MARGIN = 10.0
+
+# 过零率判断只对距能量有声帧 ZCR_REACH_MS 以内的帧生效：清辅音总是紧挨着元音，
+# 而白噪声等宽带底噪的过零率约 0.5，单凭过零率会把整段底噪当成语音
+ZCR_REACH_MS = 200
+
+# 裁剪首尾时底噪取帧能量的该百分位，有声阈值至少比底噪高 NOISE_MARGIN_DB，
+# 底噪接近或高于 SILENCE_DB 的录音（嘈杂房间）首尾的底噪也能裁掉
+NOISE_PERCENTILE = 10
+NOISE_MARGIN_DB = 10.0
+
+# 判断整段静音只用绝对阈值：能量高于 SILENCE_DB + SILENCE_TOLERANCE_DB 的帧不足 MIN_SPEECH_MS 才算静音
+# （容差只为吸收恰好在阈值附近的平稳底噪的帧间波动）；连续语音、低信噪比语音、持续音都交给 fsmn-vad 判断
+SILENCE_TOLERANCE_DB = 3.0
+
+MIN_TRIM_S = float(os.environ.get("SENSEVOICE_SILENCE_MIN_TRIM_S", "1"))
+
+# 帧长（毫秒）
+FRAME_MS = 20
+
+# 有声帧总时长低于该值（毫秒）时视为整段静音（偶发的咔嗒声不算语音）
+MIN_SPEECH_MS = 100
+
+# 裁剪时在语音前后保留的余量（毫秒），避免切掉起音和尾音
+PAD_MS = 300
+
+
+def frame_features(pcm, frame_ms=FRAME_MS):
+    """
+    按帧计算能量（dBFS）和过零率
+
+    Returns:
+        (能量数组, 过零率数组)，不足一帧的尾部忽略
+    """
+    frame = MODEL_SAMPLE_RATE * frame_ms // 1000
+    n = len(pcm) // frame
+    if n == 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    frames = np.asarray(pcm[:n * frame], dtype=np.float32).reshape(n, frame)
+    # einsum 按行求平方和，不生成整段平方数组
+    power = np.einsum("ij,ij->i", frames, frames) / frame
+    energy_db = 10.0 * np.log10(power + 1e-12)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / float(frame - 1)
+    return energy_db, zcr
+
+
+def voiced_frames(pcm, silence_db=SILENCE_DB, zcr_threshold=ZCR_THRESHOLD, frame_ms=FRAME_MS):
+    """每帧是否有声（能量高于阈值，或紧邻有声帧、能量接近阈值且过零率高），用于确定裁剪范围"""
+    return _voiced(*frame_features(pcm, frame_ms), silence_db, zcr_threshold, frame_ms)
+
+
+def _voiced(energy_db, zcr, silence_db, zcr_threshold, frame_ms):
+    if len(energy_db) == 0:
+        return np.zeros(0, dtype=bool)
+    threshold = max(silence_db, float(np.percentile(energy_db, NOISE_PERCENTILE)) + NOISE_MARGIN_DB)
+    loud = energy_db > threshold
+    reach = ZCR_REACH_MS // frame_ms
+    # 有声帧前后 reach 帧内的范围（滑动窗口内有任一有声帧）
+    near = np.convolve(loud, np.ones(2 * reach + 1, dtype=np.int32), mode="same") > 0
+    return loud | (near & (energy_db > threshold - ZCR_DB_MARGIN) & (zcr > zcr_threshold))
+
+
+def detect(pcm, silence_db=SILENCE_DB, zcr_threshold=ZCR_THRESHOLD, min_trim_s=MIN_TRIM_S,
+           frame_ms=FRAME_MS):
+    """
+    判断静音并确定保留范围
+
+    Returns:
+        {"start", "end": 保留范围（采样点）, "empty": 是否整段静音,
+         "duration_s": 原始时长, "kept_s": 保留时长, "skipped_ratio": 跳过的比例}
+    """
+    total = len(pcm)
+    energy_db, zcr = frame_features(pcm, frame_ms)
+    frame = MODEL_SAMPLE_RATE * frame_ms // 1000
+    voiced = _voiced(energy_db, zcr, silence_db, zcr_threshold, frame_ms)
+    loud = energy_db > silence_db + SILENCE_TOLERANCE_DB
+    empty = max(voiced.sum(), loud.sum()) * frame_ms < MIN_SPEECH_MS
+    if empty:
+        start = end = 0
+    elif voiced.sum() * frame_ms < MIN_SPEECH_MS:
+        # 有声音但找不到明显高于底噪的帧（连续语音、低信噪比），不裁剪，交给 fsmn-vad
+        start, end = 0, total
+    else:
+        indices = np.flatnonzero(voiced)
+        pad = PAD_MS * MODEL_SAMPLE_RATE // 1000
+        min_trim = int(min_trim_s * MODEL_SAMPLE_RATE)
+        start = max(0, int(indices[0]) * frame - pad)
+        end = min(total, (int(indices[-1]) + 1) * frame + pad)
+        # 只裁剪足够长的静音
+        if start < min_trim:
+            start = 0
+        if total - end < min_trim:
+            end = total
+    kept = end - start
+    return {
+        "start": start,
+        "end": end,
+        "empty": bool(empty),
+        "duration_s": round(total / float(MODEL_SAMPLE_RATE), 3),
+        "kept_s": round(kept / float(MODEL_SAMPLE_RATE), 3),
+        "skipped_ratio": round(1.0 - kept / float(total), 4) if total else 0.0,
+    }
+
+
+# 进程内累计：[总时长, 跳过时长, 文件数, 整段静音文件数]（秒）
+_totals = [0.0, 0.0, 0, 0]
+_totals_lock = threading.Lock()
+
+
+def _record(info):
+    skipped = info["duration_s"] - info["kept_s"]
+    with _totals_lock:
+        _totals[0] += info["duration_s"]
+        _totals[1] += skipped
+        _totals[2] += 1
+        _totals[3] += 1 if info["empty"] else 0
+    metrics_registry.inc("sensevoice_gate_audio_seconds_total", value=info["duration_s"])
+    metrics_registry.inc("sensevoice_gate_skipped_seconds_total", value=skipped)
+    if info["empty"]:
+        metrics_registry.inc("sensevoice_gate_empty_total")
+
+
+def totals():
+    """进程内累计的静音过滤情况"""
+    with _totals_lock:
+        duration, skipped, files, empty = _totals
+    return {
+        "files": files,
+        "empty_files": empty,
+        "audio_s": round(duration, 3),
+        "skipped_s": round(skipped, 3),
+        "skipped_ratio": round(skipped / duration, 4) if duration else 0.0,
+    }
+
+
+def gate(pcm, enabled=None, **thresholds):
+    """
+    静音预过滤
+
+    Returns:
+        (保留的波形（视图，不复制）, 起点偏移毫秒, detect 的结果)；关闭时原样返回，结果为 None。
+        结果中 empty 为 True 时调用方应直接返回空识别结果
+    """
+    if not (GATE_ENABLED if enabled is None else enabled) or pcm is None or len(pcm) == 0:
+        return pcm, 0, None
+    info = detect(pcm, **thresholds)
+    _record(info)
+    offset_ms = info["start"] * 1000 // MODEL_SAMPLE_RATE
+    return pcm[info["start"]:info["end"]], offset_ms, info
+
+
+def empty_result(info):
+    """整段静音时返回的识别结果"""
+    return {"text": "", "silence": info}
+
+
+def shift_result(result, offset_ms):
+    """裁掉开头静音后，把结果中的时间（毫秒）换算回原始音频的时间"""
+    if not result or not offset_ms:
+        return result
+    result = dict(result)
+    if result.get("timestamp"):
+        result["timestamp"] = [[s + offset_ms, e + offset_ms] for s, e in result["timestamp"]]
+    if result.get("segments"):
+        result["segments"] = [shift_segment(segment, offset_ms) for segment in result["segments"]]
+    return result
+
+
+def shift_segment(segment, offset_ms):
+    """单个语音段（long_audio.decoded_segment 的结果）加上起点偏移"""
+    segment = dict(segment, start=segment["start"] + offset_ms, end=segment["end"] + offset_ms)
+    if segment.get("timestamp"):
+        segment["timestamp"] = [[s + offset_ms, e + offset_ms] for s, e in segment["timestamp"]]
+    return segment
+
+
+def main():
+    from audio_utils import load_audio
+
+    parser = argparse.ArgumentParser(description="SenseVoice 静音预过滤")
+    parser.add_argument("audio_paths", nargs="+", help="音频文件")
+    parser.add_argument("--silence_db", type=float, default=SILENCE_DB, help=f"帧能量阈值 dBFS (默认: {SILENCE_DB:g})")
+    parser.add_argument("--zcr", type=float, default=ZCR_THRESHOLD, help=f"过零率阈值 (默认: {ZCR_THRESHOLD:g})")
+    parser.add_argument("--min_trim_s", type=float, default=MIN_TRIM_S,
+                        help=f"首尾静音超过该时长（秒）才裁剪 (默认: {MIN_TRIM_S:g})")
+    args = parser.parse_args()
+
+    for path in args.audio_paths:
+        _, _, info = gate(load_audio(path), enabled=True, silence_db=args.silence_db,
+                          zcr_threshold=args.zcr, min_trim_s=args.min_trim_s)
+        state = "整段静音" if info["empty"] else (
+            f"保留 {info['start'] / MODEL_SAMPLE_RATE:.2f}s - {info['end'] / MODEL_SAMPLE_RATE:.2f}s")
+        print(f"{path}: {info['duration_s']:.2f}s  {state}  跳过 {info['skipped_ratio'] * 100:.1f}%")
+    t = totals()
+    print(f"共 {t['files']} 个文件（整段静音 {t['empty_files']} 个），"
+          f"跳过 {t['skipped_s']:.1f}/{t['audio_s']:.1f} 秒（{t['skipped_ratio'] * 100:.1f}%）")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 流式识别
+麦克风音频分块到达时增量运行 fsmn-vad 切分语音段，语音进行中输出中间结果，语音段结束立即输出最终结果
+"""
+
+import os
+import time
+
+import numpy as np
+
+from audio_utils import MODEL_SAMPLE_RATE, to_model_input
+from metrics import span
+from model_registry import ModelKey, asr_only, get_registry
+
+
+# VAD 每次处理的音频长度（毫秒）
+VAD_CHUNK_MS = 200
+
+# 语音进行中每累积多少毫秒新语音输出一次中间结果
+PARTIAL_INTERVAL_MS = 600
+
+# 首字延迟目标（毫秒）：从检测到语音开始到界面出现第一段文字
+FIRST_TOKEN_TARGET_MS = int(os.environ.get("SENSEVOICE_FIRST_TOKEN_TARGET_MS", "800"))
+
+
+def _postprocess(text):
+    """去掉 SenseVoice 输出中的语言/情感/事件标签"""
+    try:
+        from funasr.utils.postprocess_utils import rich_transcription_postprocess
+    except ImportError:
+        return text
+    with span("postprocess"):
+        return rich_transcription_postprocess(text)
+
+
+class StreamingSession:
+    """
+    单路流式识别会话
+
+    Args:
+        asr_key: 识别模型的注册表键（会去掉 VAD/标点，只做单段识别）
+        vad_chunk_ms: VAD 分块长度
+        partial_interval_ms: 中间结果刷新间隔
+        release: 会话结束时调用（如归还模型引用计数），由 close() 触发且只触发一次
+    """
+
+    def __init__(self, asr_key, vad_chunk_ms=VAD_CHUNK_MS, partial_interval_ms=PARTIAL_INTERVAL_MS, release=None):
+        self._release = release
+        registry = get_registry()
+        self.asr_pool = registry.get_pool(asr_only(asr_key))
+        self.vad_pool = registry.get_pool(ModelKey("fsmn-vad", None, None, asr_key.device))
+        self.vad_chunk = vad_chunk_ms * MODEL_SAMPLE_RATE // 1000
+        self.partial_interval = partial_interval_ms * MODEL_SAMPLE_RATE // 1000
+        self.vad_cache = {}
+
+        # 音频缓冲：self.audio[0] 对应流中第 self.offset 个采样点
+        self.audio = np.zeros(0, dtype=np.float32)
+        self.offset = 0
+        self.vad_fed = 0
+        self.total = 0
+
+        self.segment_start = None
+        self.last_partial_end = 0
+        self.speech_detected_at = None
+        self.first_token_pending = False
+
+        self.finals = []
+        self.partial = ""
+        self.first_token_latencies = []
+
+    def feed(self, sample_rate, data, is_final=False):
+        """
+        输入一块麦克风音频，逐个产出识别事件
+
+        Yields:
+            {"type": "partial" | "final", "text": ..., "start_ms": ..., "end_ms": ...}
+        """
+        if data is not None and len(data) > 0:
+            # 分块输入不做响度归一化，避免各块增益不一致
+            chunk = to_model_input(sample_rate, data, normalize=False)
+            self.audio = np.concatenate([self.audio, chunk])
+            self.total += len(chunk)
+
+        while self.total - self.vad_fed >= self.vad_chunk or (is_final and self.total > self.vad_fed):
+            end = min(self.vad_fed + self.vad_chunk, self.total)
+            last = is_final and end == self.total
+            for event in self._run_vad(self.vad_fed, end, last):
+                yield event
+            self.vad_fed = end
+
+        if not is_final and self.segment_start is not None:
+            if self.total - max(self.segment_start, self.last_partial_end) >= self.partial_interval:
+                yield self._decode(self.segment_start, self.total, final=False)
+
+        self._trim()
+
+    def finish(self):
+        """录音结束，冲刷剩余音频，产出最后的事件"""
+        for event in self.feed(MODEL_SAMPLE_RATE, None, is_final=True):
+            yield event
+        if self.segment_start is not None:
+            yield self._decode(self.segment_start, self.total, final=True)
+        self.partial = ""
+
+    def _run_vad(self, begin, end, is_final):
+        segment = self.audio[begin - self.offset:end - self.offset]
+        with self.vad_pool.acquire() as vad:
+            res = vad.generate(
+                input=segment,
+                cache=self.vad_cache,
+                is_final=is_final,
+                chunk_size=len(segment) * 1000 // MODEL_SAMPLE_RATE,
+            )
+        values = res[0].get("value", []) if res else []
+        for beg_ms, end_ms in values:
+            if beg_ms >= 0:
+                self.segment_start = beg_ms * MODEL_SAMPLE_RATE // 1000
+                self.last_partial_end = self.segment_start
+                self.speech_detected_at = time.perf_counter()
+                self.first_token_pending = True
+            if end_ms >= 0 and self.segment_start is not None:
+                seg_end = min(end_ms * MODEL_SAMPLE_RATE // 1000, self.total)
+                yield self._decode(self.segment_start, seg_end, final=True)
+
+    def _decode(self, begin, end, final):
+        segment = self.audio[max(begin - self.offset, 0):end - self.offset]
+        text = ""
+        if len(segment) > 0:
+            with self.asr_pool.acquire() as model:
+                res = model.generate(input=segment, language="auto", use_itn=True)
+            if res:
+                text = _postprocess(res[0].get("text", ""))
+
+        if self.first_token_pending and text:
+            self.first_token_latencies.append(time.perf_counter() - self.speech_detected_at)
+            self.first_token_pending = False
+
+        event = {
+            "type": "final" if final else "partial",
+            "text": text,
+            "start_ms": begin * 1000 // MODEL_SAMPLE_RATE,
+            "end_ms": end * 1000 // MODEL_SAMPLE_RATE,
+        }
+        if final:
+            if text:
+                self.finals.append(text)
+            self.partial = ""
+            self.segment_start = None
+            self.first_token_pending = False
+        else:
+            self.partial = text
+            self.last_partial_end = end
+        return event
+
+    def _trim(self):
+        """丢弃不再需要的音频（当前语音段之前、且 VAD 已处理过的部分）"""
+        # VAD 给出的语音起点可能早于当前分块，保留一段回看余量
+        keep_from = self.segment_start if self.segment_start is not None else self.vad_fed - MODEL_SAMPLE_RATE * 2
+        drop = keep_from - self.offset
+        if drop > 0:
+            self.audio = self.audio[drop:]
+            self.offset += drop
+
+    def close(self):
+        """结束会话，释放持有的模型引用；可重复调用"""
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def text(self):
+        """当前展示文本：已确定的结果 + 中间结果"""
+        parts = list(self.finals)
+        if self.partial:
+            parts.append(self.partial + " …")
+        return "\n".join(parts)
+
+    def latency_stats(self):
+        """首字延迟统计"""
+        if not self.first_token_latencies:
+            return None
+        ms = sorted(x * 1000 for x in self.first_token_latencies)
+        return {
+            "segments": len(ms),
+            "p50_ms": round(ms[len(ms) // 2], 1),
+            "max_ms": round(ms[-1], 1),
+            "target_ms": FIRST_TOKEN_TARGET_MS,
+            "within_target": sum(1 for x in ms if x <= FIRST_TOKEN_TARGET_MS) / float(len(ms)),
+        }
+
+    def format_latency(self):
+        stats = self.latency_stats()
+        if stats is None:
+            return "首字延迟: -"
+        return (
+            f"首字延迟 p50: {stats['p50_ms']} ms  最大: {stats['max_ms']} ms  "
+            f"目标 {stats['target_ms']} ms 达成率: {stats['within_target']:.0%}"
+        )
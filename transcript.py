@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 结构化识别结果与字幕输出
+一次识别得到按时间排序的语音段（起止时间、语种、情感、声音事件标签），
+可逐段写出为 SRT、WebVTT 或 JSONL，长音频边识别边写盘
+"""
+
+import io
+import os
+import re
+import json
+import argparse
+from collections import Counter
+
+from audio_utils import MODEL_SAMPLE_RATE, load_audio
+from chunked_reader import should_stream
+from long_audio import LONG_AUDIO_SECONDS, decoded_segment, transcribe_file, transcribe_long
+from model_registry import add_pipeline_argument, get_registry, make_key, pipeline_key
+from silence_gate import empty_result, gate, shift_segment
+
+
+# SenseVoice 输出中的标签，如 "<|zh|><|NEUTRAL|><|Speech|><|woitn|>"
+TAG_PATTERN = re.compile(r"<\|([^|]*)\|>")
+
+LANGUAGE_TAGS = {"zh", "en", "yue", "ja", "ko", "nospeech"}
+EMOTION_TAGS = {"HAPPY", "SAD", "ANGRY", "NEUTRAL", "FEARFUL", "DISGUSTED", "SURPRISED", "EMO_UNKNOWN"}
+EVENT_TAGS = {"Speech", "BGM", "Applause", "Laughter", "Cry", "Sneeze", "Breath", "Cough", "Event_UNK"}
+
+FORMATS = ("srt", "vtt", "jsonl")
+
+
+def parse_tags(raw_text):
+    """
+    拆分标签和文本
+
+    Returns:
+        {"text": 去掉标签的文本, "language", "emotion", "events": [声音事件]}；
+        多段拼接的文本取第一个语种 / 情感标签
+    """
+    tags = TAG_PATTERN.findall(raw_text or "")
+    events = []
+    for tag in tags:
+        if tag in EVENT_TAGS and tag not in events:
+            events.append(tag)
+    return {
+        "text": TAG_PATTERN.sub("", raw_text or "").strip(),
+        "language": next((t for t in tags if t in LANGUAGE_TAGS), None),
+        "emotion": next((t for t in tags if t in EMOTION_TAGS), None),
+        "events": events,
+    }
+
+
+def make_segment(index, segment):
+    """把 long_audio.decoded_segment 的结果整理为带标签字段的语音段"""
+    parsed = parse_tags(segment["text"])
+    item = {
+        "index": index,
+        "start": segment["start"],
+        "end": segment["end"],
+        "text": parsed["text"],
+        "raw_text": segment["text"],
+        "language": parsed["language"],
+        "emotion": parsed["emotion"],
+        "events": parsed["events"],
+    }
+    for field in ("timestamp", "words"):
+        if field in segment:
+            item[field] = segment[field]
+    return item
+
+
+class SegmentSummary:
+    """
+    按时间顺序累计各语音段的标签统计
+
+    keep=False 时（边识别边写出）只保留统计，不在内存中保留各段
+    """
+
+    def __init__(self, keep=True):
+        self.segments = [] if keep else None
+        self.count = 0
+        # 按语音段时长加权
+        self.weights = {"language": Counter(), "emotion": Counter()}
+        self.events = []
+
+    def add(self, segment):
+        self.count += 1
+        for field, weights in self.weights.items():
+            if segment.get(field):
+                weights[segment[field]] += max(segment["end"] - segment["start"], 1)
+        self.events.extend(e for e in segment["events"] if e not in self.events)
+        if self.segments is not None:
+            self.segments.append(segment)
+
+    def most_common(self, field):
+        """按语音段时长加权取最常见的标签"""
+        weights = self.weights[field]
+        return weights.most_common(1)[0][0] if weights else None
+
+
+def structure_result(result, summary):
+    """
+    汇总结构化结果
+
+    Returns:
+        {"text": 原始识别文本（含标签，与 generate 输出一致）, "plain_text": 去掉标签的文本,
+         "language", "emotion", "events", "segment_count", "segments": [...]}；
+        summary 不保留各段时没有 "segments"
+    """
+    text = result.get("text", "") if result else ""
+    structured = {
+        "text": text,
+        "plain_text": parse_tags(text)["text"],
+        "language": summary.most_common("language"),
+        "emotion": summary.most_common("emotion"),
+        "events": list(summary.events),
+        "segment_count": summary.count,
+    }
+    if summary.segments is not None:
+        structured["segments"] = summary.segments
+    return structured
+
+
+def format_timestamp(ms, separator=","):
+    """毫秒 → HH:MM:SS,mmm（WebVTT 用 "."）"""
+    ms = max(0, int(ms))
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{ms:03d}"
+
+
+class SegmentWriter:
+    """逐段写出识别结果，每段写完立即刷新到磁盘"""
+
+    def __init__(self, file):
+        self.file = file
+        self.count = 0
+        self.header()
+
+    def header(self):
+        pass
+
+    def format(self, segment):
+        raise NotImplementedError
+
+    def write(self, segment):
+        text = self.format(segment)
+        if text:
+            self.file.write(text)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SrtWriter(SegmentWriter):
+    def format(self, segment):
+        if not segment["text"]:
+            return ""
+        self.count += 1
+        return (f"{self.count}\n{format_timestamp(segment['start'])} --> {format_timestamp(segment['end'])}\n"
+                f"{segment['text']}\n\n")
+
+
+class VttWriter(SegmentWriter):
+    def header(self):
+        self.file.write("WEBVTT\n\n")
+
+    def format(self, segment):
+        if not segment["text"]:
+            return ""
+        self.count += 1
+        return (f"{format_timestamp(segment['start'], '.')} --> {format_timestamp(segment['end'], '.')}\n"
+                f"{segment['text']}\n\n")
+
+
+class JsonlWriter(SegmentWriter):
+    def format(self, segment):
+        self.count += 1
+        return json.dumps(segment, ensure_ascii=False) + "\n"
+
+
+WRITERS = {"srt": SrtWriter, "vtt": VttWriter, "jsonl": JsonlWriter}
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    return ext if ext in WRITERS else "jsonl"
+
+
+def open_writer(path, fmt=None):
+    """按扩展名（.srt / .vtt / .jsonl）或 fmt 创建写出器"""
+    fmt = detect_format(path, fmt)
+    if fmt not in WRITERS:
+        raise ValueError(f"不支持的输出格式: {fmt}，可选: {', '.join(FORMATS)}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return WRITERS[fmt](open(path, "w", encoding="utf-8"))
+
+
+def format_segments(segments, fmt):
+    """把语音段格式化为字符串（用于 HTTP 响应等不落盘的场景）"""
+    if fmt not in WRITERS:
+        raise ValueError(f"不支持的输出格式: {fmt}，可选: {', '.join(FORMATS)}")
+    buffer = io.StringIO()
+    writer = WRITERS[fmt](buffer)
+    for segment in segments:
+        writer.write(segment)
+    return buffer.getvalue()
+
+
+def transcribe_segments(audio, key, generate_kwargs=None, writer=None, progress=None):
+    """
+    一次识别得到结构化结果
+
+    有 VAD 的流程按 VAD 切分后逐段识别（每段只识别一次），各段结果按时间顺序交给 writer；
+    不带 VAD 的流程整段作为一个语音段。整段静音时返回空结果，结果中 "silence" 为静音过滤情况（见 silence_gate.py）
+
+    Args:
+        audio: 音频文件路径或 16kHz float32 波形
+        key: 注册表键（通常来自 pipeline_key）
+        generate_kwargs: 额外的 generate 参数
+        writer: SegmentWriter，可选；给出时各段写出后即丢弃，结果中只有汇总统计，没有 "segments"
+        progress: 进度回调 progress(已完成段数, 总段数)
+
+    Returns:
+        structure_result 的结构化结果
+    """
+    generate_kwargs = generate_kwargs or {}
+    segments = SegmentSummary(keep=writer is None)
+
+    def on_segment(segment):
+        segment = make_segment(segments.count, segment)
+        segments.add(segment)
+        if writer is not None:
+            writer.write(segment)
+
+    if isinstance(audio, str) and should_stream(audio):
+        # 大文件分块读取，边识别边写出
+        result = transcribe_file(audio, key, progress=progress, generate_kwargs=generate_kwargs,
+                                 on_segment=on_segment)
+        return structure_result(result, segments)
+
+    pcm = load_audio(audio) if isinstance(audio, str) else audio
+    # 整段静音不送入模型；裁掉首尾长静音，各段时间加回偏移
+    pcm, offset_ms, silence = gate(pcm)
+    if silence is not None and silence["empty"]:
+        if progress is not None:
+            progress(1, 1)
+        return dict(structure_result(empty_result(silence), segments), silence=silence)
+
+    def on_trimmed_segment(segment):
+        on_segment(shift_segment(segment, offset_ms))
+
+    if key.vad_model or len(pcm) > LONG_AUDIO_SECONDS * MODEL_SAMPLE_RATE:
+        result = transcribe_long(pcm, key, progress=progress, generate_kwargs=generate_kwargs,
+                                 on_segment=on_trimmed_segment)
+    else:
+        with get_registry().get_pool(key).acquire() as model:
+            res = model.generate(input=pcm, **generate_kwargs)
+        result = res[0] if res else {}
+        on_trimmed_segment(decoded_segment(0, len(pcm) * 1000 // MODEL_SAMPLE_RATE, result))
+        if progress is not None:
+            progress(1, 1)
+    structured = structure_result(result, segments)
+    if silence is not None:
+        structured["silence"] = silence
+    return structured
+
+
+def main():
+    from backends import add_backend_argument
+
+    parser = argparse.ArgumentParser(description="SenseVoice 识别并输出字幕 / 分段结果")
+    parser.add_argument("--audio_path", type=str, required=True, help="音频文件路径")
+    parser.add_argument("--output", type=str, required=True, help="输出文件路径，.srt / .vtt / .jsonl")
+    parser.add_argument("--format", type=str, default=None, choices=FORMATS, help="输出格式（默认按扩展名判断）")
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default=None,
+        help="本地模型目录路径（可选，如果不提供将自动下载）"
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="small",
+        choices=["small", "medium"],
+        help="模型大小 (默认: small)"
+    )
+    add_backend_argument(parser)
+    add_pipeline_argument(parser)
+    parser.add_argument("--word_timestamps", action="store_true",
+                        help="输出词级时间戳（需要 funasr 版本支持 output_timestamp）")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.audio_path):
+        print(f"错误: 音频文件不存在: {args.audio_path}")
+        return 1
+
+    key = make_key(args.model_dir, args.model, backend=args.backend)
+    # 字幕需要分段时间，auto 时按完整流程处理
+    pipeline = "full" if args.pipeline == "auto" else args.pipeline
+    key, generate_kwargs = pipeline_key(key, pipeline)
+    if args.word_timestamps:
+        generate_kwargs["output_timestamp"] = True
+
+    with open_writer(args.output, args.format) as writer:
+        result = transcribe_segments(args.audio_path, key, generate_kwargs, writer)
+
+    print("=" * 50)
+    print(result["plain_text"])
+    print("=" * 50)
+    print(f"语种: {result['language']}  情感: {result['emotion']}  "
+          f"声音事件: {', '.join(result['events']) or '-'}")
+    print(f"共 {result['segment_count']} 段，已写入: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
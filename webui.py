@@ -6,62 +6,387 @@ SenseVoice Web UI
 """
 
 import os
+import time
+import inspect
+import logging
+import threading
+from collections import Counter
+from contextlib import ExitStack, contextmanager
 import gradio as gr
-from funasr import AutoModel
+from audio_utils import MODEL_SAMPLE_RATE, load_audio, to_model_input
+from backends import BACKENDS, DEFAULT_BACKEND
+from model_registry import (DEFAULT_MODEL_DIR, DEFAULT_PIPELINE, PIPELINES, available_memory_mb, get_registry,
+                            make_key, pipeline_key, warmup_audio)
+from micro_batcher import estimate_duration, get_batcher
+from streaming import StreamingSession
+from result_cache import get_cache
+from long_audio import LONG_AUDIO_SECONDS, transcribe_file, transcribe_long
+from chunked_reader import should_stream
+from metrics import profiled, profiling_enabled, trace
+from readiness import readiness, start_background_imports
+from cpu_tuning import configure_from_env
+from job_queue import FINAL_STATES, JobQueue, QueueFull, format_job
+from transcript import FORMATS, format_segments, transcribe_segments
+from download_model import verify_model
+from silence_gate import empty_result, gate, shift_result
 
 
-# 全局模型变量
-model = None
+# 当前选用的模型组合（模型实例由注册表统一管理）
+model_key = None
 model_name = "small"
 
+# 正在服务的模型：名称 → 模型键；切换模型后内存充足时旧模型继续为指定它的请求服务
+_served = {}
+# 各模型进行中的请求数；已下线的模型在最后一个请求完成后释放
+_in_flight = Counter()
+_retired = set()
+_model_lock = threading.Lock()
+# 后台切换模型的线程和状态
+_switch_thread = None
+_switch_status = ""
 
-def load_model(model_dir=None, selected_model="small"):
-    """加载模型"""
-    global model, model_name
+# 切换模型后，可用内存不低于该值（MB）时保留旧模型继续服务，否则下线旧模型
+KEEP_MODEL_MIN_FREE_MB = int(os.environ.get("SENSEVOICE_KEEP_MODEL_MIN_FREE_MB", "2048"))
+
+# 启动时后台预加载模型；加载完成前到达的请求最多等待的秒数
+PRELOAD_TIMEOUT_S = float(os.environ.get("SENSEVOICE_PRELOAD_TIMEOUT_S", "600"))
+_preload_thread = None
+
+# 后台识别任务队列（首次使用时创建）
+_jobs = None
+_jobs_lock = threading.Lock()
+
+logger = logging.getLogger("sensevoice")
+
+
+def _release_model(key):
+    """取消固定并释放模型（所有流水线组合）"""
+    registry = get_registry()
+    registry.unpin(key)
+    registry.evict_model(key)
+    logger.info("已释放模型: %s (%s)", key.model, key.backend)
+
+
+def activate_model(key, name):
+    """
+    原子切换当前模型，调用前模型需已加载并 pin
+
+    同名模型（如换了推理后端）被替换；不同名的旧模型在可用内存充足时按原名称继续服务，
+    否则下线，等它的最后一个请求完成后释放
+    """
+    global model_key, model_name
+    
+    with _model_lock:
+        previous, previous_name = model_key, model_name
+        already = key in _served.values()
+        replaced = _served.get(name)
+        _served[name] = key
+        model_key, model_name = key, name
+        _retired.discard(key)
+        
+        dropped = [replaced] if replaced not in (None, key) else []
+        if previous not in (None, key, replaced):
+            free_mb = available_memory_mb()
+            if free_mb is None or free_mb < KEEP_MODEL_MIN_FREE_MB:
+                _served.pop(previous_name, None)
+                dropped.append(previous)
+        idle = []
+        for old in dropped:
+            if _in_flight[old] > 0:
+                _retired.add(old)
+            else:
+                _in_flight.pop(old, None)
+                idle.append(old)
+    if already:
+        # 重复加载正在服务的模型，抵消本次 pin
+        get_registry().unpin(key)
+    for old in idle:
+        _release_model(old)
+
+
+@contextmanager
+def use_model(name=None):
+    """
+    取当前（或按名称指定的）模型键，请求期间计数；模型已下线时在最后一个请求结束后释放
+
+    Raises:
+        KeyError: 指定名称的模型未在服务
+    """
+    with _model_lock:
+        key = _served[name] if name else model_key
+        if key is None:
+            raise RuntimeError("请先加载模型")
+        _in_flight[key] += 1
+    try:
+        yield key
+    finally:
+        with _model_lock:
+            _in_flight[key] -= 1
+            release = key in _retired and _in_flight[key] <= 0
+            if release:
+                _retired.discard(key)
+                _in_flight.pop(key, None)
+        if release:
+            _release_model(key)
+
+
+def open_stream(name=None):
+    """
+    创建流式识别会话，会话期间持有模型引用（计入进行中请求），切换模型后旧模型在会话关闭后才释放
+
+    用完需调用 session.close()
+    """
+    stack = ExitStack()
+    key = stack.enter_context(use_model(name))
+    try:
+        return StreamingSession(key, release=stack.close)
+    except BaseException:
+        stack.close()
+        raise
+
+
+def close_stream(session):
+    """关闭流式会话（页面关闭时由 Gradio 回调）"""
+    if session is not None:
+        session.close()
+
+
+def served_models():
+    """正在服务的模型及进行中的请求数"""
+    with _model_lock:
+        return {
+            "active": model_name if model_key is not None else None,
+            "served": {name: {"model": key.model, "backend": key.backend, "in_flight": _in_flight[key]}
+                       for name, key in _served.items()},
+            "retiring": [{"model": key.model, "backend": key.backend, "in_flight": _in_flight[key]}
+                         for key in _retired],
+        }
+
+
+def load_model(model_dir=None, selected_model="small", backend=None):
+    """
+    加载并预热模型，完成后原子切换为当前模型；加载期间原模型继续服务
+
+    backend 为推理后端 "torch" / "int8" / "onnx"（默认取环境变量 SENSEVOICE_BACKEND）
+    """
+    # 已有模型在服务时切换模型不影响就绪状态
+    first_load = not readiness.is_ready
+    key = None
+    try:
+        key = make_key(model_dir, selected_model, backend=backend)
+        registry = get_registry()
+        if first_load:
+            readiness.set("loading_model", key.model)
+        registry.pin(key)
+        pool = registry.get_pool(key)
+        if first_load:
+            readiness.set("warming_up", key.model)
+        registry.warmup(pool, warmup_audio(model_dir))
+        activate_model(key, selected_model)
+        readiness.set("ready", key.model)
+        return f"✓ 模型加载成功（{key.backend}）"
+    except Exception as e:
+        if key is not None:
+            get_registry().unpin(key)
+        if first_load:
+            readiness.set("failed", str(e))
+        return f"✗ 模型加载失败: {str(e)}"
+
+
+def switch_model(model_dir=None, selected_model="small", backend=None):
+    """界面"加载模型"按钮：在后台加载新模型，当前模型继续服务直到新模型预热完成"""
+    global _switch_thread, _switch_status
     
-    model_map = {
-        "small": "iic/SenseVoiceSmall",
-        "medium": "iic/SenseVoiceMedium"
-    }
+    if _switch_thread is not None and _switch_thread.is_alive():
+        return f"已有模型正在后台加载: {_switch_status}"
     
-    model_name = selected_model
-    model_id = model_map[selected_model]
+    def run():
+        global _switch_status
+        _switch_status = f"正在后台加载 {selected_model}（{backend or '默认后端'}）"
+        _switch_status = load_model(model_dir, selected_model, backend)
     
+    _switch_thread = threading.Thread(target=run, name="switch-model", daemon=True)
+    _switch_thread.start()
+    current = f"，当前仍由 {model_name} 提供服务" if model_key is not None else ""
+    return f"正在后台加载 {selected_model}{current}"
+
+
+def preload_model(model_dir=DEFAULT_MODEL_DIR, selected_model="small"):
+    """加载并用示例音频预热模型，完成后设为当前模型（用户已手动加载其他模型时不覆盖）"""
+    key = None
     try:
-        if model_dir and os.path.exists(model_dir):
-            model = AutoModel(
-                model=model_dir,
-                device="cpu",
-                vad_model="fsmn-vad",
-                punc_model="ct-punc",
-            )
+        key = make_key(model_dir, selected_model)
+        registry = get_registry()
+        readiness.set("loading_model", key.model)
+        registry.pin(key)
+        pool = registry.get_pool(key)
+        readiness.set("warming_up", key.model)
+        registry.warmup(pool, warmup_audio(model_dir))
+        if model_key is None:
+            activate_model(key, selected_model)
         else:
-            model = AutoModel(
-                model=model_id,
-                device="cpu",
-                vad_model="fsmn-vad",
-                punc_model="ct-punc",
-            )
-        return "✓ 模型加载成功"
+            registry.unpin(key)
+        readiness.set("ready", model_key.model)
     except Exception as e:
-        return f"✗ 模型加载失败: {str(e)}"
+        logger.exception("模型预加载失败")
+        if key is not None:
+            get_registry().unpin(key)
+        if model_key is None:
+            readiness.set("failed", str(e))
+
+
+def preload_enabled():
+    """启动时是否后台预加载模型（设置 SENSEVOICE_PRELOAD=0 关闭）"""
+    return os.environ.get("SENSEVOICE_PRELOAD", "1") != "0"
+
+
+def start_preload(model_dir=DEFAULT_MODEL_DIR, selected_model="small"):
+    """在后台线程中预加载模型，本地模型目录不存在时不自动下载"""
+    global _preload_thread
+    
+    if not model_dir or not os.path.exists(model_dir):
+        return None
+    # 快速完整性检查（大小、LFS 指针），避免加载到一半才报出难以理解的错误
+    problems = verify_model(model_dir)
+    if problems:
+        readiness.set("failed", "模型文件不完整: " + "；".join(problems) + "，请运行 python download_model.py")
+        return None
+    _preload_thread = threading.Thread(
+        target=preload_model, args=(model_dir, selected_model), name="preload", daemon=True
+    )
+    _preload_thread.start()
+    return _preload_thread
+
+
+def wait_for_model(timeout=PRELOAD_TIMEOUT_S):
+    """模型仍在预加载时等待其完成，请求排队而不是直接报错；返回是否有可用模型"""
+    if model_key is None and _preload_thread is not None and _preload_thread.is_alive():
+        readiness.wait_for(("ready", "failed"), timeout)
+    return model_key is not None
+
+
+def service_status():
+    """服务就绪状态，用于界面状态栏"""
+    text = readiness.describe()
+    if _switch_status:
+        text += f"\n{_switch_status}"
+    served = served_models()
+    if len(served["served"]) > 1 or served["retiring"]:
+        text += "\n服务中: " + "  ".join(f"{name}({m['in_flight']})" for name, m in served["served"].items())
+        if served["retiring"]:
+            text += f"  待释放: {len(served['retiring'])}"
+    imported = readiness.snapshot()["import_seconds"]
+    if imported:
+        text += "\n依赖导入耗时: " + "  ".join(f"{k} {v:.2f}s" for k, v in imported.items())
+    return text
+
+
+def recognize(model_input, inline=False, progress=None, pipeline=None, model=None):
+    """
+    识别 16kHz 波形；相同音频 + 相同模型配置直接返回缓存结果
+
+    inline 为 True 时在当前线程直接推理（性能剖析只能采集当前线程）
+    progress 为长音频分段识别的进度回调 progress(已完成段数, 总段数)
+    pipeline 为流水线 "auto" / "asr" / "vad_asr" / "full"，默认取环境变量 SENSEVOICE_PIPELINE
+    model 为正在服务的模型名称（如 "medium"），默认为当前模型
+    """
+    with use_model(model) as base:
+        return _recognize(model_input, base, inline, progress, pipeline)
+
+
+def _recognize(model_input, base, inline, progress, pipeline):
+    # 整段静音直接返回空结果；首尾长静音裁掉后再选择流程、送入模型
+    model_input, offset_ms, silence = gate(model_input)
+    if silence is not None and silence["empty"]:
+        return empty_result(silence)
+    key, generate_kwargs = pipeline_key(base, pipeline, len(model_input) / float(MODEL_SAMPLE_RATE))
+    
+    def run(pcm):
+        if len(pcm) > LONG_AUDIO_SECONDS * MODEL_SAMPLE_RATE:
+            # 长音频总是按 VAD 分段并行识别，是否加标点按流水线
+            return transcribe_long(pcm, key, progress=progress, generate_kwargs=generate_kwargs)
+        if inline:
+            with get_registry().get_pool(key).acquire() as model:
+                result = model.generate(input=pcm, **generate_kwargs)
+            return result[0] if result else None
+        # 并发请求由调度器合并成批量推理
+        return get_batcher().transcribe(pcm, key, generate_kwargs=generate_kwargs)
+    
+    cache = get_cache()
+    if cache is None:
+        result = run(model_input)
+    else:
+        result = cache.get_or_compute(model_input, key, run, **generate_kwargs)
+    result = shift_result(result, offset_ms)
+    if result and silence is not None:
+        # 与 transcript.transcribe_segments 一致，附上静音过滤情况（复制一份，不改缓存中的结果）
+        result = dict(result, silence=silence)
+    return result
+
+
+def transcribe_path(audio_file, profile=None, progress=None, pipeline=None, model=None):
+    """
+    识别音频文件，返回结果字典
+
+    Args:
+        audio_file: 音频文件路径
+        profile: 性能剖析方式 "cprofile" / "torch"，默认取环境变量 SENSEVOICE_PROFILE
+        progress: 进度回调 progress(已完成段数, 总段数)
+        pipeline: 流水线，见 recognize
+        model: 正在服务的模型名称，默认为当前模型
+    """
+    with use_model(model) as base, trace("transcribe"), profiled("transcribe", profile):
+        if should_stream(audio_file):
+            # 大文件分块读取识别，不一次性解码到内存
+            key, generate_kwargs = pipeline_key(base, pipeline)
+            return transcribe_file(audio_file, key, progress=progress, generate_kwargs=generate_kwargs)
+        return _recognize(load_audio(audio_file), base, profiling_enabled(profile), progress, pipeline)
+
+
+def transcribe_structured(audio_file, pipeline=None, writer=None, progress=None, model=None):
+    """
+    识别音频文件，返回带分段时间和语种/情感/事件标签的结构化结果（见 transcript.py）
+
+    writer 为 transcript.SegmentWriter 时每段识别完成后立即写出
+    """
+    with use_model(model) as base, trace("transcribe"):
+        key, generate_kwargs = pipeline_key(base, pipeline, estimate_duration(audio_file))
+        return transcribe_segments(audio_file, key, generate_kwargs, writer, progress)
+
+
+def run_job(audio_file, progress=None, pipeline=None, model=None):
+    """后台任务的执行函数：等待模型就绪（未预加载时加载默认模型）后识别，结果包含分段信息，可导出字幕"""
+    if not wait_for_model():
+        status = load_model(DEFAULT_MODEL_DIR, "small")
+        if model_key is None:
+            raise RuntimeError(status)
+    return transcribe_structured(audio_file, pipeline, progress=progress, model=model)
+
+
+def get_jobs():
+    """返回进程内共享的后台任务队列，创建时恢复上次未完成的任务"""
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            _jobs = JobQueue(run_job)
+            if _jobs.recovered:
+                logger.info("恢复了 %d 个未完成的后台任务", _jobs.recovered)
+        return _jobs
 
 
 def transcribe(audio_file, model_dir_input):
     """转录音频"""
-    global model
-    
-    if model is None:
+    if not wait_for_model():
         return "错误: 请先加载模型"
     
     if audio_file is None:
         return "错误: 请上传音频文件或录制音频"
     
     try:
-        result = model.generate(input=audio_file)
+        result = transcribe_path(audio_file)
         
-        if result and len(result) > 0:
-            text = result[0].get("text", "")
+        if result:
+            text = result.get("text", "")
             return text
         else:
             return "识别失败，未返回结果"
@@ -69,68 +394,156 @@ def transcribe(audio_file, model_dir_input):
         return f"识别错误: {str(e)}"
 
 
-def transcribe_realtime(audio, auto_submit):
-    """实时转录音频（录音后自动识别）"""
-    global model
+def transcribe_job(audio_file, pipeline=None):
+    """上传文件提交为后台任务，定期输出进度，完成后输出识别结果；页面关闭后任务继续执行"""
+    if audio_file is None:
+        yield "错误: 请上传音频文件或录制音频", "", ""
+        return
     
-    if model is None:
+    try:
+        job_id = get_jobs().submit(audio_file, options={"pipeline": pipeline})
+    except QueueFull as e:
+        yield f"错误: {str(e)}", "", ""
+        return
+    
+    while True:
+        job = get_jobs().get(job_id)
+        if job["status"] in FINAL_STATES:
+            if job["status"] == "finished":
+                yield job["result"].get("text", ""), format_job(job), job_id
+            else:
+                yield f"识别错误: {job['error'] or job['status']}", format_job(job), job_id
+            return
+        yield "", format_job(job), job_id
+        time.sleep(1)
+
+
+def query_job(job_id):
+    """按任务 ID 查询状态和结果（服务重启后仍可查询）"""
+    job = get_jobs().get((job_id or "").strip())
+    if job is None:
+        return "任务不存在", ""
+    text = job["result"].get("text", "") if job["status"] == "finished" and job["result"] else ""
+    return format_job(job), text
+
+
+def export_subtitles(job_id, fmt):
+    """把已完成任务的分段结果导出为字幕文件，不重新识别"""
+    job = get_jobs().get((job_id or "").strip())
+    if job is None or job["status"] != "finished" or not job["result"]:
+        return None, "任务不存在或尚未完成"
+    segments = job["result"].get("segments")
+    if not segments:
+        return None, "该任务的结果没有分段信息"
+    path = os.path.abspath(os.path.join(get_jobs().job_dir, "exports", f"{job['job_id']}.{fmt}"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(format_segments(segments, fmt))
+    return path, f"已导出 {len(segments)} 段"
+
+
+def transcribe_realtime(audio, auto_submit, playback=True, pipeline=None):
+    """实时转录音频（录音后自动识别）"""
+    if not wait_for_model():
         return "错误: 请先加载模型", None
     
     if audio is None:
         return "等待录音...", None
     
     try:
-        import tempfile
-        import numpy as np
-        import soundfile as sf
-        
         # 处理不同的音频输入格式
         if isinstance(audio, tuple):
             # Gradio Audio 返回格式: (sample_rate, audio_data)
+            # 直接在内存中转换为 16kHz float32 单声道，不再写临时 WAV 文件
             sample_rate, audio_data = audio
-            # 转换为 numpy 数组
-            if isinstance(audio_data, list):
-                audio_data = np.array(audio_data, dtype=np.float32)
-            elif not isinstance(audio_data, np.ndarray):
-                audio_data = np.array(audio_data, dtype=np.float32)
-            
-            # 如果是单声道，确保是 1D 数组
-            if len(audio_data.shape) > 1 and audio_data.shape[0] == 1:
-                audio_data = audio_data[0]
-            
-            # 保存为临时文件
-            tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-            tmp_file.close()
-            sf.write(tmp_file.name, audio_data, sample_rate)
-            audio_path = tmp_file.name
+            model_input = to_model_input(sample_rate, audio_data)
+            # 回放直接返回原始数据，仅在需要回放时由 Gradio 编码
+            playback_audio = audio
         elif isinstance(audio, str):
             # 如果是文件路径
-            audio_path = audio
+            model_input = playback_audio = audio
         elif isinstance(audio, dict):
             # Gradio 可能返回字典格式
-            audio_path = audio.get("name") or audio.get("path")
-            if not audio_path:
+            model_input = playback_audio = audio.get("name") or audio.get("path")
+            if not model_input:
                 return "错误: 无法获取音频文件路径", None
         else:
             return f"错误: 不支持的音频格式: {type(audio)}", None
         
+        if not playback:
+            playback_audio = None
+        
         # 执行识别
-        result = model.generate(input=audio_path)
+        with trace("realtime"), profiled("realtime"):
+            if isinstance(model_input, str):
+                model_input = load_audio(model_input)
+            result = recognize(model_input, inline=profiling_enabled(), pipeline=pipeline)
         
-        if result and len(result) > 0:
-            text = result[0].get("text", "")
-            return text, audio_path
+        if result:
+            text = result.get("text", "")
+            return text, playback_audio
         else:
-            return "识别失败，未返回结果", audio_path
+            return "识别失败，未返回结果", playback_audio
     except Exception as e:
         import traceback
         error_msg = f"识别错误: {str(e)}\n{traceback.format_exc()}"
         return error_msg, None
 
 
+def transcribe_stream(chunk, session):
+    """流式识别：每收到一块麦克风音频就增量识别，逐步输出中间/最终结果"""
+    if not wait_for_model():
+        yield "错误: 请先加载模型", session
+        return
+    
+    if chunk is None:
+        yield (session.text() if session else ""), session
+        return
+    
+    try:
+        if session is None:
+            session = open_stream()
+        sample_rate, audio_data = chunk
+        for _ in session.feed(sample_rate, audio_data):
+            yield session.text(), session
+        yield session.text(), session
+    except Exception as e:
+        yield f"识别错误: {str(e)}", session
+
+
+def finish_stream(session):
+    """录音结束：输出最后一段结果和首字延迟统计，并重置会话"""
+    if session is None:
+        return "", "首字延迟: -", None
+    try:
+        for _ in session.finish():
+            pass
+        return session.text(), session.format_latency(), None
+    except Exception as e:
+        return f"识别错误: {str(e)}", "首字延迟: -", None
+    finally:
+        session.close()
+
+
+def batch_stats():
+    """推理调度与缓存统计"""
+    text = get_batcher().format_stats()
+    cache = get_cache()
+    if cache is not None:
+        text += "\n" + cache.format_stats()
+    jobs = get_jobs().stats()
+    text += "\n后台任务: " + "  ".join(f"{k}: {v}" for k, v in sorted(jobs.items()))
+    return text
+
+
 def create_interface():
     """创建 Gradio 界面"""
-    with gr.Blocks(title="SenseVoice 语音识别") as demo:
+    blocks_kwargs = {"title": "SenseVoice 语音识别"}
+    # 定期清理 Gradio 缓存的回放音频（Gradio 4.x 支持）
+    if "delete_cache" in inspect.signature(gr.Blocks.__init__).parameters:
+        blocks_kwargs["delete_cache"] = (3600, 3600)
+    
+    with gr.Blocks(**blocks_kwargs) as demo:
         gr.Markdown("# SenseVoice 语音识别系统")
         gr.Markdown("支持实时录音识别和音频文件上传识别")
         
@@ -141,13 +554,23 @@ def create_interface():
                     value="small",
                     label="选择模型"
                 )
+                backend_selector = gr.Radio(
+                    choices=list(BACKENDS),
+                    value=DEFAULT_BACKEND,
+                    label="推理后端（int8: 动态量化，onnx: ONNX Runtime）"
+                )
                 model_dir_input = gr.Textbox(
                     label="本地模型路径（可选）",
                     placeholder="例如: ./models/iic/SenseVoiceSmall",
                     value="./models/iic/SenseVoiceSmall"
                 )
+                pipeline_selector = gr.Radio(
+                    choices=["auto"] + list(PIPELINES),
+                    value=DEFAULT_PIPELINE,
+                    label="识别流程（auto: 短音频只识别，其余 VAD+识别+标点）"
+                )
                 load_btn = gr.Button("加载模型", variant="primary")
-                model_status = gr.Textbox(label="模型状态", interactive=False)
+                model_status = gr.Textbox(label="模型状态", lines=3, interactive=False)
         
         with gr.Tabs():
             with gr.TabItem("🎤 实时录音识别"):
@@ -164,6 +587,10 @@ def create_interface():
                             label="录音后自动识别",
                             value=True
                         )
+                        playback_enabled = gr.Checkbox(
+                            label="显示录音回放",
+                            value=True
+                        )
                         realtime_transcribe_btn = gr.Button("开始识别", variant="primary")
                     with gr.Column():
                         realtime_output = gr.Textbox(
@@ -173,12 +600,35 @@ def create_interface():
                         )
                         realtime_audio_playback = gr.Audio(
                             label="录音回放",
-                            type="filepath",
+                            type="numpy",
                             interactive=False
                         )
             
+            with gr.TabItem("🎙️ 流式识别"):
+                gr.Markdown("### 边说边识别，语音段结束后立即给出结果")
+                with gr.Row():
+                    with gr.Column():
+                        stream_audio = gr.Audio(
+                            label="麦克风",
+                            type="numpy",
+                            sources=["microphone"],
+                            streaming=True
+                        )
+                        stream_latency = gr.Textbox(label="延迟统计", interactive=False)
+                    with gr.Column():
+                        stream_output = gr.Textbox(
+                            label="识别结果",
+                            lines=10,
+                            interactive=False
+                        )
+                if "delete_callback" in inspect.signature(gr.State.__init__).parameters:
+                    # 页面关闭时归还会话持有的模型引用（录音未正常结束时）
+                    stream_session = gr.State(None, delete_callback=close_stream)
+                else:
+                    stream_session = gr.State(None)
+            
             with gr.TabItem("📁 上传音频文件"):
-                gr.Markdown("### 上传音频文件进行识别")
+                gr.Markdown("### 上传音频文件进行识别（后台任务，短音频优先处理，关闭页面后可用任务 ID 查询结果）")
                 with gr.Row():
                     with gr.Column():
                         audio_input = gr.Audio(
@@ -187,55 +637,116 @@ def create_interface():
                             sources=["upload"]
                         )
                         transcribe_btn = gr.Button("开始识别", variant="primary")
+                        job_status = gr.Textbox(label="任务状态", interactive=False)
                     with gr.Column():
                         output_text = gr.Textbox(
                             label="识别结果",
                             lines=10,
                             interactive=False
                         )
+                with gr.Accordion("查询后台任务 / 导出字幕", open=False):
+                    with gr.Row():
+                        job_id_input = gr.Textbox(label="任务 ID")
+                        query_btn = gr.Button("查询")
+                    with gr.Row():
+                        subtitle_format = gr.Radio(choices=list(FORMATS), value="srt", label="字幕格式")
+                        export_btn = gr.Button("导出字幕")
+                    subtitle_file = gr.File(label="字幕文件", interactive=False)
+        
+        with gr.Accordion("推理调度统计", open=False):
+            stats_output = gr.Textbox(label="批量合并与缓存情况", lines=4, interactive=False)
+            stats_btn = gr.Button("刷新统计")
         
         # 绑定事件
         load_btn.click(
-            fn=load_model,
-            inputs=[model_dir_input, model_selector],
+            fn=switch_model,
+            inputs=[model_dir_input, model_selector, backend_selector],
             outputs=model_status
         )
         
         transcribe_btn.click(
-            fn=transcribe,
-            inputs=[audio_input, model_dir_input],
-            outputs=output_text
+            fn=transcribe_job,
+            inputs=[audio_input, pipeline_selector],
+            outputs=[output_text, job_status, job_id_input]
+        )
+        
+        export_btn.click(
+            fn=export_subtitles,
+            inputs=[job_id_input, subtitle_format],
+            outputs=[subtitle_file, job_status]
+        )
+        
+        query_btn.click(
+            fn=query_job,
+            inputs=job_id_input,
+            outputs=[job_status, output_text]
+        )
+        
+        # 流式识别
+        stream_audio.stream(
+            fn=transcribe_stream,
+            inputs=[stream_audio, stream_session],
+            outputs=[stream_output, stream_session]
+        )
+        
+        stream_audio.stop_recording(
+            fn=finish_stream,
+            inputs=stream_session,
+            outputs=[stream_output, stream_latency, stream_session]
+        )
+        
+        stats_btn.click(
+            fn=batch_stats,
+            inputs=None,
+            outputs=stats_output
         )
         
         # 实时录音识别
         realtime_transcribe_btn.click(
             fn=transcribe_realtime,
-            inputs=[realtime_audio, auto_submit],
+            inputs=[realtime_audio, auto_submit, playback_enabled, pipeline_selector],
             outputs=[realtime_output, realtime_audio_playback]
         )
         
         # 如果启用自动识别，录音结束后自动触发
         realtime_audio.change(
             fn=transcribe_realtime,
-            inputs=[realtime_audio, auto_submit],
+            inputs=[realtime_audio, auto_submit, playback_enabled, pipeline_selector],
             outputs=[realtime_output, realtime_audio_playback]
         )
         
-        # 注释掉自动加载模型，避免启动时卡住
-        # 用户可以在界面上手动点击"加载模型"按钮
-        # demo.load(
-        #     fn=load_model,
-        #     inputs=[model_dir_input, model_selector],
-        #     outputs=model_status
-        # )
+        # 模型在后台预加载，状态栏定期刷新加载进度
+        try:
+            demo.load(fn=service_status, inputs=None, outputs=model_status, every=2)
+        except TypeError:
+            # 不支持定时刷新的 Gradio 版本只在打开页面时显示一次
+            demo.load(fn=service_status, inputs=None, outputs=model_status)
     
     return demo
 
 
-def main():
-    """主函数"""
+def configure_queue(demo):
+    """允许多个识别请求同时进入，由调度器合并成批"""
+    concurrency = int(os.environ.get("SENSEVOICE_CONCURRENCY", "16"))
+    try:
+        demo.queue(default_concurrency_limit=concurrency)
+    except TypeError:
+        # Gradio 3.x
+        demo.queue(concurrency_count=concurrency)
+    return demo
+
+
+def main(preload_dir=DEFAULT_MODEL_DIR):
+    """
+    主函数
+
+    Args:
+        preload_dir: 启动时后台预加载的本地模型目录，为 None 或设置 SENSEVOICE_PRELOAD=0 时不预加载
+    """
     import sys
     
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    
     print("=" * 50)
     print("启动 SenseVoice Web UI...")
     print("=" * 50)
@@ -245,11 +756,25 @@ def main():
     # 禁用 Gradio 的某些网络功能
     os.environ["GRADIO_ANALYTICS_ENABLED"] = "False"
     
+    # 线程数和核心绑定需在导入 torch 之前设置
+    cpu = configure_from_env()
+    print(f"CPU 核心: {cpu['cpus']}  intra-op 线程: {cpu['intra_threads']}  "
+          f"inter-op 线程: {cpu['inter_threads']}  绑定核心: {'是' if cpu['pinned'] else '否'}")
+    
+    # torch / funasr 在后台导入、模型在后台加载，界面先启动
+    start_background_imports()
+    if preload_enabled():
+        start_preload(preload_dir)
+    # 恢复上次未完成的后台任务
+    get_jobs()
+    
     try:
         print("正在创建界面...")
         demo = create_interface()
         print("界面创建完成")
         
+        configure_queue(demo)
+        
         print("正在启动服务器...")
         print("访问地址: http://127.0.0.1:7860")
         print("=" * 50)